@@ -0,0 +1,23 @@
+-- =====================================================
+-- AI CACHE FINGERPRINT (prompt template hash + model)
+-- =====================================================
+-- Records which prompt template and model produced each cached row, so the
+-- cache builders can regenerate only outdated rows (--stale-only) after a
+-- prompt change instead of --force on everything.
+-- Rows without a fingerprint (created before this migration or by api/ai.js)
+-- are treated as stale.
+-- Run this in your Supabase SQL Editor
+
+-- Step 1: AWS cache
+ALTER TABLE ai_cache ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+ALTER TABLE ai_cache ADD COLUMN IF NOT EXISTS model TEXT;
+
+-- Step 2: PMP cache
+ALTER TABLE pmp_ai_cache ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+ALTER TABLE pmp_ai_cache ADD COLUMN IF NOT EXISTS model TEXT;
+
+-- Step 3: Verify (rows per fingerprint)
+SELECT language, type, prompt_hash, model, COUNT(*) AS count
+FROM ai_cache
+GROUP BY language, type, prompt_hash, model
+ORDER BY language, type;
@@ -0,0 +1,22 @@
+-- =====================================================
+-- QUESTION CONTENT HASH (diff imports)
+-- =====================================================
+-- Stores a hash of each question's content (question, options, correct_answer,
+-- discussion_link, is_multiselect), written by migrate.py and
+-- import_pmp_questions.py. With --diff the importers only upsert new or edited
+-- questions and mark the ai_cache / pmp_ai_cache rows of edited questions stale
+-- (prompt_hash = NULL) and write their ids to changed_ids_<table>.txt, so
+-- `cache_ai.py --ids changed_ids_<table>.txt --stale-only` regenerates exactly them.
+-- Rows imported before this migration have no hash; the next import fills it in.
+-- Run this in your Supabase SQL Editor
+
+-- Step 1: AWS questions
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Step 2: PMP questions
+ALTER TABLE pmp_questions ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Step 3: Verify (rows still without a hash)
+SELECT 'questions' AS table_name, COUNT(*) FILTER (WHERE content_hash IS NULL) AS unhashed, COUNT(*) AS total FROM questions
+UNION ALL
+SELECT 'pmp_questions', COUNT(*) FILTER (WHERE content_hash IS NULL), COUNT(*) FROM pmp_questions;
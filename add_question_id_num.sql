@@ -0,0 +1,26 @@
+-- =====================================================
+-- NUMERIC QUESTION ID (for range queries from cache builders)
+-- =====================================================
+-- questions.id / pmp_questions.id are TEXT ("1", "361", ...), so a range like
+-- 1-10 cannot be filtered or ordered numerically on the server.
+-- This adds a generated integer column used by the cache builders for
+-- server-side range filtering and keyset pagination (ORDER BY id_num, id).
+-- Run this in your Supabase SQL Editor
+
+-- Step 1: AWS questions
+ALTER TABLE questions
+ADD COLUMN IF NOT EXISTS id_num INTEGER
+GENERATED ALWAYS AS (NULLIF(regexp_replace(id, '\D', '', 'g'), '')::INTEGER) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_questions_id_num ON questions(id_num, id);
+
+-- Step 2: PMP questions
+ALTER TABLE pmp_questions
+ADD COLUMN IF NOT EXISTS id_num INTEGER
+GENERATED ALWAYS AS (NULLIF(regexp_replace(id, '\D', '', 'g'), '')::INTEGER) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_pmp_questions_id_num ON pmp_questions(id_num, id);
+
+-- Step 3: Verify
+SELECT id, id_num FROM questions ORDER BY id_num LIMIT 5;
+SELECT id, id_num FROM pmp_questions ORDER BY id_num LIMIT 5;
@@ -0,0 +1,37 @@
+-- =====================================================
+-- QUESTION POPULARITY (for --order popularity in the cache builders)
+-- =====================================================
+-- Aggregates user_submissions / pmp_user_submissions per question so the
+-- cache builders can generate the most-attempted (and most-missed) questions
+-- first: cache_ai.py ranks by attempts * (1 + incorrect_rate). The views run with the owner's rights, so they can count every
+-- submission despite RLS, but only expose per-question totals (no user_id,
+-- no answers).
+-- Run this in your Supabase SQL Editor
+
+-- Step 1: AWS questions
+CREATE OR REPLACE VIEW question_popularity AS
+SELECT
+    question_id,
+    COUNT(*) AS attempts,
+    COUNT(*) FILTER (WHERE NOT is_correct) AS incorrect,
+    ROUND(COUNT(*) FILTER (WHERE NOT is_correct)::NUMERIC / COUNT(*), 4) AS incorrect_rate
+FROM user_submissions
+GROUP BY question_id;
+
+GRANT SELECT ON question_popularity TO anon, authenticated;
+
+-- Step 2: PMP questions
+CREATE OR REPLACE VIEW pmp_question_popularity AS
+SELECT
+    question_id,
+    COUNT(*) AS attempts,
+    COUNT(*) FILTER (WHERE NOT is_correct) AS incorrect,
+    ROUND(COUNT(*) FILTER (WHERE NOT is_correct)::NUMERIC / COUNT(*), 4) AS incorrect_rate
+FROM pmp_user_submissions
+GROUP BY question_id;
+
+GRANT SELECT ON pmp_question_popularity TO anon, authenticated;
+
+-- Step 3: Verify (top 10)
+SELECT * FROM question_popularity ORDER BY attempts DESC LIMIT 10;
+SELECT * FROM pmp_question_popularity ORDER BY attempts DESC LIMIT 10;
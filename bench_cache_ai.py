@@ -0,0 +1,764 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline cho cache builder (cache_ai.py)
+-------------------------------------------------
+Dựng một server giả lập local đóng vai:
+    - Gemini      POST /v1beta/models/<model>:generateContent | :streamGenerateContent
+    - OpenAI      POST /openai/v1/chat/completions (thường + SSE stream)
+    - OpenAI Batch POST /openai/v1/files, GET /openai/v1/files/<id>/content,
+                  POST /openai/v1/batches, GET /openai/v1/batches/<id> (dùng bởi bench_openai_batch.py)
+    - HF          POST /hf/v1/chat/completions (thường + SSE stream)
+    - PostgREST   GET /rest/v1/questions (keyset id_num), GET /rest/v1/question_popularity,
+                  GET + POST (upsert) /rest/v1/ai_cache
+rồi chạy run_tasks() của cache_ai.py thật (worker pool, rate limiter, hedge, stream guard,
+dedup, AsyncCacheWriter) với từng cấu hình builder và in:
+    tasks/giây, p50 / p99 latency mỗi task, số LLM calls, wasted calls
+    (calls không thành row trong cache: 429, 5xx, retry nội bộ của SDK, hedge thua, stream bị dừng).
+
+Server giả lập cấu hình được:
+    - latency mỗi provider (median, lognormal --jitter) + đuôi chậm (--slow-rate × --slow-factor)
+    - tỉ lệ 429 (--rate-429), lỗi 5xx (--fail-rate), output sai format (--malformed-rate),
+      output thiếu section / có ký tự CJK (--section-error-rate)
+    - latency / lỗi 503 của PostgREST (--db-ms, --db-fail-rate)
+
+Không gọi API thật, không cần API key / Supabase. SDK nào chưa cài thì cấu hình dùng nó bị bỏ qua.
+
+Cấu hình builder (--config, lặp lại được): "<provider>:<concurrency>[+<provider>:<concurrency>...][,option...]"
+    options: hedge, stream, nodedup, popularity, validate
+    VD: gemini:4   gemini:4+openai:4,hedge   openai:8,stream   gemini:4,nodedup
+
+Cách sử dụng:
+    python bench_cache_ai.py                                 # Các cấu hình mặc định, 100 câu × 1 lang × 2 types
+    python bench_cache_ai.py --questions 300 --rate-429 0.1
+    python bench_cache_ai.py --config gemini:8 --config gemini:8,hedge --slow-rate 0.05
+    python bench_cache_ai.py --gemini-ms 1500 --jitter 0.8 --json bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import email.parser
+import email.policy
+import io
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from content_validator import ContentValidator, validate_markdown
+from exam_profiles import EXAM_PROFILES
+
+FAKE_KEY_PREFIX = 'bench-key-'
+FAKE_MODEL = 'bench-model'
+
+DEFAULT_CONFIGS = [
+    'gemini:4',
+    'gemini:4,stream',
+    'gemini:4,nodedup',
+    'gemini:4,validate',
+    'gemini:4+openai:4',
+    'gemini:4+openai:4,hedge',
+    'openai:8',
+    'huggingface:2',
+]
+CONFIG_OPTIONS = ('hedge', 'stream', 'nodedup', 'popularity', 'validate')
+
+GOOD_CONTENT = (
+    "## Giải thích câu hỏi\n\n### Phân tích\nĐáp án đúng dùng dịch vụ được quản lý, giảm vận hành.\n\n"
+    "### Vì sao các đáp án khác sai\n- A: tốn chi phí.\n- B: không đáp ứng yêu cầu.\n\n"
+    "### Kết luận\nChọn đáp án phù hợp với yêu cầu về tính sẵn sàng và chi phí.\n"
+)
+MALFORMED_CONTENT = (
+    "Chào bạn! Là một chuyên gia AWS, tôi sẽ giải thích câu hỏi này một cách chi tiết.\n\n" + GOOD_CONTENT
+)
+STREAM_CHUNKS = 8
+BATCH_STEPS = 3  # Số bước tiến độ in_progress của một batch giả lập
+BATCH_POLLS_PER_STEP = 2  # Số lần poll giữa hai lần batch giả lập đổi trạng thái / tiến độ
+
+QUOTED_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"')
+PROMPT_HEADING_PATTERN = re.compile(r'^## (.+)$', re.MULTILINE)
+
+
+def mock_content(prompt: str, outcome: str) -> str:
+    """Output theo đúng các heading ## trong prompt; 'malformed' thêm lời chào, 'broken' thiếu
+    section cuối và có ký tự CJK"""
+    headings = list(dict.fromkeys(PROMPT_HEADING_PATTERN.findall(prompt)))
+    if not headings:
+        content = GOOD_CONTENT
+    else:
+        if outcome == 'broken' and len(headings) > 1:
+            headings = headings[:-1]
+        content = '\n'.join(
+            f"## {heading}\n\nNội dung giả lập cho phần {heading}, nêu **thuật ngữ chính** và lý do chi tiết.\n"
+            for heading in headings
+        )
+        if outcome == 'broken':
+            content += '\n部分内容\n'
+    if outcome == 'malformed':
+        content = MALFORMED_CONTENT.split('\n\n', 1)[0] + '\n\n' + content
+    return content
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class MockBehavior:
+    """Latency / lỗi của server giả lập (chung cho mọi endpoint LLM, latency median riêng từng provider)"""
+
+    def __init__(self, args):
+        self.latency_ms = {'gemini': args.gemini_ms, 'openai': args.openai_ms, 'huggingface': args.hf_ms}
+        self.jitter = args.jitter
+        self.slow_rate = args.slow_rate
+        self.slow_factor = args.slow_factor
+        self.rate_429 = args.rate_429
+        self.fail_rate = args.fail_rate
+        self.malformed_rate = args.malformed_rate
+        self.section_error_rate = args.section_error_rate
+        self.db_ms = args.db_ms
+        self.db_fail_rate = args.db_fail_rate
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+
+    def llm_delay(self, provider: str) -> float:
+        with self.lock:
+            delay = self.latency_ms[provider] / 1000 * self.random.lognormvariate(0, self.jitter)
+            if self.random.random() < self.slow_rate:
+                delay *= self.slow_factor
+            return delay
+
+    def llm_outcome(self) -> str:
+        """'429', '5xx', 'malformed', 'broken' hoặc 'ok'"""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.rate_429:
+            return '429'
+        roll -= self.rate_429
+        if roll < self.fail_rate:
+            return '5xx'
+        roll -= self.fail_rate
+        if roll < self.malformed_rate:
+            return 'malformed'
+        roll -= self.malformed_rate
+        if roll < self.section_error_rate:
+            return 'broken'
+        return 'ok'
+
+    def db_failed(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.db_fail_rate
+
+
+class MockState:
+    """Dữ liệu PostgREST + bộ đếm request, reset trước mỗi cấu hình"""
+
+    def __init__(self, questions: list, popularity: list):
+        self.questions = questions
+        self.popularity = popularity
+        self.lock = threading.Lock()
+        self.files = {}  # file_id -> nội dung (input / output / error file của Batch API)
+        self.batches = {}  # batch_id -> trạng thái batch giả lập
+        self.reset({})
+
+    def reset(self, cache: dict):
+        with self.lock:
+            self.cache = dict(cache)  # (question_id, language, type) -> row
+            self.written = set()  # Key được upsert trong cấu hình đang chạy
+            self.counts = {}  # (endpoint, outcome) -> count
+
+    def count(self, endpoint: str, outcome: str):
+        with self.lock:
+            self.counts[(endpoint, outcome)] = self.counts.get((endpoint, outcome), 0) + 1
+
+    def total(self, endpoints: tuple, outcomes: tuple = ()) -> int:
+        with self.lock:
+            return sum(count for (endpoint, outcome), count in self.counts.items()
+                       if endpoint in endpoints and (not outcomes or outcome in outcomes))
+
+
+def in_values(value: str) -> list:
+    """'in.("a","b")' -> ['a', 'b']"""
+    return [v.replace('\\"', '"') for v in QUOTED_PATTERN.findall(value)]
+
+
+def filter_values(params: dict, column: str):
+    """Giá trị của filter `column=in.(...)` / `column=eq.x` (None nếu không lọc)"""
+    if column not in params:
+        return None
+    value = params[column]
+    if value.startswith('eq.'):
+        return [value[3:]]
+    return in_values(value)
+
+
+def multipart_file(content_type: str, body: bytes) -> tuple:
+    """(filename, nội dung) của field `file` trong body multipart/form-data"""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"content-type: {content_type}\r\n\r\n".encode() + body)
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'file':
+            return part.get_filename(), part.get_payload(decode=True)
+    raise ValueError('multipart không có field file')
+
+
+def batch_object(batch: dict) -> dict:
+    """Batch object của OpenAI theo số lần đã poll: validating -> in_progress (BATCH_STEPS bước)
+    -> finalizing -> completed, mỗi trạng thái giữ nguyên BATCH_POLLS_PER_STEP lần poll"""
+    stage = batch['polls'] // BATCH_POLLS_PER_STEP
+    total = len(batch['results'])
+    if stage == 0:
+        status, done = 'validating', 0
+    elif stage <= BATCH_STEPS + 1:
+        status, done = 'in_progress', math.ceil(total * (stage - 1) / BATCH_STEPS)
+    elif stage == BATCH_STEPS + 2:
+        status, done = 'finalizing', total
+    else:
+        status, done = 'completed', total
+    failed = sum(1 for ok, _ in batch['results'][:done] if not ok)
+    return {
+        'id': batch['id'], 'object': 'batch', 'endpoint': batch['endpoint'], 'errors': None,
+        'input_file_id': batch['input_file_id'], 'completion_window': batch['completion_window'],
+        'status': status, 'created_at': batch['created_at'], 'metadata': batch['metadata'],
+        'output_file_id': batch['output_file_id'] if status == 'completed' else None,
+        'error_file_id': batch['error_file_id'] if status == 'completed' else None,
+        'request_counts': {'total': total if stage else 0, 'completed': done - failed, 'failed': failed}
+    }
+
+
+def start_mock_server(behavior: MockBehavior, state: MockState) -> str:
+    """Server HTTP/1.1 keep-alive giả lập các endpoint LLM + PostgREST"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, obj, code: int = 200, headers: dict = None):
+            body = json.dumps(obj, ensure_ascii=False).encode()
+            self.send_response(code)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _empty(self, code: int):
+            self.send_response(code)
+            self.send_header('content-length', '0')
+            self.end_headers()
+
+        def _sse(self, events: list, delay: float):
+            """Gửi SSE theo chunked encoding: headers sau ~20% delay (server nhận / xếp hàng request, SDK OpenAI / HF
+            chỉ trả stream lúc này), chunk đầu sau ~30% delay, phần còn lại rải đều"""
+            time.sleep(delay * 0.2)
+            self.send_response(200)
+            self.send_header('content-type', 'text/event-stream')
+            self.send_header('transfer-encoding', 'chunked')
+            self.end_headers()
+            time.sleep(delay * 0.1)
+            gap = delay * 0.7 / max(1, len(events))
+            try:
+                for index, event in enumerate(events):
+                    if index:
+                        time.sleep(gap)
+                    data = f"data: {event}\n\n".encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # Client dừng stream sớm (stream guard / hedge)
+
+        # ---------- LLM ----------
+
+        def _llm(self, provider: str, stream: bool, prompt: str):
+            outcome = behavior.llm_outcome()
+            delay = behavior.llm_delay(provider)
+            state.count(provider, outcome)
+            if outcome == '429':
+                time.sleep(min(delay, 0.05))
+                if provider == 'gemini':
+                    return self._json({'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                                 'message': 'Resource has been exhausted (e.g. check quota).'}}, 429)
+                return self._json({'error': {'message': 'Rate limit reached for requests', 'type': 'requests',
+                                             'code': 'rate_limit_exceeded'}}, 429, {'retry-after-ms': '200'})
+            if outcome == '5xx':
+                time.sleep(delay / 2)
+                if provider == 'gemini':
+                    return self._json({'error': {'code': 500, 'status': 'INTERNAL',
+                                                 'message': 'An internal error has occurred.'}}, 500)
+                return self._json({'error': {'message': 'Internal server error', 'type': 'server_error'}}, 500)
+
+            content = mock_content(prompt, outcome)
+            if stream:
+                size = math.ceil(len(content) / STREAM_CHUNKS)
+                pieces = [content[i:i + size] for i in range(0, len(content), size)]
+                if provider == 'gemini':
+                    events = [json.dumps({'candidates': [{'content': {'role': 'model', 'parts': [{'text': p}]}}]})
+                              for p in pieces]
+                else:
+                    events = [json.dumps({
+                        'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': FAKE_MODEL,
+                        'choices': [{'index': 0, 'delta': {'content': p}, 'finish_reason': None}]
+                    }) for p in pieces] + ['[DONE]']
+                return self._sse(events, delay)
+
+            time.sleep(delay)
+            prompt_tokens, completion_tokens = 400, len(content) // 4
+            if provider == 'gemini':
+                return self._json({
+                    'candidates': [{'content': {'role': 'model', 'parts': [{'text': content}]}, 'finishReason': 'STOP'}],
+                    'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': completion_tokens,
+                                      'totalTokenCount': prompt_tokens + completion_tokens}
+                })
+            return self._json({
+                'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': 0, 'model': FAKE_MODEL,
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}
+            })
+
+        # ---------- OpenAI Batch API ----------
+
+        def _file_object(self, file_id: str, filename: str, purpose: str) -> dict:
+            return {'id': file_id, 'object': 'file', 'bytes': len(state.files[file_id]), 'created_at': int(time.time()),
+                    'filename': filename, 'purpose': purpose, 'status': 'processed'}
+
+        def _add_file(self, content: bytes) -> str:
+            with state.lock:
+                file_id = f"file-bench-{len(state.files) + 1}"
+                state.files[file_id] = content
+            return file_id
+
+        def _batch_result(self, index: int, line: dict) -> tuple:
+            """(ok, dòng output / error file) cho một request của batch, lỗi theo MockBehavior như gọi online"""
+            outcome = behavior.llm_outcome()
+            state.count('openai-batch', outcome)
+            item = {'id': f"batch_req_{index}", 'custom_id': line['custom_id'], 'error': None}
+            if outcome in ('429', '5xx'):
+                code = 429 if outcome == '429' else 500
+                message = 'Rate limit reached for requests' if code == 429 else 'Internal server error'
+                item['response'] = {'status_code': code, 'body': {'error': {'message': message}}}
+                return False, item
+            content = mock_content(str(line['body']['messages'][-1]['content']), outcome)
+            item['response'] = {'status_code': 200, 'body': {
+                'id': f"chatcmpl-batch-{index}", 'object': 'chat.completion', 'created': 0, 'model': FAKE_MODEL,
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}]
+            }}
+            return True, item
+
+        def _create_batch(self, request: dict):
+            lines = [json.loads(line) for line in state.files[request['input_file_id']].decode().splitlines()
+                     if line.strip()]
+            results = [self._batch_result(index, line) for index, line in enumerate(lines)]
+            output = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for ok, item in results if ok)
+            errors = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for ok, item in results if not ok)
+            with state.lock:
+                batch_id = f"batch_bench_{len(state.batches) + 1}"
+                batch = state.batches[batch_id] = {
+                    'id': batch_id, 'endpoint': request['endpoint'], 'input_file_id': request['input_file_id'],
+                    'completion_window': request['completion_window'], 'metadata': request.get('metadata'),
+                    'created_at': int(time.time()), 'results': results, 'polls': 0,
+                    'output_file_id': None, 'error_file_id': None
+                }
+            batch['output_file_id'] = self._add_file(output.encode()) if output else None
+            batch['error_file_id'] = self._add_file(errors.encode()) if errors else None
+            return self._json(batch_object(batch))
+
+        def _batch_api(self, method: str, path: str, body: bytes):
+            state.count('openai-batch', f"{method} {path.split('/')[0]}")
+            if method == 'POST' and path == 'files':
+                filename, content = multipart_file(self.headers['content-type'], body)
+                file_id = self._add_file(content)
+                return self._json(self._file_object(file_id, filename, 'batch'))
+            if method == 'GET' and path.startswith('files/') and path.endswith('/content'):
+                content = state.files.get(path.split('/')[1])
+                if content is None:
+                    return self._json({'error': {'message': 'No such File object'}}, 404)
+                self.send_response(200)
+                self.send_header('content-type', 'application/octet-stream')
+                self.send_header('content-length', str(len(content)))
+                self.end_headers()
+                return self.wfile.write(content)
+            if method == 'POST' and path == 'batches':
+                return self._create_batch(json.loads(body or b'{}'))
+            if method == 'GET' and path.startswith('batches/'):
+                with state.lock:
+                    batch = state.batches.get(path.split('/')[1])
+                    if batch is not None:
+                        batch['polls'] += 1
+                if batch is None:
+                    return self._json({'error': {'message': 'No such Batch object'}}, 404)
+                return self._json(batch_object(batch))
+            return self._json({'error': {'message': f'Unsupported {method} /{path}'}}, 404)
+
+        # ---------- PostgREST ----------
+
+        def _questions(self, params: dict):
+            conditions = params.get('and', '')
+            start = int(re.search(r'id_num\.gte\.(\d+)', conditions).group(1))
+            end = int(re.search(r'id_num\.lte\.(\d+)', conditions).group(1))
+            after = re.search(r'id_num\.gt\.(\d+)', conditions)
+            after = int(after.group(1)) if after else start - 1
+            limit = int(params.get('limit', len(state.questions)))
+            rows = [q for q in state.questions if start <= q['id_num'] <= end and q['id_num'] > after]
+            return self._json(rows[:limit])
+
+        def _cache_get(self, params: dict):
+            ids, languages, types = (filter_values(params, c) for c in ('question_id', 'language', 'type'))
+            columns = params.get('select', 'question_id,language,type').split(',')
+            with state.lock:
+                rows = [row for key, row in sorted(state.cache.items())
+                        if (ids is None or key[0] in ids) and (languages is None or key[1] in languages)
+                        and (types is None or key[2] in types)]
+            offset = int(params.get('offset', 0))
+            limit = int(params.get('limit', len(rows)))
+            return self._json([{c: row.get(c) for c in columns} for row in rows[offset:offset + limit]])
+
+        def _cache_upsert(self, body: bytes):
+            rows = json.loads(body or b'[]')
+            with state.lock:
+                for row in rows:
+                    key = (str(row['question_id']), row['language'], row['type'])
+                    state.cache[key] = row
+                    state.written.add(key)
+            return self._empty(201)
+
+        def _rest(self, method: str, table: str, params: dict, body: bytes):
+            time.sleep(behavior.db_ms / 1000)
+            if behavior.db_failed():
+                state.count('postgrest', '5xx')
+                return self._json({'message': 'Service Unavailable'}, 503)
+            state.count('postgrest', 'ok')
+            if method == 'GET' and table in ('questions', 'pmp_questions'):
+                return self._questions(params)
+            if method == 'GET' and table.endswith('question_popularity'):
+                offset, limit = int(params.get('offset', 0)), int(params.get('limit', 1000))
+                return self._json(state.popularity[offset:offset + limit])
+            if table.endswith('ai_cache'):
+                return self._cache_get(params) if method == 'GET' else self._cache_upsert(body)
+            return self._json({'code': '42P01', 'message': f'relation "{table}" does not exist'}, 404)
+
+        def _route(self, method: str):
+            body = self.rfile.read(int(self.headers.get('content-length') or 0))
+            url = urlparse(self.path)
+            if url.path.startswith('/rest/v1/'):
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                return self._rest(method, url.path[len('/rest/v1/'):], params, body)
+            if url.path.startswith(('/openai/v1/files', '/openai/v1/batches')):
+                return self._batch_api(method, url.path[len('/openai/v1/'):], body)
+            if 'generateContent' in url.path or 'GenerateContent' in url.path:
+                request = json.loads(body or b'{}')
+                prompt = '\n'.join(part.get('text', '') for item in request.get('contents', [])
+                                    for part in item.get('parts', []))
+                return self._llm('gemini', ':streamGenerateContent' in url.path, prompt)
+            if url.path.endswith('/chat/completions'):
+                provider = 'huggingface' if url.path.startswith('/hf') else 'openai'
+                request = json.loads(body or b'{}')
+                prompt = str((request.get('messages') or [{}])[-1].get('content', ''))
+                return self._llm(provider, bool(request.get('stream')), prompt)
+            return self._json({'error': 'not found'}, 404)
+
+        def _handle(self, method: str):
+            try:
+                self._route(method)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # Client đã hủy request (hedge thua / timeout)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def popularity_row(question_id: str, rng: random.Random) -> dict:
+    """Một row của view question_popularity (chỉ câu đã có lượt làm mới có row)"""
+    attempts = rng.randint(1, 50)
+    incorrect = rng.randint(0, attempts)
+    return {'question_id': question_id, 'attempts': attempts, 'incorrect': incorrect,
+            'incorrect_rate': round(incorrect / attempts, 4)}
+
+
+def make_questions(count: int, duplicate_rate: float, rng: random.Random) -> list:
+    """Câu hỏi giả lập q1..qN; một phần là bản sao nội dung của câu trước đó (để đo dedup)"""
+    questions = []
+    for number in range(1, count + 1):
+        if questions and rng.random() < duplicate_rate:
+            source = rng.choice(questions)
+            text, options, answer = source['question'], source['options'], source['correct_answer']
+        else:
+            text = f"Câu hỏi giả lập số {number}: công ty cần kiến trúc nào để đáp ứng yêu cầu {number}?"
+            options = [f"Phương án {letter} cho yêu cầu {number}" for letter in 'ABCD']
+            answer = rng.choice('ABCD')
+        questions.append({'id': f"q{number}", 'id_num': number, 'question': text,
+                          'options': options, 'correct_answer': answer})
+    return questions
+
+
+def parse_config(spec: str) -> dict:
+    """'gemini:4+openai:4,hedge' -> {'providers': [('gemini', 4), ('openai', 4)], 'hedge': True, ...}"""
+    parts = spec.split(',')
+    providers = []
+    for item in parts[0].split('+'):
+        name, _, concurrency = item.partition(':')
+        if name not in ('gemini', 'openai', 'huggingface'):
+            raise ValueError(f"provider không hỗ trợ: {name}")
+        providers.append((name, int(concurrency or 1)))
+    options = set(parts[1:])
+    unknown = options - set(CONFIG_OPTIONS)
+    if unknown:
+        raise ValueError(f"option không hỗ trợ: {', '.join(sorted(unknown))}")
+    return {'name': spec, 'providers': providers, **{option: option in options for option in CONFIG_OPTIONS}}
+
+
+def build_providers(config: dict, base_url: str, args, ledger_path: str) -> list:
+    """Provider thật của llm_providers.py, client trỏ vào server giả lập"""
+    from llm_providers import (ClientPool, GeminiProvider, HuggingFaceProvider, InferenceClient, OpenAI,
+                               OpenAIProvider, genai)
+    from rate_limiter import KeyRateLimiter, QuotaLedger
+
+    providers = []
+    for name, concurrency in config['providers']:
+        if name == 'gemini':
+            if genai is None:
+                raise RuntimeError('chưa cài google-genai')
+            keys = [f"{FAKE_KEY_PREFIX}gemini-{i}" for i in range(concurrency)]
+            limiter = KeyRateLimiter(keys, args.gemini_rpm, 10 ** 9, QuotaLedger(ledger_path))
+            provider = GeminiProvider(keys, FAKE_MODEL, limiter, concurrency)
+            provider.clients = ClientPool(
+                lambda key: genai.Client(api_key=key, http_options={'base_url': base_url})
+            )
+        elif name == 'openai':
+            if OpenAI is None:
+                raise RuntimeError('chưa cài openai')
+            provider = OpenAIProvider(f"{FAKE_KEY_PREFIX}openai", FAKE_MODEL, concurrency)
+            provider.clients = ClientPool(lambda key: OpenAI(api_key=key, base_url=f"{base_url}/openai/v1"))
+        else:
+            if InferenceClient is None:
+                raise RuntimeError('chưa cài huggingface_hub')
+            provider = HuggingFaceProvider(f"{FAKE_KEY_PREFIX}hf", FAKE_MODEL, concurrency)
+            provider.clients = ClientPool(lambda key: InferenceClient(api_key=key, base_url=f"{base_url}/hf"))
+        provider.streaming = config['stream']
+        providers.append(provider)
+    return providers
+
+
+async def run_config(cache_ai, config: dict, providers: list, args) -> dict:
+    """Chạy run_tasks() với một cấu hình, đo latency từng task (process_task)"""
+    from hedging import HedgePolicy
+    from supabase_rest import AsyncSupabaseREST
+
+    latencies = []
+    process_task = cache_ai.process_task
+
+    async def timed_process_task(*task_args, **task_kwargs):
+        begin = time.perf_counter()
+        try:
+            return await process_task(*task_args, **task_kwargs)
+        finally:
+            latencies.append(time.perf_counter() - begin)
+
+    cache_ai.supabase = AsyncSupabaseREST(cache_ai.SUPABASE_URL, cache_ai.SUPABASE_KEY)
+    cache_ai.process_task = timed_process_task
+    hedge = HedgePolicy(fixed_delay=args.hedge_delay) if config['hedge'] else None
+    validator = ContentValidator() if config['validate'] else None
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    begin = time.perf_counter()
+    try:
+        with quiet:
+            stats = await cache_ai.run_tasks(
+                cache_ai.EXAM_PROFILES['saa'], providers, 1, args.questions, args.languages, args.types,
+                hedge=hedge, order='popularity' if config['popularity'] else 'id', dedup=not config['nodedup'],
+                validator=validator
+            )
+    finally:
+        elapsed = time.perf_counter() - begin
+        cache_ai.process_task = process_task
+        await cache_ai.supabase.aclose()
+        for provider in providers:
+            await provider.clients.aclose()
+    return {'stats': stats or {}, 'elapsed': elapsed, 'latencies': latencies,
+            'hedge': hedge.summary() if hedge else None,
+            'validate': validator.summary() if validator else None,
+            'repair_calls': validator.repair_calls if validator else 0,
+            'aborted': sum(p.stream_stats.aborted for p in providers)}
+
+
+def summarize(config: dict, run: dict, state: MockState, total_tasks: int, prefilled: int) -> dict:
+    stats = run['stats']
+    llm_endpoints = tuple(name for name, _ in config['providers'])
+    llm_calls = state.total(llm_endpoints)
+    generated = sum(stats.get('by_provider', {}).values())
+    profile = EXAM_PROFILES['saa']
+    with state.lock:
+        written = [state.cache[key] for key in state.written]
+    bad_rows = 0
+    for row in written:
+        report = validate_markdown(row['content'], profile.expected_sections(row['type'], row['language']),
+                                   profile.allow_bold_colon)
+        bad_rows += not report.valid or bool(report.fixes)
+    processed = len(run['latencies'])
+    return {
+        'config': config['name'],
+        'tasks': total_tasks,
+        'prefilled': prefilled,
+        'processed': processed,
+        'success': stats.get('success', 0),
+        'deduped': stats.get('deduped', 0),
+        'failed': stats.get('failed', 0),
+        'elapsed': round(run['elapsed'], 3),
+        'tasks_per_second': round(processed / run['elapsed'], 2) if run['elapsed'] else 0.0,
+        'p50_ms': round(percentile(run['latencies'], 0.5) * 1000, 1),
+        'p99_ms': round(percentile(run['latencies'], 0.99) * 1000, 1),
+        'llm_calls': llm_calls,
+        'repair_calls': run['repair_calls'],
+        'wasted_calls': max(0, llm_calls - generated - run['repair_calls']),
+        'calls_429': state.total(llm_endpoints, ('429',)),
+        'calls_5xx': state.total(llm_endpoints, ('5xx',)),
+        'malformed_served': state.total(llm_endpoints, ('malformed',)),
+        'bad_saved': bad_rows,
+        'stream_aborted': run['aborted'],
+        'db_requests': state.total(('postgrest',)),
+        'db_errors': state.total(('postgrest',), ('5xx',)),
+        'broken_served': state.total(llm_endpoints, ('broken',)),
+        'hedge': run['hedge'],
+        'validate': run['validate']
+    }
+
+
+def print_report(results: list):
+    header = (f"{'config':<28}{'tasks/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'ok':>6}{'dedup':>6}{'fail':>6}"
+              f"{'LLM':>6}{'waste':>7}{'fix':>5}{'429':>5}{'5xx':>5}{'bad':>5}")
+    print('\n' + header)
+    print('─' * len(header))
+    for r in results:
+        print(f"{r['config']:<28}{r['tasks_per_second']:>9.2f}{r['p50_ms']:>9.0f}{r['p99_ms']:>9.0f}"
+              f"{r['success']:>6}{r['deduped']:>6}{r['failed']:>6}{r['llm_calls']:>6}{r['wasted_calls']:>7}"
+              f"{r['repair_calls']:>5}{r['calls_429']:>5}{r['calls_5xx']:>5}{r['bad_saved']:>5}")
+    print("\nwaste = LLM calls không thành row trong cache (429, 5xx, retry của SDK, hedge thua, stream bị dừng)")
+    print("fix   = LLM calls tạo lại section lỗi (validate)")
+    print("bad   = rows đã lưu không qua được content_validator (lời chào, thiếu section, CJK, ...)")
+    for r in results:
+        if r['hedge']:
+            print(f"⏱️ {r['config']}: {r['hedge']}")
+        if r['validate']:
+            print(f"🩺 {r['config']}: {r['validate']}")
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """Tham số latency / lỗi của server giả lập (MockBehavior), dùng chung với bench_openai_batch.py"""
+    parser.add_argument('--gemini-ms', type=float, default=300, help='Latency median của Gemini (default: 300)')
+    parser.add_argument('--openai-ms', type=float, default=200, help='Latency median của OpenAI (default: 200)')
+    parser.add_argument('--hf-ms', type=float, default=500, help='Latency median của HF (default: 500)')
+    parser.add_argument('--jitter', type=float, default=0.4, help='Sigma lognormal của latency (default: 0.4)')
+    parser.add_argument('--slow-rate', type=float, default=0.02, help='Tỉ lệ request chậm bất thường (default: 0.02)')
+    parser.add_argument('--slow-factor', type=float, default=8, help='Request chậm lâu gấp mấy lần (default: 8)')
+    parser.add_argument('--rate-429', type=float, default=0.05, help='Tỉ lệ trả về 429 (default: 0.05)')
+    parser.add_argument('--fail-rate', type=float, default=0.01, help='Tỉ lệ trả về 5xx (default: 0.01)')
+    parser.add_argument('--malformed-rate', type=float, default=0.02,
+                        help='Tỉ lệ output mở đầu bằng lời chào (default: 0.02)')
+    parser.add_argument('--section-error-rate', type=float, default=0.03,
+                        help='Tỉ lệ output thiếu section cuối + có ký tự CJK (default: 0.03)')
+    parser.add_argument('--db-ms', type=float, default=20, help='Latency của PostgREST (default: 20)')
+    parser.add_argument('--db-fail-rate', type=float, default=0.0, help='Tỉ lệ PostgREST trả về 503 (default: 0)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed cho dữ liệu / lỗi giả lập (default: 42)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline cache builder với server LLM / PostgREST giả lập')
+    parser.add_argument('--config', action='append', dest='configs',
+                        help='Cấu hình builder, lặp lại được (default: ' + ' | '.join(DEFAULT_CONFIGS) + ')')
+    parser.add_argument('--questions', type=int, default=100, help='Số câu hỏi giả lập (default: 100)')
+    parser.add_argument('--languages', default='vi', help='Ngôn ngữ, phân cách bằng dấu phẩy (default: vi)')
+    parser.add_argument('--types', default='theory,explanation', help='Loại nội dung (default: theory,explanation)')
+    parser.add_argument('--cached', type=float, default=0.2, help='Tỉ lệ task đã có sẵn trong ai_cache (default: 0.2)')
+    parser.add_argument('--duplicates', type=float, default=0.05, help='Tỉ lệ câu trùng nội dung (default: 0.05)')
+    add_mock_arguments(parser)
+    parser.add_argument('--gemini-rpm', type=int, default=6000, help='RPM mỗi key Gemini giả lập (default: 6000)')
+    parser.add_argument('--hedge-delay', type=float, default=1.0,
+                        help='Ngưỡng hedge (giây) khi chưa đủ mẫu latency (default: 1.0)')
+    parser.add_argument('--json', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--verbose', action='store_true', help='In log của cache builder')
+    args = parser.parse_args()
+    args.languages = args.languages.split(',')
+    args.types = args.types.split(',')
+
+    try:
+        configs = [parse_config(spec) for spec in (args.configs or DEFAULT_CONFIGS)]
+    except ValueError as e:
+        parser.error(str(e))
+
+    rng = random.Random(args.seed)
+    questions = make_questions(args.questions, args.duplicates, rng)
+    popularity = [popularity_row(q['id'], rng) for q in questions]
+    prefilled_cache = {
+        (q['id'], language, content_type): {'question_id': q['id'], 'language': language, 'type': content_type,
+                                            'content': GOOD_CONTENT}
+        for q in questions for language in args.languages for content_type in args.types
+        if rng.random() < args.cached
+    }
+    state = MockState(questions, popularity)
+    behavior = MockBehavior(args)
+    base_url = start_mock_server(behavior, state)
+
+    # cache_ai đọc SUPABASE_URL / KEY khi import nên phải trỏ vào server giả lập trước
+    with tempfile.TemporaryDirectory(prefix='bench_cache_ai_') as workdir:
+        os.environ.update({
+            'SUPABASE_URL': base_url, 'SUPABASE_KEY': 'bench-anon-key', 'LLM_CACHE': '0',
+            'CACHE_AI_JOURNAL_DIR': os.path.join(workdir, 'runs'),
+            'CACHE_AI_METRICS_DIR': os.path.join(workdir, 'metrics')
+        })
+        import cache_ai
+
+        total_tasks = len(questions) * len(args.languages) * len(args.types)
+        print(f"🧪 Mock server: {base_url}, {len(questions)} câu × {len(args.languages)} ngôn ngữ × "
+              f"{len(args.types)} loại "
+              f"= {total_tasks} tasks ({len(prefilled_cache)} đã có cache)")
+        print(f"   Latency median: gemini {args.gemini_ms:.0f}ms, openai {args.openai_ms:.0f}ms, hf {args.hf_ms:.0f}ms "
+              f"(jitter {args.jitter}, {args.slow_rate:.0%} chậm ×{args.slow_factor:g}); "
+              f"429 {args.rate_429:.0%}, 5xx {args.fail_rate:.0%}, sai format {args.malformed_rate:.0%}, "
+              f"lỗi section {args.section_error_rate:.0%}; "
+              f"PostgREST {args.db_ms:.0f}ms, 503 {args.db_fail_rate:.0%}")
+
+        results = []
+        for config in configs:
+            state.reset(prefilled_cache)
+            try:
+                providers = build_providers(config, base_url, args,
+                                            os.path.join(workdir, f"ledger_{len(results)}.json"))
+            except RuntimeError as e:
+                print(f"⚠️ Bỏ qua {config['name']} ({e})")
+                continue
+            print(f"▶️ {config['name']}...", flush=True)
+            run = asyncio.run(run_config(cache_ai, config, providers, args))
+            results.append(summarize(config, run, state, total_tasks, len(prefilled_cache)))
+
+        if not results:
+            print("❌ Không chạy được cấu hình nào")
+            return
+        print_report(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"\n💾 Đã ghi kết quả vào {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tạo SDK client mỗi lần gọi vs dùng lại client từ ClientPool
+----------------------------------------------------------------------
+Chạy N request tới một server giả lập local (trả về response cố định) cho từng SDK
+(google-genai, openai, huggingface_hub) theo 2 cách:
+    - new:    tạo client mới cho mỗi request (cách cũ của call_gemini / call_openai / call_huggingface)
+    - pooled: dùng client từ ClientPool (llm_providers.py)
+và in thời gian trung bình mỗi request + overhead tiết kiệm được.
+
+Không gọi API thật, không cần API key. SDK nào chưa cài sẽ bị bỏ qua.
+
+Cách sử dụng:
+    python bench_llm_clients.py              # 200 requests mỗi SDK / mỗi cách
+    python bench_llm_clients.py --calls 500
+    python bench_llm_clients.py --latency-ms 20  # Giả lập server chậm 20ms
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_providers import ClientPool, genai, OpenAI, InferenceClient
+
+FAKE_KEY = 'bench-key'
+FAKE_MODEL = 'bench-model'
+
+CHAT_RESPONSE = {
+    'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': 0, 'model': FAKE_MODEL,
+    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'ok'}}],
+    'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+}
+GEMINI_RESPONSE = {
+    'candidates': [{'content': {'role': 'model', 'parts': [{'text': 'ok'}]}, 'finishReason': 'STOP'}]
+}
+
+
+def start_fake_server(latency_ms: float) -> str:
+    """Server HTTP/1.1 keep-alive trả về response chat completion / generateContent cố định"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('content-length') or 0))
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            body = json.dumps(GEMINI_RESPONSE if ':generateContent' in self.path else CHAT_RESPONSE).encode()
+            self.send_response(200)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_sync(label: str, factory, call, calls: int) -> dict:
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        client = factory(FAKE_KEY)
+        call(client)
+        client.close()
+    results['new'] = (time.perf_counter() - start) / calls
+
+    pool = ClientPool(factory)
+    start = time.perf_counter()
+    for _ in range(calls):
+        call(pool.get(FAKE_KEY))
+    results['pooled'] = (time.perf_counter() - start) / calls
+    asyncio.run(pool.aclose())
+
+    report(label, results, pool.created)
+    return results
+
+
+async def bench_gemini(base_url: str, calls: int) -> dict:
+    def factory(api_key: str):
+        return genai.Client(api_key=api_key, http_options={'base_url': base_url})
+
+    async def call(client):
+        await client.aio.models.generate_content(model=FAKE_MODEL, contents='hi')
+
+    results = {}
+    start = time.perf_counter()
+    for _ in range(calls):
+        client = factory(FAKE_KEY)
+        await call(client)
+        await client.aio.aclose()
+        client.close()
+    results['new'] = (time.perf_counter() - start) / calls
+
+    pool = ClientPool(factory)
+    start = time.perf_counter()
+    for _ in range(calls):
+        await call(pool.get(FAKE_KEY))
+    results['pooled'] = (time.perf_counter() - start) / calls
+    await pool.aclose()
+
+    report('google-genai (async)', results, pool.created)
+    return results
+
+
+def report(label: str, results: dict, created: int):
+    saved = results['new'] - results['pooled']
+    ratio = results['new'] / results['pooled'] if results['pooled'] else 0
+    print(f"{label:<24} new: {results['new'] * 1000:7.2f} ms/call   pooled: {results['pooled'] * 1000:7.2f} ms/call"
+          f"   tiết kiệm: {saved * 1000:6.2f} ms/call ({ratio:.1f}x, pool tạo {created} client)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark client-per-call vs ClientPool')
+    parser.add_argument('--calls', type=int, default=200, help='Số request mỗi SDK / mỗi cách (default: 200)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Độ trễ giả lập của server (default: 0)')
+    args = parser.parse_args()
+
+    base_url = start_fake_server(args.latency_ms)
+    print(f"🧪 Fake server: {base_url}, {args.calls} calls mỗi cách, latency {args.latency_ms}ms\n")
+
+    if genai is not None:
+        asyncio.run(bench_gemini(base_url, args.calls))
+    else:
+        print("⚠️ Bỏ qua google-genai (chưa cài)")
+
+    if OpenAI is not None:
+        bench_sync(
+            'openai',
+            lambda key: OpenAI(api_key=key, base_url=f"{base_url}/v1", max_retries=0),
+            lambda client: client.chat.completions.create(
+                model=FAKE_MODEL, messages=[{'role': 'user', 'content': 'hi'}]
+            ),
+            args.calls
+        )
+    else:
+        print("⚠️ Bỏ qua openai (chưa cài)")
+
+    if InferenceClient is not None:
+        bench_sync(
+            'huggingface_hub',
+            lambda key: InferenceClient(api_key=key, base_url=base_url),
+            lambda client: client.chat_completion(
+                model=FAKE_MODEL, messages=[{'role': 'user', 'content': 'hi'}], max_tokens=5
+            ),
+            args.calls
+        )
+    else:
+        print("⚠️ Bỏ qua huggingface_hub (chưa cài)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra offline chế độ --batch của cache_ai.py (OpenAI Batch API)
+------------------------------------------------------------------
+Chạy run_batch() thật với provider openai trỏ vào server giả lập của bench_cache_ai.py
+(/openai/v1/files, /openai/v1/batches + PostgREST), không gọi API thật:
+
+    1. Submit: prompt được chia thành file JSONL (--max-requests dòng mỗi file), mỗi file một batch;
+       câu trùng nội dung chỉ gửi một request.
+    2. Poll: batch giả lập đổi trạng thái sau mỗi vài lần poll (validating -> in_progress ->
+       finalizing -> completed); log "⏳ Batch" chỉ được in khi trạng thái / tiến độ thay đổi.
+    3. Ingest: mọi task cần tạo có row trong ai_cache (prompt_hash, model đúng) hoặc được đếm là failed
+       (request lỗi 429 / 5xx trong error file).
+    4. --batch-id: ingest lại các batch đã submit từ đầu (map câu trùng đọc lại từ OPENAI_BATCH_DIR), ghi đủ
+       các rows như lần chạy đầu, kể cả câu trùng nội dung.
+    5. LLM cache: chạy lại khi LLM cache local đã có kết quả của lần đầu; prompt trúng cache không gửi batch
+       nhưng vẫn qua ContentValidator và được đếm vào by_provider như kết quả từ batch.
+
+In ✅ / ❌ cho từng mục, exit code 1 nếu có mục sai.
+
+Cách sử dụng:
+    python bench_openai_batch.py
+    python bench_openai_batch.py --questions 200 --max-requests 100 --rate-429 0.1 --verbose
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+
+from bench_cache_ai import (FAKE_MODEL, GOOD_CONTENT, MockBehavior, MockState, add_mock_arguments, batch_object,
+                            build_providers, make_questions, start_mock_server)
+from content_validator import ContentValidator
+from llm_cache import LLMResponseCache
+
+POLL_INTERVAL = 0.01
+
+
+async def run_batch(cache_ai, providers: list, args, batch_ids: list = None, validator=None) -> tuple:
+    """(stats, log) của một lần cache_ai.run_batch()"""
+    from supabase_rest import AsyncSupabaseREST
+
+    cache_ai.supabase = AsyncSupabaseREST(cache_ai.SUPABASE_URL, cache_ai.SUPABASE_KEY)
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            stats = await cache_ai.run_batch(
+                cache_ai.EXAM_PROFILES['saa'], providers[0], 1, args.questions, args.languages, args.types,
+                poll_interval=POLL_INTERVAL, batch_ids=batch_ids, validator=validator
+            )
+    finally:
+        await cache_ai.supabase.aclose()
+        for provider in providers:
+            await provider.clients.aclose()
+    if args.verbose:
+        print(log.getvalue())
+    return stats or {}, log.getvalue()
+
+
+def written_rows(state: MockState) -> list:
+    with state.lock:
+        return [state.cache[key] for key in sorted(state.written)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kiểm tra offline cache_ai.py --batch với OpenAI Batch API giả lập')
+    parser.add_argument('--questions', type=int, default=60, help='Số câu hỏi giả lập (default: 60)')
+    parser.add_argument('--languages', default='vi,en', help='Ngôn ngữ, phân cách bằng dấu phẩy (default: vi,en)')
+    parser.add_argument('--types', default='theory,explanation', help='Loại nội dung (default: theory,explanation)')
+    parser.add_argument('--cached', type=float, default=0.2, help='Tỉ lệ task đã có sẵn trong ai_cache (default: 0.2)')
+    parser.add_argument('--duplicates', type=float, default=0.1, help='Tỉ lệ câu trùng nội dung (default: 0.1)')
+    parser.add_argument('--max-requests', type=int, default=80,
+                        help='Số request tối đa mỗi file batch (OPENAI_BATCH_MAX_REQUESTS, default: 80)')
+    add_mock_arguments(parser)
+    parser.add_argument('--verbose', action='store_true', help='In log của cache builder')
+    args = parser.parse_args()
+    args.languages = args.languages.split(',')
+    args.types = args.types.split(',')
+    args.gemini_rpm = 0  # build_providers chỉ dùng cho gemini
+
+    rng = random.Random(args.seed)
+    questions = make_questions(args.questions, args.duplicates, rng)
+    prefilled_cache = {
+        (q['id'], language, content_type): {'question_id': q['id'], 'language': language, 'type': content_type,
+                                            'content': GOOD_CONTENT}
+        for q in questions for language in args.languages for content_type in args.types
+        if rng.random() < args.cached
+    }
+    state = MockState(questions, [])
+    base_url = start_mock_server(MockBehavior(args), state)
+
+    # cache_ai / openai_batch đọc env khi import nên phải trỏ vào server giả lập trước
+    with tempfile.TemporaryDirectory(prefix='bench_openai_batch_') as workdir:
+        os.environ.update({
+            'SUPABASE_URL': base_url, 'SUPABASE_KEY': 'bench-anon-key', 'LLM_CACHE': '0',
+            'OPENAI_BATCH_DIR': os.path.join(workdir, 'batches'),
+            'OPENAI_BATCH_MAX_REQUESTS': str(args.max_requests),
+            'CACHE_AI_JOURNAL_DIR': os.path.join(workdir, 'runs'),
+            'CACHE_AI_METRICS_DIR': os.path.join(workdir, 'metrics')
+        })
+        import cache_ai
+
+        pending = len(questions) * len(args.languages) * len(args.types) - len(prefilled_cache)
+        print(f"🧪 Mock server: {base_url}, {pending} tasks cần tạo ({len(prefilled_cache)} đã có cache), "
+              f"tối đa {args.max_requests} requests mỗi batch; 429 {args.rate_429:.0%}, 5xx {args.fail_rate:.0%}")
+
+        failures = []
+        llm_cache = LLMResponseCache(os.path.join(workdir, 'llm_cache.sqlite3'), enabled=True)
+
+        def check(ok: bool, label: str):
+            print(f"   {'✅' if ok else '❌'} {label}")
+            if not ok:
+                failures.append(label)
+
+        def new_providers(name: str) -> list:
+            providers = build_providers({'providers': [('openai', 1)], 'stream': False}, base_url, args,
+                                        os.path.join(workdir, f"ledger_{name}.json"))
+            providers[0].cache = llm_cache  # LLM_CACHE=0 cho cache_ai, chỉ provider của bench dùng cache riêng
+            return providers
+
+        try:
+            providers = new_providers('submit')
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+        # 1-3. Submit + poll + ingest
+        print("▶️ Submit + poll + ingest...", flush=True)
+        state.reset(prefilled_cache)
+        stats, log = asyncio.run(run_batch(cache_ai, providers, args))
+        batches = list(state.batches.values())
+        lines = [item for batch in batches for item in batch['results']]
+        ok_lines = sum(1 for ok, _ in lines if ok)
+        rows = written_rows(state)
+        failed, deduped = stats.get('failed', 0), stats.get('deduped', 0)
+        expected_batches = -(-len(lines) // args.max_requests)
+        check(len(batches) == expected_batches and all(len(b['results']) <= args.max_requests for b in batches),
+              f"{len(lines)} requests chia thành {len(batches)} batch (mong đợi {expected_batches})")
+        check(len(lines) + stats.get('deduped', 0) <= pending and len(lines) + len(prefilled_cache) > 0,
+              f"câu trùng nội dung không gửi request riêng ({stats.get('deduped', 0)} rows ghi lại từ bản gốc)")
+        check(len(rows) + stats.get('failed', 0) == pending,
+              f"{len(rows)} rows đã ghi + {stats.get('failed', 0)} failed = {pending} tasks cần tạo")
+        check(stats.get('success') == len(rows) and len(rows) == ok_lines + stats.get('deduped', 0),
+              f"rows đã ghi = {ok_lines} kết quả thành công + bản trùng")
+        check(stats.get('by_provider', {}).get('openai') == ok_lines,
+              f"by_provider['openai'] = {stats.get('by_provider', {}).get('openai')} (mong đợi {ok_lines})")
+        hashes = cache_ai.provider_prompt_hashes(cache_ai.EXAM_PROFILES['saa'], providers, args.languages)['openai']
+        check(all(row.get('prompt_hash') == hashes[(row['language'], row['type'])] and row.get('model') == FAKE_MODEL
+                  for row in rows), "mọi row có prompt_hash / model của provider")
+
+        for batch in batches:
+            logged = [line for line in log.splitlines() if f"⏳ Batch {batch['id']}:" in line]
+            states = set()
+            for polls in range(1, batch['polls'] + 1):
+                counts = batch_object({**batch, 'polls': polls})
+                request_counts = counts['request_counts']
+                states.add((counts['status'], request_counts['completed'], request_counts['failed']))
+            check(len(logged) == len(states) < batch['polls'],
+                  f"{batch['id']}: {batch['polls']} lần poll, {len(logged)} dòng log (= {len(states)} lần đổi trạng thái)")
+
+        # 4. Ingest lại bằng --batch-id
+        print("▶️ Ingest lại bằng --batch-id...", flush=True)
+        state.reset(prefilled_cache)
+        batch_ids = [batch['id'] for batch in batches]
+        stats, _ = asyncio.run(run_batch(cache_ai, new_providers('ingest'), args, batch_ids))
+        reingested = written_rows(state)
+        check(len(reingested) == len(rows) and stats.get('failed', 0) == failed,
+              f"--batch-id {','.join(batch_ids)}: {len(reingested)} rows, {stats.get('failed', 0)} failed "
+              f"(mong đợi {len(rows)} / {failed} như lần chạy đầu)")
+        check(stats.get('deduped', 0) == deduped, f"--batch-id ghi lại {stats.get('deduped', 0)} câu trùng nội dung "
+                                                  f"(mong đợi {deduped})")
+        check(len(state.batches) == len(batches), "--batch-id không submit batch mới")
+
+        # 5. Chạy lại khi LLM cache local đã có kết quả của lần đầu (provider.remember khi ingest)
+        print("▶️ Chạy lại với LLM cache local + validate...", flush=True)
+        state.reset(prefilled_cache)
+        validator = ContentValidator()
+        stats, _ = asyncio.run(run_batch(cache_ai, new_providers('cache'), args, validator=validator))
+        resent = [item for batch in list(state.batches.values())[len(batches):] for item in batch['results']]
+        rows = written_rows(state)
+        generated = stats.get('by_provider', {}).get('openai', 0)
+        expected = len(rows) - stats.get('deduped', 0)  # mọi row không phải bản trùng: từ batch hoặc LLM cache
+        check(len(resent) <= len(lines) - ok_lines,
+              f"{len(lines) - len(resent)} prompt trúng LLM cache không gửi lại batch ({len(resent)} request gửi lại)")
+        check(len(rows) + stats.get('failed', 0) == pending,
+              f"{len(rows)} rows đã ghi + {stats.get('failed', 0)} failed = {pending} tasks cần tạo")
+        check(generated == expected and generated > len(resent),
+              f"by_provider['openai'] = {generated} gồm cả kết quả từ LLM cache (mong đợi {expected})")
+        check(validator.checked == expected,
+              f"ContentValidator kiểm tra {validator.checked} bài (mong đợi {expected}, kể cả kết quả từ LLM cache)")
+
+        llm_cache.close()
+        if failures:
+            print(f"\n❌ {len(failures)} mục sai")
+            sys.exit(1)
+        print("\n✅ Batch API giả lập: mọi mục đều đúng")
+
+
+if __name__ == '__main__':
+    main()
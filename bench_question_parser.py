@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parser regex theo block (cũ) vs parser một lượt question_parser.py (mới)
+----------------------------------------------------------------------------------
+Sinh file markdown giả lập theo đúng format dump ExamTopics (SAA_C03.md / PMP_Full_1400.md),
+rồi parse theo từng cách:
+    - legacy:      đọc cả file, split theo block, nhiều re.search / re.match trên mỗi block
+                   (migrate.parse_markdown_file và import_pmp_questions.parse_pmp_questions trước đây)
+    - single-pass: question_parser.parse_file + migrate.to_question_row / pmp_question
+    - parallel:    question_parser.parse_files_parallel với --workers process (bỏ qua nếu --workers 1)
+và in thời gian, số câu / giây, peak memory và speedup. Kết quả các cách phải giống hệt nhau.
+(peak memory của parallel chỉ tính process chính.)
+
+Mục tiêu của request là single-pass nhanh hơn "vài lần" (TARGET_SPEEDUP = 4x) trong một process.
+Chưa đạt: đo trên một CPU, single-pass chỉ nhanh hơn ~2.3-3.2x (100k câu: SAA 6.88s -> 2.18s, PMP
+6.83s -> 2.95s; 20k câu: SAA 2.8x, PMP 2.6x). Đọc + decode file và lần quét regex (C) đã chiếm hơn nửa
+thời gian còn lại, phần Python cho mỗi token / câu không giảm thêm được nhiều. Mỗi lần chạy in rõ đạt
+hay chưa đạt.
+
+Không cần database hay API key.
+
+Cách sử dụng:
+    python bench_question_parser.py                    # 100k câu mỗi format
+    python bench_question_parser.py --questions 20000 --repeat 3
+    python bench_question_parser.py --format pmp
+    python bench_question_parser.py --workers 8        # Thêm cột parse song song 8 process
+"""
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+
+from migrate import to_question_row
+from question_parser import EXAM_FORMATS, PMP_FORMAT, SAA_FORMAT, parse_file, parse_files_parallel, pmp_question
+
+TARGET_SPEEDUP = 4.0  # "nhanh hơn vài lần" của request, single-pass so với legacy
+
+WORDS = ('company application data AWS Amazon bucket instance database latency region users traffic '
+         'storage backup project manager stakeholder risk schedule budget team sponsor scope change '
+         'requirement quality vendor contract agile sprint backlog deliverable cost should must which').split()
+
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def saa_block(rng: random.Random, number: int) -> str:
+    option_count = rng.choice((4, 4, 4, 5, 6))
+    letters = 'ABCDEF'[:option_count]
+    multi = rng.random() < 0.15
+    answer = ''.join(sorted(rng.sample(letters, 2))) if multi else rng.choice(letters)
+    text = ' '.join(sentence(rng, 8, 25) for _ in range(rng.randint(2, 5)))
+    if multi:
+        text += ' (Choose two.)'
+    options = '\n\n'.join(f"{letter}. {sentence(rng, 6, 30)}" for letter in letters)
+    return f"""## Exam AWS Certified Solutions Architect - Associate SAA-C03 topic 1 question {number} discussion
+
+Exam question from
+
+Amazon's
+AWS Certified Solutions Architect - Associate SAA-C03
+
+Question #: {number}
+Topic #: 1
+
+[All AWS Certified Solutions Architect - Associate SAA-C03 Questions]
+
+{text}
+Suggested Answer: {answer} 🗳️
+
+{options}
+
+**Answer: {answer}**
+
+**Timestamp: March 10, 2023, 12:59 p.m.**
+
+[View on ExamTopics](https://www.examtopics.com/discussions/amazon/view/{100000 + number}-exam-aws-certified-solutions-architect-associate-saa-c03/)
+
+----------------------------------------
+
+"""
+
+
+def pmp_block(rng: random.Random, number: int) -> str:
+    answer = ''.join(sorted(rng.sample('ABCD', 2))) if rng.random() < 0.1 else rng.choice('ABCD')
+    paragraphs = '\n\n'.join(' '.join(sentence(rng, 8, 25) for _ in range(rng.randint(1, 3)))
+                             for _ in range(rng.randint(1, 3)))
+    options = '\n\n'.join(f"{letter}. {sentence(rng, 4, 20)}" for letter in 'ABCD')
+    return f"""## Exam PMP topic 1 question {number} discussion
+
+Exam question from
+
+PMI's
+PMP
+
+Question #: {number}
+Topic #: 1
+
+[All PMP Questions]
+
+{paragraphs}
+Suggested Answer: {answer} 🗳️
+
+{options}
+
+**Answer: {answer}**
+
+**Timestamp: Jan. 5, 2024, 8:41 a.m.**
+
+[View on ExamTopics](https://www.examtopics.com/discussions/pmi/view/{200000 + number}-exam-pmp-topic-1-question-{number}-discussion/)
+
+----------------------------------------
+
+"""
+
+
+def write_corpus(path: str, fmt: str, count: int, seed: int):
+    rng = random.Random(seed)
+    block = saa_block if fmt == 'saa' else pmp_block
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Exam Topics Questions\n\n")
+        for number in range(1, count + 1):
+            f.write(block(rng, number))
+
+
+def legacy_parse_saa(file_path: str) -> list:
+    """migrate.parse_markdown_file trước đây (bỏ print)"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    questions = []
+    for block in content.split('----------------------------------------'):
+        block = block.strip()
+        if not block: continue
+
+        id_match = re.search(r'## Exam .* question (\d+) discussion', block)
+        if not id_match: continue
+
+        suggested_match = re.search(r'Suggested Answer:\s+([A-Z]+)', block)
+        official_match = re.search(r'\*\*Answer:\s+([A-Z]+)\*\*', block)
+        topic_match = re.search(r'Topic #:\s+(\d+)', block)
+        link_match = re.search(r'\[View on ExamTopics\]\((.*?)\)', block)
+
+        lines = block.split('\n')
+
+        opt_start = len(lines)
+        for i, line in enumerate(lines):
+            if re.match(r'^[A-F]\.\s+', line):
+                opt_start = i
+                break
+
+        options = []
+        for line in lines[opt_start:]:
+            if re.match(r'^[A-F]\.\s+', line):
+                options.append(line.strip())
+
+        meta_end = 0
+        for i, line in enumerate(lines):
+            if "[All AWS Certified Solutions Architect" in line:
+                meta_end = i + 1
+                break
+
+        clean_body = []
+        for line in lines[meta_end:opt_start]:
+            s = line.strip()
+            if not s or s.startswith(("Question #", "Topic #", "Exam question from", "Amazon's", "AWS Certified")):
+                continue
+            if s.startswith("Suggested Answer:"):
+                continue
+            clean_body.append(s)
+
+        q_text = "\n".join(clean_body)
+        is_multi = "(Choose two" in q_text or "(Choose three" in q_text
+
+        correct_answ = None
+        if suggested_match:
+            correct_answ = suggested_match.group(1)
+        elif official_match:
+            correct_answ = official_match.group(1)
+
+        if not correct_answ:
+            continue
+
+        questions.append((
+            id_match.group(1),
+            topic_match.group(1) if topic_match else "Unknown",
+            q_text,
+            options,
+            correct_answ,
+            link_match.group(1) if link_match else None,
+            is_multi
+        ))
+    return questions
+
+
+def legacy_parse_pmp(file_path: str) -> list:
+    """import_pmp_questions.parse_pmp_questions trước đây (bỏ print)"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    questions = []
+    for block in content.split('## Exam PMP topic')[1:]:
+        question_num_match = re.search(r'question (\d+)', block, re.IGNORECASE)
+        if not question_num_match:
+            continue
+        question_text_match = re.search(r'\[All PMP Questions\]\s*\n\n(.*?)\n\s*Suggested Answer:', block, re.DOTALL)
+        if not question_text_match:
+            continue
+
+        options = []
+        option_pattern = r'^([A-D])\.\s+(.+?)(?=\n[A-D]\.|$|\*\*Answer:)'
+        for match in re.finditer(option_pattern, block, re.MULTILINE | re.DOTALL):
+            text = re.sub(r'\s+', ' ', match.group(2).strip())
+            options.append(f"{match.group(1)}. {text}")
+        if len(options) < 2:
+            continue
+
+        answer_match = re.search(r'\*\*Answer:\s*([A-D]+)\*\*', block)
+        if not answer_match:
+            continue
+        correct_answer = answer_match.group(1)
+
+        link_match = re.search(r'\[View on ExamTopics\]\((https://www\.examtopics\.com/[^\)]+)\)', block)
+        questions.append({
+            'id': question_num_match.group(1),
+            'question': question_text_match.group(1).strip(),
+            'options': options,
+            'correct_answer': correct_answer,
+            'is_multiselect': len(correct_answer) > 1,
+            'discussion_link': link_match.group(1) if link_match else None
+        })
+    return questions
+
+
+def single_pass_saa(file_path: str) -> list:
+    rows = (to_question_row(raw) for raw in parse_file(file_path, SAA_FORMAT))
+    return [row for row in rows if row is not None]
+
+
+def single_pass_pmp(file_path: str) -> list:
+    rows = (pmp_question(raw)[0] for raw in parse_file(file_path, PMP_FORMAT))
+    return [row for row in rows if row is not None]
+
+
+def parallel(fmt: str, workers: int):
+    def parse(file_path: str) -> list:
+        records = parse_files_parallel([file_path], EXAM_FORMATS[fmt], workers)
+        if fmt == 'saa':
+            rows = (to_question_row(raw) for raw in records)
+        else:
+            rows = (pmp_question(raw)[0] for raw in records)
+        return [row for row in rows if row is not None]
+    return parse
+
+
+PARSERS = {
+    'saa': (legacy_parse_saa, single_pass_saa),
+    'pmp': (legacy_parse_pmp, single_pass_pmp)
+}
+
+
+def measure(parse, file_path: str, repeat: int) -> tuple:
+    """(thời gian tốt nhất, peak memory MB, kết quả)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(file_path)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    parse(file_path)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parser regex theo block vs parser một lượt')
+    parser.add_argument('--questions', type=int, default=100000, help='Số câu trong file giả lập (default: 100000)')
+    parser.add_argument('--format', choices=['saa', 'pmp', 'all'], default='all')
+    parser.add_argument('--repeat', type=int, default=1, help='Số lần chạy, lấy thời gian tốt nhất (default: 1)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Số process cho parse song song (default: số CPU, 1 = bỏ qua)')
+    args = parser.parse_args()
+
+    formats = ['saa', 'pmp'] if args.format == 'all' else [args.format]
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in formats:
+            path = os.path.join(tmp, f"{fmt}.md")
+            write_corpus(path, fmt, args.questions, args.seed)
+            size_mb = os.path.getsize(path) / 1e6
+            print(f"\n📄 {fmt.upper()}: {args.questions} câu, {size_mb:.1f} MB")
+
+            legacy, single_pass = PARSERS[fmt]
+            runs = [('legacy', legacy), ('single-pass', single_pass)]
+            if args.workers > 1:
+                runs.append((f"parallel x{args.workers}", parallel(fmt, args.workers)))
+
+            results = []
+            for name, parse in runs:
+                seconds, peak, rows = measure(parse, path, args.repeat)
+                results.append((name, seconds, rows))
+                print(f"   {name:<13} {seconds:7.2f}s  {len(rows) / seconds:>9,.0f} câu/s  peak {peak:7.1f} MB  "
+                      f"({len(rows)} câu)")
+            legacy_time, legacy_rows = results[0][1], results[0][2]
+            for name, seconds, rows in results[1:]:
+                status = '✅ kết quả giống hệt' if rows == legacy_rows else '❌ KẾT QUẢ KHÁC NHAU'
+                print(f"   ⚡ {name}: speedup {legacy_time / seconds:.1f}x  {status}")
+                if name == 'single-pass':
+                    verdict = ('✅ đạt' if legacy_time / seconds >= TARGET_SPEEDUP else '⚠️ CHƯA ĐẠT')
+                    print(f"   🎯 mục tiêu ≥{TARGET_SPEEDUP:g}x trong một process: {verdict}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 """
 AI Cache Builder Script
 -----------------------
-Tạo cache AI cho các câu hỏi AWS SAA-C03.
+Tạo cache AI cho các câu hỏi AWS SAA-C03 / PMP, chia tasks cho một hoặc nhiều
+LLM provider (Gemini, OpenAI, Hugging Face - xem llm_providers.py).
 
 Cách sử dụng:
     python cache_ai.py 1-10         # Cache câu hỏi từ 1 đến 10
@@ -9,19 +10,45 @@ Cách sử dụng:
     python cache_ai.py 1-10 --type theory  # Chỉ cache theory
     python cache_ai.py 1-10 --type explanation  # Chỉ cache explanation
     python cache_ai.py 1-10 --force  # Ghi đè cache cũ
+    python cache_ai.py 1-10 --stale-only  # Chỉ tạo lại mục cache có prompt/model cũ
+    python cache_ai.py --ids changed_ids_questions.txt --stale-only  # Chỉ các câu đã sửa (migrate.py --diff)
+    python cache_ai.py 1-10 --concurrency 8  # 8 tasks song song mỗi provider
+    python cache_ai.py 1-100 --providers gemini,openai  # Chia tasks cho Gemini + OpenAI
+    python cache_ai.py 1-50 --exam pmp --providers huggingface  # Cache đề PMP
+    python cache_ai.py 1-500 --resume  # Chạy tiếp lần chạy bị ngắt (theo journal)
+    python cache_ai.py 1-1400 --shard 2/4  # Chạy phần 2/4 của range (máy / process thứ 2)
+    python cache_ai.py 1-1800 --exam pmp --order popularity  # Câu được làm / làm sai nhiều nhất trước
+    python cache_ai.py 1-1400 --no-dedup  # Không gộp câu trùng nội dung (mặc định: gộp)
+    python cache_ai.py 1-1400 --metrics  # Ghi metrics JSONL + Prometheus textfile
+    python cache_ai.py 1-1400 --repair-rounds 2  # Tạo lại section lỗi tối đa 2 lần (--no-validate để tắt)
 
 Yêu cầu:
     pip install httpx google-genai python-dotenv
+    pip install openai huggingface_hub  # Optional, cho provider openai / huggingface
+    pip install httpx[http2]  # Optional, để bật SUPABASE_HTTP2=1
 """
 
 import os
 import sys
 import argparse
+import asyncio
 import time
 from typing import Optional
 from dotenv import load_dotenv
-import httpx
-from google import genai
+from supabase_rest import AsyncSupabaseREST, QUESTION_PAGE_SIZE
+from cache_writer import AsyncCacheWriter, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from llm_cache import LLMResponseCache
+from prompt_fingerprint import FINGERPRINT_COLUMNS, build_prompt_hashes, needs_generation
+from exam_profiles import EXAM_PROFILES, ExamProfile
+from llm_providers import PROVIDERS, DEFAULT_SYSTEM_PROMPT, LLMProvider, load_providers
+from hedging import HedgePolicy, DEFAULT_HEDGE_PERCENTILE, DEFAULT_HEDGE_MAX_RATIO
+from openai_batch import OpenAIBatchRunner, DEFAULT_POLL_INTERVAL, batch_custom_id, parse_custom_id
+from run_journal import RunJournal, journal_path, task_key
+from question_dedup import DedupIndex
+from content_validator import ContentValidator, DEFAULT_REPAIR_ROUNDS
+from run_metrics import MetricsRecorder, DEFAULT_METRICS_DIR, DEFAULT_PROM_FILE, current_task
+from sharding import in_shard, parse_shard, shard_label, shard_stats_path, write_shard_stats
+from question_diff import id_number, read_ids
 
 # Load environment variables
 load_dotenv()
@@ -30,22 +57,11 @@ load_dotenv()
 SUPABASE_URL = os.getenv('VITE_SUPABASE_URL') or os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('VITE_SUPABASE_ANON_KEY') or os.getenv('SUPABASE_KEY')
 
-# Parse multiple Gemini API keys
-def get_gemini_keys() -> list:
-    """Lấy danh sách Gemini API keys từ environment"""
-    keys_string = os.getenv('GEMINI_API_KEYS') or os.getenv('VITE_GOOGLE_API_KEYS') or ''
-    keys = [k.strip() for k in keys_string.split(',') if k.strip()]
-    
-    # Fallback to single key
-    if not keys:
-        single_key = os.getenv('GEMINI_API_KEY') or os.getenv('VITE_GEMINI_API_KEY')
-        if single_key:
-            keys = [single_key]
-    
-    return keys
+# Provider mặc định khi không truyền --providers (VD: CACHE_AI_PROVIDERS=gemini,openai)
+DEFAULT_PROVIDERS = os.getenv('CACHE_AI_PROVIDERS') or 'gemini'
 
-GEMINI_API_KEYS = get_gemini_keys()
-current_key_index = 0  # Track current key for rotation
+# Thứ tự xử lý câu hỏi: theo id, hoặc câu được làm / làm sai nhiều nhất trước
+TASK_ORDERS = ('id', 'popularity')
 
 # Validate configuration
 if not SUPABASE_URL or not SUPABASE_KEY:
@@ -56,200 +72,19 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("   GEMINI_API_KEYS=key1,key2,key3")
     sys.exit(1)
 
-if not GEMINI_API_KEYS:
-    print("❌ Error: GEMINI_API_KEYS chưa được cấu hình!")
-    sys.exit(1)
-
-print(f"🔑 Loaded {len(GEMINI_API_KEYS)} Gemini API keys")
-
-# Supabase REST API headers
-HEADERS = {
-    'apikey': SUPABASE_KEY,
-    'Authorization': f'Bearer {SUPABASE_KEY}',
-    'Content-Type': 'application/json',
-    'Prefer': 'return=minimal'
-}
-
-
-def get_next_key() -> str:
-    """Lấy key tiếp theo theo thứ tự tuần tự"""
-    global current_key_index
-    key = GEMINI_API_KEYS[current_key_index]
-    current_key_index = (current_key_index + 1) % len(GEMINI_API_KEYS)
-    return key
-
-
-def get_explanation_prompt(question: str, options: str, correct_answer: str, language: str) -> str:
-    """Tạo prompt cho Giải thích (Explanation)"""
-    language_instruction = 'Vui lòng trả lời bằng tiếng Việt.' if language == 'vi' else 'Please respond in English.'
-    
-    prompt_structure = f"""## Giải thích câu hỏi
-
-Phân tích yêu cầu chính của câu hỏi, xác định các điểm mấu chốt cần chú ý.
-
-## Giải thích đáp án đúng
-
-Tại sao đáp án {correct_answer} là đúng? Giải thích chi tiết.
-
-## Tại sao không chọn các đáp án khác
-
-Phân tích từng đáp án sai, giải thích lý do.
-
-## Các lỗi thường gặp
-
-Liệt kê các lỗi mà thí sinh hay mắc phải.
-
-## Mẹo để nhớ
-
-Cung cấp các mẹo, tricks để áp dụng cho các câu hỏi tương tự.
-
-QUAN TRỌNG: Khi đề cập đến các keywords hoặc concepts trong nội dung, viết chúng ở dạng **in đậm** KHÔNG CÓ dấu hai chấm (:) phía sau. Ví dụ: **Keyword** chứ không phải **Keyword:**""" if language == 'vi' else f"""## Question Analysis
-
-Analyze the main requirements of the question and identify the key points.
+# Supabase REST client dùng chung (keep-alive pool, HTTP/2 tùy chọn)
+supabase = AsyncSupabaseREST(SUPABASE_URL, SUPABASE_KEY)
 
-## Correct Answer Explanation
+# Cache local (SQLite) cho LLM responses, tránh trả tiền lại khi chạy lại / --force
+llm_cache = LLMResponseCache()
 
-Why is answer {correct_answer} correct? Explain in detail.
-
-## Why Other Answers Are Wrong
-
-Analyze each incorrect answer and explain why.
-
-## Common Mistakes
-
-List the mistakes students often make.
-
-## Tips to Remember
-
-Provide tips and tricks to apply to similar questions.
-
-IMPORTANT: When mentioning keywords or concepts in content, write them in **bold** withOUT colons (:) after. Example: **Keyword** NOT **Keyword:**"""
-    
-    return f"""You are an AWS Solutions Architect expert. Analyze this SAA-C03 exam question.
-
-Question: {question}
-
-Options:
-{options}
-
-Correct Answer: {correct_answer}
-
-{language_instruction}
-
-IMPORTANT: Start directly with the analysis. Do NOT include any greetings, introductions, or conclusions. Go straight to the structured content.
-
-Do NOT use colons (:) after bold keywords. Write descriptions on the same line or new line without colons.
-
-Provide a comprehensive explanation:
-
-{prompt_structure}
-
-Keep the explanation structured and easy to understand (max 500 words)."""
-
-
-def get_theory_prompt(question: str, options: str, language: str) -> str:
-    """Tạo prompt cho Lý Thuyết (Theory)"""
-    language_instruction = 'Vui lòng trả lời bằng tiếng Việt.' if language == 'vi' else 'Please respond in English.'
-    
-    prompt_structure = """## Cơ sở lý thuyết các thuật ngữ trong câu hỏi
+# Metrics theo từng lần gọi (chỉ ghi khi chạy với --metrics)
+metrics = MetricsRecorder()
 
-Liệt kê và giải thích TẤT CẢ các AWS services, concepts, và thuật ngữ kỹ thuật được đề cập trong câu hỏi.
 
-Định dạng cho mỗi thuật ngữ:
-- **Tên thuật ngữ** (in đậm, không có dấu hai chấm)
-- Giải thích ngắn gọn và đầy đủ về thuật ngữ đó (trên dòng mới)
-
-## Cơ sở lý thuyết các thuật ngữ trong đáp án
-
-Liệt kê và giải thích TẤT CẢ các AWS services, concepts, và thuật ngữ kỹ thuật xuất hiện trong các đáp án (A, B, C, D).
-
-Định dạng cho mỗi thuật ngữ:
-- **Tên thuật ngữ** (in đậm, không có dấu hai chấm)
-- Giải thích ngắn gọn và đầy đủ về thuật ngữ đó (trên dòng mới)
-
-QUAN TRỌNG: KHÔNG dùng dấu hai chấm (:) sau tên thuật ngữ.""" if language == 'vi' else """## Theoretical Foundation of Question Terms
-
-List and explain ALL AWS services, concepts, and technical terms mentioned in the question.
-
-Format for each term:
-- **Term name** (bold, NO colon)
-- Concise but thorough explanation (on new line)
-
-## Theoretical Foundation of Answer Terms
-
-List and explain ALL AWS services, concepts, and technical terms appearing in the answers (A, B, C, D).
-
-Format for each term:
-- **Term name** (bold, NO colon)
-- Concise but thorough explanation (on new line)
-
-IMPORTANT: Do NOT use colons (:) after term names."""
-    
-    return f"""You are an AWS Solutions Architect expert. Provide theoretical foundation for this question.
-
-Question: {question}
-
-Options:
-{options}
-
-{language_instruction}
-
-IMPORTANT: Start directly with the theoretical content. Do NOT include any greetings, introductions (like "Chào bạn, là một chuyên gia..." or "Hello, as an expert..."), or conclusions. Go straight to the structured content below.
-
-Provide a comprehensive theoretical breakdown:
-
-{prompt_structure}
-
-Keep the theory organized and easy to reference (max 500 words)."""
-
-
-def call_gemini(prompt: str, max_retries: int = 3) -> Optional[str]:
-    """Gọi Gemini API với retry logic và key rotation"""
-    tried_keys = set()
-    
-    while len(tried_keys) < len(GEMINI_API_KEYS):
-        api_key = get_next_key()
-        key_suffix = api_key[-6:]  # Last 6 chars for logging
-        
-        if api_key in tried_keys:
-            continue
-        
-        tried_keys.add(api_key)
-        
-        for attempt in range(max_retries):
-            try:
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
-                    model='gemini-2.0-flash-exp',
-                    contents=prompt
-                )
-                return response.text
-            except Exception as e:
-                error_str = str(e).lower()
-                
-                # If quota exceeded or rate limited, try next key
-                if 'quota' in error_str or 'rate' in error_str or '429' in error_str:
-                    print(f"   ⚠️ Key ...{key_suffix} rate limited, switching to next key...")
-                    break  # Break inner loop, try next key
-                
-                print(f"   ⚠️ Attempt {attempt + 1} with key ...{key_suffix} failed: {e}")
-                
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    print(f"   ⏳ Waiting {wait_time}s before retry...")
-                    time.sleep(wait_time)
-        else:
-            # All retries failed for this key
-            continue
-    
-    print(f"   ❌ All {len(GEMINI_API_KEYS)} keys exhausted!")
-    return None
-
-
-def get_cached_content(question_id: str, language: str, content_type: str) -> Optional[str]:
+async def get_cached_content(profile: ExamProfile, question_id: str, language: str, content_type: str) -> Optional[str]:
     """Kiểm tra cache đã tồn tại chưa"""
     try:
-        url = f"{SUPABASE_URL}/rest/v1/ai_cache"
         params = {
             'question_id': f'eq.{question_id}',
             'language': f'eq.{language}',
@@ -257,145 +92,525 @@ def get_cached_content(question_id: str, language: str, content_type: str) -> Op
             'select': 'content'
         }
         
-        with httpx.Client() as client:
-            response = client.get(url, headers=HEADERS, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]['content']
-            return None
+        begin = time.monotonic()
+        response = await supabase.get(profile.cache_table, params=params)
+        metrics.record('cache_check', 'ok' if response.status_code == 200 else 'error', time.monotonic() - begin,
+                       rows=1, table=profile.cache_table)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data and len(data) > 0:
+                return data[0]['content']
+        return None
     except Exception as e:
         print(f"   ⚠️ Cache check error: {e}")
         return None
 
 
-def save_to_cache(question_id: str, language: str, content_type: str, content: str) -> bool:
-    """Lưu kết quả vào Supabase cache (delete + insert để handle unique constraint)"""
-    try:
-        url = f"{SUPABASE_URL}/rest/v1/ai_cache"
-        
-        with httpx.Client() as client:
-            # Step 1: Delete existing record if exists (to handle unique constraint)
-            delete_params = {
-                'question_id': f'eq.{question_id}',
-                'language': f'eq.{language}',
-                'type': f'eq.{content_type}'
-            }
-            client.delete(url, headers=HEADERS, params=delete_params)
-            # Ignore delete errors - record might not exist
-            
-            # Step 2: Insert new record
-            data = {
-                'question_id': question_id,
-                'language': language,
-                'type': content_type,
-                'content': content
-            }
-            
-            response = client.post(url, headers=HEADERS, json=data)
-            
-            if response.status_code in [200, 201, 204]:
-                return True
-            else:
-                print(f"   ⚠️ Save response: {response.status_code} - {response.text}")
-                return False
-    except Exception as e:
-        print(f"   ❌ Save error: {e}")
-        return False
-
-
-def format_options(options: list) -> str:
-    """Format options thành chuỗi đánh số"""
-    return '\n'.join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options)])
+async def generate_content(providers: list, preferred: LLMProvider, prompt: str,
+                           system_prompt: Optional[str], hedge: Optional[HedgePolicy] = None) -> tuple:
+    """Gọi provider của worker trước, lỗi / hết quota thì chuyển sang provider khác.
+    Với hedge: request chậm quá ngưỡng được gửi thêm sang provider / key khác.
+    Trả về (provider, content) hoặc (None, None)"""
+    order = [preferred] + [p for p in providers if p is not preferred]
+    for index, provider in enumerate(order):
+        if hedge is not None:
+            used, content = await hedge.run(provider, order[index + 1:] + order[:index], prompt, system_prompt)
+        else:
+            used, content = provider, await provider.generate(prompt, system_prompt)
+        if content:
+            return used, content
+    return None, None
 
 
-def fetch_questions(start: int, end: int) -> list:
-    """Lấy danh sách câu hỏi từ Supabase"""
-    try:
-        url = f"{SUPABASE_URL}/rest/v1/questions"
-        params = {'select': '*'}
-        
-        with httpx.Client() as client:
-            response = client.get(url, headers=HEADERS, params=params)
-            
-            if response.status_code != 200:
-                print(f"❌ Error fetching questions: {response.status_code}")
-                return []
-            
-            questions = response.json()
-        
-        # Sort by numeric part of id (e.g., "q1" -> 1)
-        def get_number(q):
-            question_id = q.get('id', '')
-            # Extract number from id like "q1", "q2", etc.
-            num_str = ''.join(filter(str.isdigit, question_id))
-            return int(num_str) if num_str else 0
-        
-        questions.sort(key=get_number)
-        
-        # Filter by range (1-indexed)
-        filtered = []
-        for q in questions:
-            num = get_number(q)
-            if start <= num <= end:
-                filtered.append(q)
-        
-        return filtered
-    except Exception as e:
-        print(f"❌ Error fetching questions: {e}")
-        return []
+async def validate_content(profile: ExamProfile, validator: ContentValidator, providers: list,
+                           provider: Optional[LLMProvider], prompt: str, content: str, language: str,
+                           content_type: str, label: str) -> str:
+    """Kiểm tra các section của output; section lỗi được tạo lại bằng provider đã tạo bài
+    (fallback sang provider khác), provider=None thì chỉ sửa tại chỗ"""
+    async def regenerate(repair_prompt: str) -> Optional[str]:
+        return (await generate_content(providers, provider, repair_prompt, profile.system_prompt))[1]
+    
+    return await validator.ensure_valid(content, prompt, profile.expected_sections(content_type, language),
+                                        profile.allow_bold_colon, regenerate if provider else None, label)
 
 
-def process_question(
-    question: dict,
-    language: str,
-    content_types: list,
-    force: bool = False
-) -> dict:
-    """Xử lý một câu hỏi - tạo cache cho theory và/hoặc explanation"""
+async def process_task(profile: ExamProfile, providers: list, provider: LLMProvider, question: dict,
+                       language: str, content_type: str, writer: AsyncCacheWriter, prompt_hashes: dict,
+                       check_cache: bool = False, hedge: Optional[HedgePolicy] = None,
+                       dedup: Optional[DedupIndex] = None, validator: Optional[ContentValidator] = None) -> tuple:
+    """Xử lý một task (question, language, type) - trả về (result, provider):
+    result là 'queued', 'deduped', 'cached' hoặc 'api_failed', provider là provider đã thực sự tạo content
+    (có thể khác provider của worker khi hedge / fallback), None nếu không generate"""
     question_id = question['id']
-    question_text = question['question']
-    options = question['options']
-    correct_answer = question['correct_answer']
+    label = f"{question_id}/{language}/{content_type}"
     
-    options_str = format_options(options)
-    results = {'id': question_id, 'theory': None, 'explanation': None}
+    # Fallback về GET từng item khi không prefetch được cache của trang
+    if check_cache:
+        existing = await get_cached_content(profile, question_id, language, content_type)
+        if existing:
+            print(f"   ✓ [{label}] đã có cache, bỏ qua")
+            return 'cached', None
     
-    for content_type in content_types:
-        # Check existing cache
-        if not force:
-            existing = get_cached_content(question_id, language, content_type)
-            if existing:
-                print(f"   ✓ {content_type.capitalize()} đã có cache, bỏ qua")
-                results[content_type] = 'cached'
+    # Câu trùng nội dung với task đã / đang generate: chờ và dùng lại kết quả
+    future, owner = None, True
+    if dedup is not None:
+        future, owner = dedup.claim(dedup.key(question, language, content_type))
+    used, content = None, None
+    if not owner:
+        used, content = await asyncio.shield(future)
+        if content:
+            dedup.record_reuse(question_id)
+            print(f"   ♻️ [{label}] trùng nội dung với câu đã tạo, dùng lại kết quả")
+    reused = content is not None
+    
+    # Generate content (task trùng tự generate nếu task gốc lỗi)
+    if not content:
+        print(f"   🤖 [{label}] Đang tạo {content_type} ({provider.name})...")
+        prompt = profile.build_prompt(question, language, content_type)
+        try:
+            used, content = await generate_content(providers, provider, prompt, profile.system_prompt, hedge)
+            if content and validator is not None:
+                content = await validate_content(profile, validator, providers, used, prompt, content,
+                                                 language, content_type, label)
+        finally:
+            if owner and future is not None:
+                future.set_result((used, content))
+        if not content:
+            return 'api_failed', None
+    
+    # Đưa vào writer, batch upsert ở background (kết quả báo qua on_result)
+    writer.put({
+        'question_id': question_id,
+        'language': language,
+        'type': content_type,
+        'content': content,
+        'prompt_hash': prompt_hashes[used.name][(language, content_type)],
+        'model': used.model
+    })
+    return ('deduped' if reused else 'queued'), used
+
+
+def provider_prompt_hashes(profile: ExamProfile, providers: list, languages: list) -> dict:
+    """{provider: {(language, type): prompt_hash}} - mỗi provider có fingerprint riêng
+    (system prompt / params / model khác nhau)"""
+    return {
+        p.name: build_prompt_hashes(profile.theory_prompt, profile.explanation_prompt, languages,
+                                    p.request_params(profile.system_prompt))
+        for p in providers
+    }
+
+
+def popularity_score(attempts: int, incorrect_rate: float) -> float:
+    """Số lượt làm, nhân thêm theo tỉ lệ làm sai (0-1): câu hay làm sai thì hay mở giải thích / lý thuyết hơn"""
+    return attempts * (1 + incorrect_rate)
+
+
+async def timed_pages(pages, table: str):
+    """Ghi metrics phase 'fetch' cho từng trang câu hỏi"""
+    while True:
+        begin = time.monotonic()
+        try:
+            page = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        except Exception:
+            metrics.record('fetch', 'error', time.monotonic() - begin, table=table)
+            raise
+        metrics.record('fetch', 'ok', time.monotonic() - begin, rows=len(page), table=table)
+        yield page
+
+
+async def iter_question_pages(profile: ExamProfile, start: int, end: int, order: str = 'id'):
+    """Các trang câu hỏi trong range. order='popularity': lấy cả range, xếp theo lượt làm / tỉ lệ làm sai
+    (view popularity của bộ đề) rồi chia lại thành trang, câu chưa ai làm giữ thứ tự id ở cuối"""
+    pages = timed_pages(supabase.iter_question_pages(profile.questions_table, start, end), profile.questions_table)
+    if order != 'popularity':
+        async for page in pages:
+            yield page
+        return
+    
+    questions = [q async for page in pages for q in page]
+    popularity = None
+    if profile.popularity_view:
+        begin = time.monotonic()
+        popularity = await supabase.fetch_question_popularity(profile.popularity_view)
+        metrics.record('fetch', 'error' if popularity is None else 'ok', time.monotonic() - begin,
+                       rows=len(popularity or ()), table=profile.popularity_view)
+    if popularity is None:
+        print("⚠️ Không lấy được popularity (chạy add_question_popularity.sql), xử lý theo thứ tự id")
+    else:
+        # sort ổn định: câu cùng điểm giữ thứ tự id
+        questions.sort(key=lambda q: -popularity_score(*popularity.get(str(q['id']), (0, 0.0))))
+        attempted = sum(1 for q in questions if str(q['id']) in popularity)
+        top = ', '.join(f"{q['id']} ({popularity[str(q['id'])][0]} lượt)" for q in questions[:min(5, attempted)])
+        print(f"📈 Thứ tự popularity: {attempted}/{len(questions)} câu đã có người làm, top: {top or '-'}")
+    
+    for i in range(0, len(questions), QUESTION_PAGE_SIZE):
+        yield questions[i:i + QUESTION_PAGE_SIZE]
+
+
+def new_run_stats(providers: list) -> tuple:
+    stats = {'success': 0, 'cached': 0, 'failed': 0, 'deduped': 0, 'by_provider': {p.name: 0 for p in providers}}
+    counters = {'questions': 0, 'queued': 0, 'completed': 0, 'missing': 0, 'resumed': 0}
+    return stats, counters
+
+
+def open_cache_writer(profile: ExamProfile, stats: dict, batch_size: int, flush_interval: float,
+                      journal: Optional[RunJournal] = None) -> AsyncCacheWriter:
+    """Writer batch upsert, kết quả ghi được cộng vào stats success / failed (và ghi vào journal)"""
+    def on_saved(row: dict, ok: bool, error: Optional[str]):
+        label = f"{row['question_id']}/{row['language']}/{row['type']}"
+        key = task_key(row['question_id'], row['language'], row['type'])
+        if ok:
+            stats['success'] += 1
+            if journal is not None:
+                journal.mark_done(key)
+            print(f"   ✅ [{label}] đã lưu vào cache")
+        else:
+            stats['failed'] += 1
+            if journal is not None:
+                journal.mark_failed(key, f"lưu cache thất bại: {error}")
+            print(f"   ⚠️ [{label}] lưu cache thất bại: {error}")
+    
+    writer = AsyncCacheWriter(supabase, profile.cache_table, batch_size, flush_interval, on_result=on_saved,
+                              optional_columns=FINGERPRINT_COLUMNS)
+    writer.metrics = metrics
+    return writer
+
+
+async def iter_pending_tasks(profile: ExamProfile, providers: list, prompt_hashes: dict, start: int, end: int,
+                             languages: list, content_types: list, force: bool, stale_only: bool,
+                             stats: dict, counters: dict, journal: Optional[RunJournal] = None,
+                             shard: Optional[tuple] = None, order: str = 'id', question_ids: Optional[set] = None):
+    """Stream các task (question, language, type, check_cache) cần tạo theo từng trang câu hỏi.
+    Chỉ lấy task thuộc shard (--shard) và câu có trong question_ids (--ids); task đã done trong journal
+    (--resume) được bỏ qua mà không query cache"""
+    current_fingerprints = {
+        (language, content_type): {(prompt_hashes[p.name][(language, content_type)], p.model) for p in providers}
+        for language in languages for content_type in content_types
+    }
+    
+    async for page in iter_question_pages(profile, start, end, order):
+        if question_ids is not None:
+            page = [question for question in page if str(question['id']) in question_ids]
+            if not page:
                 continue
+        counters['questions'] += len(page)
+        print(f"📚 Nhận {len(page)} câu hỏi ({page[0]['id']} → {page[-1]['id']})")
         
-        # Generate content
-        key_idx = (current_key_index % len(GEMINI_API_KEYS)) + 1
-        print(f"   🤖 Đang tạo {content_type} (key {key_idx}/{len(GEMINI_API_KEYS)})...")
-        
-        if content_type == 'theory':
-            prompt = get_theory_prompt(question_text, options_str, language)
-        else:
-            prompt = get_explanation_prompt(question_text, options_str, correct_answer, language)
+        shard_tasks = [
+            (question, language, content_type)
+            for language in languages for question in page for content_type in content_types
+            if in_shard(question['id'], language, content_type, shard)
+        ]
+        tasks = [
+            (question, language, content_type) for question, language, content_type in shard_tasks
+            if journal is None or not journal.is_done(task_key(question['id'], language, content_type))
+        ]
+        counters['resumed'] += len(shard_tasks) - len(tasks)
+        if not tasks:
+            continue
         
-        content = call_gemini(prompt)
+        # Prefetch cache cho trang này (1 query thay vì 1 GET mỗi task)
+        index = None
+        if not force:
+            pending_ids = list(dict.fromkeys(question['id'] for question, _, _ in tasks))
+            begin = time.monotonic()
+            index = await supabase.fetch_cache_index(
+                profile.cache_table, pending_ids, languages, content_types,
+                FINGERPRINT_COLUMNS if stale_only else ()
+            )
+            metrics.record('cache_check', 'error' if index is None else 'ok', time.monotonic() - begin,
+                           rows=len(tasks), table=profile.cache_table)
+            if index is None and stale_only:
+                print("❌ --stale-only cần fingerprint của cache (chạy add_cache_fingerprint.sql), bỏ qua trang này")
+                continue
         
-        if content:
-            # Save to cache
-            if save_to_cache(question_id, language, content_type, content):
-                print(f"   ✅ {content_type.capitalize()} đã lưu vào cache")
-                results[content_type] = 'success'
+        for question, language, content_type in tasks:
+            if index is not None:
+                row = index.get((str(question['id']), language, content_type))
+                if stale_only and row is None:
+                    counters['missing'] += 1
+                    continue
+                if not needs_generation(row, current_fingerprints[(language, content_type)], stale_only):
+                    stats['cached'] += 1
+                    if journal is not None:
+                        journal.mark_done(task_key(question['id'], language, content_type), 'cached')
+                    continue
+            
+            counters['queued'] += 1
+            yield question, language, content_type, not force and index is None
+
+
+def print_stale_summary(stats: dict, counters: dict):
+    print(f"\n🔁 Stale-only: tạo lại {counters['queued']} mục, {stats['cached']} mục còn mới, "
+          f"{counters['missing']} mục chưa có cache (bỏ qua)")
+
+
+def print_journal_summary(journal: RunJournal, counters: dict):
+    if counters['resumed']:
+        print(f"\n⏭️ Resume: bỏ qua {counters['resumed']} tasks đã xong theo journal")
+    if journal.failed:
+        print(f"📒 {len(journal.failed)} tasks thất bại (chạy lại bằng --resume), lý do trong {journal.path}:")
+        for key, reason in list(journal.failed.items())[:10]:
+            print(f"   - {key}: {reason}")
+
+
+async def run_tasks(profile: ExamProfile, providers: list, start: int, end: int, languages: list,
+                    content_types: list, force: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                    flush_interval: float = DEFAULT_FLUSH_INTERVAL, stale_only: bool = False,
+                    hedge: Optional[HedgePolicy] = None, journal: Optional[RunJournal] = None,
+                    shard: Optional[tuple] = None, order: str = 'id', dedup: bool = True,
+                    validator: Optional[ContentValidator] = None,
+                    question_ids: Optional[set] = None) -> Optional[dict]:
+    """Stream câu hỏi theo trang vào worker pool: mỗi provider có số worker bằng concurrency
+    của nó, tất cả cùng lấy task từ một queue nên provider nhanh hơn nhận nhiều task hơn"""
+    total_workers = sum(p.concurrency for p in providers)
+    queue = asyncio.Queue(maxsize=total_workers * 4)
+    stats, counters = new_run_stats(providers)
+    prompt_hashes = provider_prompt_hashes(profile, providers, languages)
+    writer = open_cache_writer(profile, stats, batch_size, flush_interval, journal)
+    dedup_index = DedupIndex(profile.format_options) if dedup else None
+    
+    async def producer():
+        try:
+            async for task in iter_pending_tasks(profile, providers, prompt_hashes, start, end, languages,
+                                                 content_types, force, stale_only, stats, counters, journal, shard,
+                                                 order, question_ids):
+                await queue.put(task)
+        except Exception as e:
+            print(f"❌ Error fetching questions: {e}")
+        finally:
+            for _ in range(total_workers):
+                await queue.put(None)
+    
+    async def worker(provider: LLMProvider):
+        while True:
+            task = await queue.get()
+            if task is None:
+                return
+            question, language, content_type, check_cache = task
+            key = task_key(question['id'], language, content_type)
+            current_task.set((question['id'], language, content_type))
+            if journal is not None:
+                journal.start(key)
+            
+            reason = 'tất cả providers lỗi / hết quota'
+            try:
+                result, used = await process_task(profile, providers, provider, question, language, content_type,
+                                            writer, prompt_hashes, check_cache, hedge, dedup_index, validator)
+            except Exception as e:
+                print(f"   ❌ [{question['id']}/{language}/{content_type}] Lỗi không mong muốn: {e}")
+                result, reason = 'failed', f"lỗi không mong muốn: {e}"
+            
+            # 'queued' được tính success/failed (và done/failed trong journal) khi writer flush xong
+            if result == 'cached':
+                stats['cached'] += 1
+                if journal is not None:
+                    journal.mark_done(key, 'cached')
+            elif result == 'queued':
+                stats['by_provider'][used.name] += 1
+            elif result == 'deduped':
+                stats['deduped'] += 1
             else:
-                results[content_type] = 'save_failed'
-        else:
-            results[content_type] = 'api_failed'
+                stats['failed'] += 1
+                if journal is not None:
+                    journal.mark_failed(key, reason)
+            
+            counters['completed'] += 1
+            print(f"[{counters['completed']}/{counters['queued']}] {question['id']} ({language}, {content_type}): {result}")
+    
+    mode = 'stale-only' if stale_only else ('force' if force else 'skip existing')
+    if shard is not None:
+        mode += f", shard {shard[0]}/{shard[1]}"
+    if order != 'id':
+        mode += f", order {order}"
+    workers = ', '.join(f"{p.name}×{p.concurrency}" for p in providers)
+    print(f"🚀 Đang xử lý range {start}-{end} với {total_workers} workers ({workers}, {mode})...\n")
+    try:
+        await asyncio.gather(producer(), *(worker(p) for p in providers for _ in range(p.concurrency)))
+    finally:
+        # Final flush: ghi nốt các rows còn trong queue
+        await writer.close()
+    
+    if not counters['questions']:
+        print("❌ Không tìm thấy câu hỏi nào trong range này!")
+        return None
+    if stale_only:
+        print_stale_summary(stats, counters)
+    if journal is not None:
+        print_journal_summary(journal, counters)
+    if dedup_index is not None and dedup_index.saved:
+        print(f"♻️ {dedup_index.summary()}")
+    if hedge is not None:
+        print(f"⏱️ {hedge.summary()}")
+    if validator is not None and validator.checked:
+        print(f"🩺 {validator.summary()}")
+    return stats
+
+
+async def run_batch(profile: ExamProfile, provider: LLMProvider, start: int, end: int, languages: list,
+                    content_types: list, force: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                    flush_interval: float = DEFAULT_FLUSH_INTERVAL, stale_only: bool = False,
+                    poll_interval: float = DEFAULT_POLL_INTERVAL, batch_ids: Optional[list] = None,
+                    journal: Optional[RunJournal] = None, shard: Optional[tuple] = None,
+                    order: str = 'id', dedup: bool = True,
+                    validator: Optional[ContentValidator] = None,
+                    question_ids: Optional[set] = None) -> Optional[dict]:
+    """--batch: gom mọi prompt cần tạo vào file JSONL, submit lên OpenAI Batch API, poll tới khi
+    xong rồi ghi hàng loạt vào cache. batch_ids: chỉ poll + ingest các batch đã submit trước đó.
+    Câu trùng nội dung chỉ gửi một request, kết quả được ghi cho mọi bản sao"""
+    stats, counters = new_run_stats([provider])
+    prompt_hashes = provider_prompt_hashes(profile, [provider], languages)
+    system_prompt = profile.system_prompt or DEFAULT_SYSTEM_PROMPT
+    runner = OpenAIBatchRunner(provider.clients.get(provider.api_key))
+    writer = open_cache_writer(profile, stats, batch_size, flush_interval, journal)
+    prompts = {}  # custom_id -> prompt, để lưu kết quả vào LLM cache local
+    dedup_index = DedupIndex(profile.format_options) if dedup else None
+    primary_ids = {}  # dedup key -> custom_id được gửi batch
+    duplicates = {}  # custom_id được gửi batch -> custom_id của các câu trùng
+    
+    def queue_row(custom_id: str, content: str):
+        question_id, language, content_type, prompt_hash = parse_custom_id(custom_id)
+        writer.put({
+            'question_id': question_id,
+            'language': language,
+            'type': content_type,
+            'content': content,
+            'prompt_hash': prompt_hash,
+            'model': provider.model
+        })
+    
+    async def store(custom_id: str, content: str, prompt: Optional[str]) -> str:
+        """Validate + ghi + đếm một kết quả (từ batch hoặc LLM cache) như kết quả của worker, trả về content đã sửa.
+        Section lỗi được tạo lại online; ingest --batch-id không còn prompt nên chỉ sửa tại chỗ"""
+        if validator is not None:
+            _, language, content_type, _ = parse_custom_id(custom_id)
+            content = await validate_content(profile, validator, [provider], provider if prompt else None,
+                                             prompt or '', content, language, content_type,
+                                             custom_id.rsplit('|', 1)[0])
+        queue_row(custom_id, content)
+        stats['by_provider'][provider.name] += 1
+        return content
+    
+    try:
+        if not batch_ids:
+            requests = []
+            try:
+                async for question, language, content_type, check_cache in iter_pending_tasks(
+                        profile, [provider], prompt_hashes, start, end, languages, content_types,
+                        force, stale_only, stats, counters, journal, shard, order, question_ids):
+                    if check_cache and await get_cached_content(profile, question['id'], language, content_type):
+                        stats['cached'] += 1
+                        if journal is not None:
+                            journal.mark_done(task_key(question['id'], language, content_type), 'cached')
+                        continue
+                    
+                    prompt = profile.build_prompt(question, language, content_type)
+                    custom_id = batch_custom_id(str(question['id']), language, content_type,
+                                                prompt_hashes[provider.name][(language, content_type)])
+                    cached = provider.cached(prompt, profile.system_prompt)
+                    if cached:
+                        await store(custom_id, cached, prompt)
+                        continue
+                    if dedup_index is not None:
+                        key = dedup_index.key(question, language, content_type)
+                        if key in primary_ids:
+                            duplicates.setdefault(primary_ids[key], []).append(custom_id)
+                            continue
+                        primary_ids[key] = custom_id
+                    prompts[custom_id] = prompt
+                    requests.append((custom_id, prompt))
+                    if journal is not None:
+                        journal.start(task_key(question['id'], language, content_type))
+            except Exception as e:
+                print(f"❌ Error fetching questions: {e}")
+            if duplicates:
+                print(f"♻️ {sum(len(ids) for ids in duplicates.values())} tasks trùng nội dung, không gửi request riêng")
+            
+            if not counters['questions']:
+                print("❌ Không tìm thấy câu hỏi nào trong range này!")
+                return None
+            if not requests:
+                print("✅ Không có prompt nào cần gửi batch")
+                return stats
+            
+            paths = runner.write_files(requests, provider.model, system_prompt, provider.params, duplicates)
+            print(f"📝 Đã ghi {len(requests)} requests vào {len(paths)} file batch")
+            batch_ids = await runner.submit(paths)
+            print(f"💡 Nếu bị ngắt, ingest lại bằng: --batch-id {','.join(batch_ids)}")
         
-        # Rate limiting - wait between API calls (increased to avoid rate limits)
-        time.sleep(2)  # Increased from 0.5s to 2s
+        # --batch-id: map câu trùng được đọc lại từ file cạnh file JSONL đã submit
+        results, duplicates = await runner.collect(batch_ids, poll_interval)
+        for custom_id, (content, error) in results.items():
+            if content:
+                if custom_id in prompts:
+                    provider.remember(prompts[custom_id], profile.system_prompt, content)
+                content = await store(custom_id, content, prompts.get(custom_id))
+                for duplicate_id in duplicates.get(custom_id, ()):
+                    queue_row(duplicate_id, content)
+                    stats['deduped'] += 1
+                    if dedup_index is not None:
+                        dedup_index.record_reuse(parse_custom_id(duplicate_id)[0])
+                continue
+            for failed_id in [custom_id] + duplicates.get(custom_id, []):
+                stats['failed'] += 1
+                if journal is not None:
+                    journal.mark_failed(task_key(*parse_custom_id(failed_id)[:3]), f"batch lỗi: {error}")
+            print(f"   ❌ [{custom_id.rsplit('|', 1)[0]}] batch lỗi: {error}")
+        missing = [custom_id for custom_id in prompts if custom_id not in results]
+        missing += [duplicate_id for custom_id in missing for duplicate_id in duplicates.get(custom_id, ())]
+        if missing:
+            stats['failed'] += len(missing)
+            if journal is not None:
+                for custom_id in missing:
+                    journal.mark_failed(task_key(*parse_custom_id(custom_id)[:3]), 'không có trong kết quả batch')
+            print(f"   ⚠️ {len(missing)} requests không có trong kết quả batch")
+    finally:
+        await writer.close()
     
-    return results
+    if stale_only:
+        print_stale_summary(stats, counters)
+    if journal is not None:
+        print_journal_summary(journal, counters)
+    if dedup_index is not None and dedup_index.saved:
+        print(f"♻️ {dedup_index.summary()}")
+    if validator is not None and validator.checked:
+        print(f"🩺 {validator.summary()}")
+    return stats
+
+
+async def build_cache(profile: ExamProfile, providers: list, start: int, end: int, languages: list,
+                      content_types: list, force: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                      flush_interval: float = DEFAULT_FLUSH_INTERVAL, stale_only: bool = False,
+                      hedge: Optional[HedgePolicy] = None, batch: bool = False,
+                      poll_interval: float = DEFAULT_POLL_INTERVAL, batch_ids: Optional[list] = None,
+                      journal: Optional[RunJournal] = None, shard: Optional[tuple] = None,
+                      order: str = 'id', dedup: bool = True,
+                      validator: Optional[ContentValidator] = None,
+                      question_ids: Optional[set] = None) -> Optional[dict]:
+    """Chạy toàn bộ tasks cho range (chỉ các id trong question_ids nếu có), đóng Supabase client khi xong"""
+    try:
+        if batch:
+            return await run_batch(profile, providers[0], start, end, languages, content_types, force,
+                                   batch_size, flush_interval, stale_only, poll_interval, batch_ids, journal, shard,
+                                   order, dedup, validator, question_ids)
+        return await run_tasks(profile, providers, start, end, languages, content_types, force,
+                               batch_size, flush_interval, stale_only, hedge, journal, shard, order, dedup,
+                               validator, question_ids)
+    finally:
+        if journal is not None:
+            journal.close()
+        await supabase.aclose()
+        for provider in providers:
+            await provider.aclose()
+        print(f"🗄️ {llm_cache.summary()}")
+        llm_cache.close()
+        if metrics.enabled:
+            print(f"📊 {metrics.summary()}")
+            print(f"   JSONL: {metrics.jsonl_path}, Prometheus: {metrics.prom_path}")
+            metrics.close()
 
 
 def parse_range(range_str: str) -> tuple:
@@ -413,9 +628,10 @@ def parse_range(range_str: str) -> tuple:
         sys.exit(1)
 
 
-def main():
+def main(defaults: Optional[dict] = None):
+    """defaults: giá trị mặc định cho các tham số CLI (dùng bởi cache_ai_openai.py / cache_ai_fast.py)"""
     parser = argparse.ArgumentParser(
-        description='Cache AI responses cho câu hỏi AWS SAA-C03',
+        description='Cache AI responses cho câu hỏi AWS SAA-C03 / PMP',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Ví dụ:
@@ -425,21 +641,120 @@ Ví dụ:
     python cache_ai.py 1-10 --type theory  # Chỉ cache theory
     python cache_ai.py 5-5              # Cache chỉ câu 5
     python cache_ai.py 1-10 --force     # Ghi đè cache cũ
+    python cache_ai.py 1-1400 --stale-only  # Chỉ tạo lại mục có prompt/model cũ
+    python cache_ai.py --ids changed_ids_questions.txt --stale-only  # Chỉ các câu migrate.py --diff báo đã sửa
+    python cache_ai.py --ids changed_ids_pmp_questions.txt --exam pmp --force  # Tạo lại mọi mục của các id trong file
+    python cache_ai.py 1-100 --concurrency 10  # 10 tasks song song mỗi provider
+    python cache_ai.py 1-500 --providers gemini,openai,huggingface  # Chia tasks cho 3 provider
+    python cache_ai.py 1-50 --exam pmp --lang vi  # Cache đề PMP
+    python cache_ai.py 1-500 --providers huggingface,gemini --hedge  # Hedge request chậm hơn p90
+    python cache_ai.py 1-1400 --providers openai --batch  # OpenAI Batch API (rẻ hơn, xong trong 24h)
+    python cache_ai.py 1-50 --exam pmp --providers huggingface --stream  # Stream, dừng sớm khi sai format
+    python cache_ai.py 1-1400 --resume  # Chạy tiếp: bỏ qua task đã xong, chạy lại task lỗi
+    python cache_ai.py 1-1400 --shard 1/3  # Máy 1 / 3 (máy khác chạy 2/3, 3/3), gộp stats bằng merge_shard_stats.py
+    python cache_ai.py 1-1800 --exam pmp --order popularity  # Câu được làm / làm sai nhiều nhất trước
+    python cache_ai.py 1-1400 --no-dedup  # Không gộp câu trùng nội dung (mặc định: gộp)
+    python cache_ai.py 1-1400 --metrics  # Ghi metrics JSONL + Prometheus textfile
+    python cache_ai.py 1-1400 --repair-rounds 2  # Tạo lại section lỗi tối đa 2 lần (--no-validate để tắt)
         """
     )
     
-    parser.add_argument('range', help='Range câu hỏi (vd: 1-10, 5-20, 1)')
+    parser.add_argument('range', nargs='?', help='Range câu hỏi (vd: 1-10, 5-20, 1); bỏ trống khi dùng --ids')
+    parser.add_argument('--ids', metavar='FILE', default=None,
+                        help='Chỉ xử lý các id trong FILE, mỗi dòng một id (VD changed_ids_*.txt của '
+                             'migrate.py / import_pmp_questions.py --diff); range mặc định bao các id này')
+    parser.add_argument('--exam', choices=list(EXAM_PROFILES), default='saa',
+                        help='Bộ đề (default: saa)')
+    parser.add_argument('--providers', default=DEFAULT_PROVIDERS,
+                        help=f'Danh sách LLM provider, phân cách bằng dấu phẩy ({", ".join(PROVIDERS)}; '
+                             f'default: {DEFAULT_PROVIDERS})')
     parser.add_argument('--lang', choices=['vi', 'en'], default=None,
                         help='Ngôn ngữ output (default: cả vi và en)')
     parser.add_argument('--type', choices=['theory', 'explanation', 'both'], default='both',
                         help='Loại content cần cache (default: both)')
-    parser.add_argument('--force', action='store_true',
-                        help='Ghi đè cache cũ')
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--force', action='store_true',
+                            help='Ghi đè cache cũ')
+    mode_group.add_argument('--stale-only', action='store_true',
+                            help='Chỉ tạo lại các mục cache có prompt template / model khác hiện tại')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Số tasks song song mỗi provider (default: gemini = số API keys, '
+                             'openai = OPENAI_CONCURRENCY, huggingface = HF_CONCURRENCY)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Số rows mỗi lần upsert vào cache (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help=f'Số giây tối đa giữa các lần flush cache (default: {DEFAULT_FLUSH_INTERVAL})')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Gửi thêm request sang provider / key khác khi request chậm hơn ngưỡng latency')
+    parser.add_argument('--hedge-percentile', type=float, default=DEFAULT_HEDGE_PERCENTILE,
+                        help=f'Ngưỡng hedge theo percentile latency của provider (default: {DEFAULT_HEDGE_PERCENTILE})')
+    parser.add_argument('--hedge-delay', type=float, default=None,
+                        help='Ngưỡng hedge cố định (giây) khi chưa đủ mẫu latency (default: chưa hedge)')
+    parser.add_argument('--hedge-max-ratio', type=float, default=DEFAULT_HEDGE_MAX_RATIO,
+                        help=f'Tỉ lệ tối đa request được hedge (default: {DEFAULT_HEDGE_MAX_RATIO})')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream response, dừng sớm khi output sai format (lời chào, ký tự CJK) và đo TTFT / tokens/s')
+    parser.add_argument('--batch', action='store_true',
+                        help='Gửi mọi prompt qua OpenAI Batch API (chỉ với --providers openai)')
+    parser.add_argument('--batch-id', default=None,
+                        help='Poll + ingest các batch đã submit (phân cách bằng dấu phẩy), dùng kèm --batch')
+    parser.add_argument('--batch-poll', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'Số giây giữa các lần kiểm tra trạng thái batch (default: {DEFAULT_POLL_INTERVAL})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Replay journal của lần chạy trước (cùng exam / range / lang / type): bỏ qua task đã xong, '
+                             'chạy lại task lỗi / đang dở')
+    parser.add_argument('--order', choices=TASK_ORDERS, default='id',
+                        help='Thứ tự xử lý: id, hoặc popularity = câu được làm / làm sai nhiều nhất trước '
+                             '(cần add_question_popularity.sql, default: id)')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Không gộp câu trùng nội dung (mặc định: câu trùng chỉ gọi LLM một lần)')
+    parser.add_argument('--metrics', action='store_true',
+                        help=f'Ghi metrics từng lần gọi (fetch / cache_check / llm / save) ra JSONL + Prometheus '
+                             f'textfile trong {DEFAULT_METRICS_DIR}/')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='Không kiểm tra section / format của output (mặc định: kiểm tra, chỉ tạo lại section lỗi)')
+    parser.add_argument('--repair-rounds', type=int, default=DEFAULT_REPAIR_ROUNDS,
+                        help=f'Số lần tạo lại section lỗi tối đa cho mỗi bài (default: {DEFAULT_REPAIR_ROUNDS})')
+    parser.add_argument('--shard', default=None,
+                        help='Chỉ chạy phần i/n của tasks (VD 2/4), mỗi shard dùng một phần GEMINI_API_KEYS riêng')
+    if defaults:
+        parser.set_defaults(**defaults)
     
     args = parser.parse_args()
     
+    if (args.concurrency is not None and args.concurrency < 1) or args.batch_size < 1:
+        print("❌ --concurrency và --batch-size phải >= 1")
+        sys.exit(1)
+    if args.repair_rounds < 0:
+        print("❌ --repair-rounds phải >= 0")
+        sys.exit(1)
+    
     # Parse range
-    start, end = parse_range(args.range)
+    question_ids = None
+    if args.ids:
+        try:
+            question_ids = set(read_ids(args.ids))
+        except OSError as e:
+            print(f"❌ Không đọc được --ids {args.ids}: {e}")
+            sys.exit(1)
+        if not question_ids:
+            print(f"✅ {args.ids} không có id nào, không có gì để tạo")
+            return
+    if args.range:
+        start, end = parse_range(args.range)
+    elif question_ids:
+        numbers = [id_number(question_id) for question_id in question_ids]
+        start, end = min(numbers), max(numbers)
+    else:
+        parser.error('cần range hoặc --ids')
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError:
+            print(f"❌ Invalid shard: {args.shard} (format i/n, 1 <= i <= n, VD 2/4)")
+            sys.exit(1)
+    profile = EXAM_PROFILES[args.exam]
     
     # Determine content types
     if args.type == 'both':
@@ -455,71 +770,107 @@ Ví dụ:
         languages = ['vi', 'en']
         lang_display = 'Tiếng Việt + English (all)'
     
+    provider_names = [name.strip() for name in args.providers.split(',') if name.strip()]
+    providers = load_providers(provider_names, llm_cache)
+    if not providers:
+        print(f"❌ Không có provider nào dùng được trong: {args.providers}")
+        sys.exit(1)
+    if args.batch and [p.name for p in providers] != ['openai']:
+        print("❌ --batch chỉ hỗ trợ một provider: --providers openai")
+        sys.exit(1)
+    if args.batch_id and not args.batch:
+        print("❌ --batch-id cần dùng kèm --batch")
+        sys.exit(1)
+    # Journal / metrics riêng cho mỗi shard và mỗi file --ids (resume không lẫn với lần chạy cả range)
+    run_suffix = '_'.join(filter(None, [shard_label(shard) if shard else '',
+                                        f"ids-{os.path.splitext(os.path.basename(args.ids))[0]}" if args.ids else '']))
+    if args.metrics:
+        run_name = os.path.splitext(os.path.basename(journal_path(args.exam, start, end, languages, content_types,
+                                                                  run_suffix)))[0]
+        prom_path = DEFAULT_PROM_FILE
+        if shard is not None:
+            prom_path = f"{os.path.splitext(prom_path)[0]}_{shard_label(shard)}.prom"
+        metrics.open(os.path.join(DEFAULT_METRICS_DIR, f"{run_name}_{time.strftime('%Y%m%d-%H%M%S')}.jsonl"),
+                     prom_path, {'exam': args.exam, 'shard': f"{shard[0]}/{shard[1]}" if shard else ''})
+    for provider in providers:
+        provider.metrics = metrics
+        provider.streaming = args.stream
+        if shard is not None:
+            provider.apply_shard(shard)
+        if args.concurrency:
+            provider.concurrency = args.concurrency
+    
+    journal = RunJournal(journal_path(args.exam, start, end, languages, content_types, run_suffix),
+                         resume=args.resume)
+    
+    hedge = None
+    if args.hedge:
+        hedge = HedgePolicy(args.hedge_percentile, args.hedge_max_ratio, args.hedge_delay)
+    validator = None if args.no_validate else ContentValidator(args.repair_rounds)
+    
+    provider_lines = '\n'.join(f"║    - {p.describe()}" for p in providers)
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
-║           AWS SAA-C03 AI Cache Builder                       ║
+║           {profile.title} AI Cache Builder                       
 ╠══════════════════════════════════════════════════════════════╣
-║  Range: {start} - {end}                                              
+║  Range: {start} - {end}{f" ({len(question_ids)} ids trong {args.ids})" if question_ids else ''}
 ║  Language: {lang_display}                                      
 ║  Types: {', '.join(content_types)}                                    
 ║  Force: {'Yes' if args.force else 'No'}                                              
-║  API Keys: {len(GEMINI_API_KEYS)} keys (rotating)                              
+║  Stale only: {'Yes' if args.stale_only else 'No'}                                         
+║  Batch API: {'Yes' if args.batch else 'No'}                                          
+║  Stream: {'Yes' if args.stream else 'No'}                                             
+║  Hedge: {f"p{args.hedge_percentile * 100:.0f}, tối đa {args.hedge_max_ratio:.0%} requests" if hedge else 'No'}                                   
+║  Resume: {f"Yes ({journal.summary()})" if args.resume else 'No'}                                             
+║  Shard: {f"{shard[0]}/{shard[1]}" if shard else 'No'}                                              
+║  Order: {args.order}                                              
+║  Dedup: {'No' if args.no_dedup else 'Yes'}                                              
+║  Validate: {'No' if args.no_validate else f"Yes (tạo lại section lỗi tối đa {args.repair_rounds} lần)"}
+║  Metrics: {metrics.jsonl_path if args.metrics else 'No'}
+║  Providers:
+{provider_lines}
 ╚══════════════════════════════════════════════════════════════╝
 """)
     
-    # Fetch questions
-    print(f"📚 Đang lấy câu hỏi từ {start} đến {end}...")
-    questions = fetch_questions(start, end)
-    
-    if not questions:
-        print("❌ Không tìm thấy câu hỏi nào trong range này!")
+    if all(p.exhausted for p in providers):
+        print("❌ Tất cả providers đã hết quota hôm nay")
+        for provider in providers:
+            print(f"   {provider.status()}")
+        journal.close()
+        metrics.close()
         return
     
-    print(f"✅ Tìm thấy {len(questions)} câu hỏi\n")
-    
-    # Process each question for each language
-    stats = {'success': 0, 'cached': 0, 'failed': 0}
-    total_tasks = len(questions) * len(languages)
-    current_task = 0
-    
-    for language in languages:
-        lang_name = 'Tiếng Việt' if language == 'vi' else 'English'
-        print(f"\n{'='*60}")
-        print(f"🌐 Đang xử lý ngôn ngữ: {lang_name} ({language})")
-        print(f"{'='*60}\n")
-        
-        for i, question in enumerate(questions, 1):
-            current_task += 1
-            print(f"[{current_task}/{total_tasks}] Câu hỏi: {question['id']} ({language})")
-            
-            results = process_question(
-                question,
-                language,
-                content_types,
-                args.force
-            )
-            
-            for content_type in content_types:
-                if results[content_type] == 'success':
-                    stats['success'] += 1
-                elif results[content_type] == 'cached':
-                    stats['cached'] += 1
-                else:
-                    stats['failed'] += 1
-            
-            print()
+    started_at = time.monotonic()
+    stats = asyncio.run(build_cache(
+        profile, providers, start, end, languages, content_types, args.force,
+        args.batch_size, args.flush_interval, args.stale_only, hedge, args.batch, args.batch_poll,
+        [b.strip() for b in args.batch_id.split(',') if b.strip()] if args.batch_id else None, journal, shard,
+        args.order, not args.no_dedup, validator, question_ids
+    ))
+    if stats is None:
+        return
+    if shard is not None:
+        stats_path = shard_stats_path(journal.path)
+        run = {'exam': args.exam, 'start': start, 'end': end, 'languages': languages, 'content_types': content_types}
+        write_shard_stats(stats_path, run, shard, stats, time.monotonic() - started_at, providers)
+        print(f"📝 Stats shard {shard[0]}/{shard[1]}: {stats_path} (gộp bằng merge_shard_stats.py)")
     
     # Summary
+    by_provider = ', '.join(f"{name}: {count}" for name, count in stats['by_provider'].items())
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║                        KẾT QUẢ                               ║
 ╠══════════════════════════════════════════════════════════════╣
 ║  ✅ Thành công: {stats['success']:>3}                                         
 ║  📦 Đã có cache: {stats['cached']:>3}                                        
+║  ♻️ Dùng lại (câu trùng): {stats['deduped']:>3}                               
 ║  ❌ Thất bại: {stats['failed']:>3}                                           
 ║  📊 Tổng tasks: {stats['success'] + stats['cached'] + stats['failed']:>3}                                         
+║  🤖 Theo provider: {by_provider}
 ╚══════════════════════════════════════════════════════════════╝
 """)
+    for provider in providers:
+        print(f"🔑 {provider.status()}")
 
 
 if __name__ == '__main__':
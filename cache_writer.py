@@ -0,0 +1,161 @@
+"""
+AI Cache Writer
+---------------
+Ghi kết quả AI vào ai_cache / pmp_ai_cache theo batch ở background (asyncio task).
+
+- Rows được đưa vào queue, flush khi đủ batch_size hoặc sau flush_interval giây.
+- Mỗi batch là một PostgREST upsert `on_conflict=question_id,language,type`
+  (atomic, không còn delete + insert và khoảng trống khi row bị xóa).
+- Nếu cả batch lỗi, ghi lại từng row để biết chính xác row nào thất bại.
+- close() flush toàn bộ rows còn lại trước khi dừng.
+- optional_columns (VD: prompt_hash, model) bị bỏ đi nếu bảng chưa có các cột
+  đó, để DB chưa chạy migration vẫn ghi được content.
+- metrics (optional, run_metrics.MetricsRecorder): mỗi lần upsert ghi một record phase 'save'.
+
+Cấu hình qua environment:
+    CACHE_WRITE_BATCH_SIZE=50     # Số rows mỗi batch
+    CACHE_FLUSH_INTERVAL=2        # Số giây tối đa giữa các lần flush
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+CACHE_CONFLICT_COLUMNS = 'question_id,language,type'
+DEFAULT_BATCH_SIZE = int(os.getenv('CACHE_WRITE_BATCH_SIZE') or 50)
+DEFAULT_FLUSH_INTERVAL = float(os.getenv('CACHE_FLUSH_INTERVAL') or 2)
+
+# on_result(row, ok, error) được gọi cho từng row sau khi flush
+ResultCallback = Callable[[dict, bool, Optional[str]], None]
+
+
+def row_key(row: dict) -> tuple:
+    return (row['question_id'], row['language'], row['type'])
+
+
+def _response_ok(response) -> bool:
+    return response.status_code in [200, 201, 204]
+
+
+def _missing_column(response) -> bool:
+    """PostgREST PGRST204: cột trong payload không tồn tại trong bảng"""
+    return response.status_code == 400 and 'PGRST204' in response.text
+
+
+def _report_default(row: dict, ok: bool, error: Optional[str]):
+    if not ok:
+        print(f"   ❌ Save failed {'/'.join(map(str, row_key(row)))}: {error}")
+
+
+class AsyncCacheWriter:
+    """Background writer (asyncio task) cho cache builder async"""
+
+    def __init__(self, client, table: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, on_result: Optional[ResultCallback] = None,
+                 optional_columns: tuple = ()):
+        self.on_result = on_result or _report_default
+        self.optional_columns = tuple(optional_columns)
+        self.written = 0
+        self.failures = []  # [(key, error)]
+        self.metrics = None
+        self._strip_optional = False
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, row: dict):
+        if self._closed:
+            raise RuntimeError("AsyncCacheWriter đã đóng")
+        self._queue.put_nowait(row)
+
+    async def close(self):
+        """Flush các rows còn lại và dừng task"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put_nowait(None)
+        await self._task
+
+    def _prepare(self, rows: list) -> list:
+        if not self._strip_optional:
+            return rows
+        return [{k: v for k, v in row.items() if k not in self.optional_columns} for row in rows]
+
+    def _should_strip(self, response) -> bool:
+        """Bảng chưa có optional columns -> bỏ chúng và thử lại (chỉ một lần)"""
+        if self._strip_optional or not self.optional_columns or not _missing_column(response):
+            return False
+        print(f"   ⚠️ Bảng chưa có cột {', '.join(self.optional_columns)}, ghi cache không kèm các cột này")
+        self._strip_optional = True
+        return True
+
+    def _record(self, begin: float, ok: bool, rows: int, retries: int = 0):
+        if self.metrics is not None:
+            self.metrics.record('save', 'ok' if ok else 'error', time.monotonic() - begin,
+                                rows=rows, retries=retries, table=self.table)
+
+    def report(self, row: dict, ok: bool, error: Optional[str] = None):
+        if ok:
+            self.written += 1
+        else:
+            self.failures.append((row_key(row), error))
+        self.on_result(row, ok, error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = loop.time() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout=max(0.0, deadline - loop.time()))
+                if row is None:
+                    stopping = True
+                else:
+                    batch.append(row)
+            except asyncio.TimeoutError:
+                pass
+
+            if batch and (stopping or len(batch) >= self.batch_size or loop.time() >= deadline):
+                await self._flush(batch)
+                batch = []
+            if loop.time() >= deadline:
+                deadline = loop.time() + self.flush_interval
+
+    async def _flush(self, rows: list):
+        begin, retries = time.monotonic(), 0
+        try:
+            response = await self.client.upsert(self.table, self._prepare(rows), CACHE_CONFLICT_COLUMNS)
+            if self._should_strip(response):
+                retries = 1
+                response = await self.client.upsert(self.table, self._prepare(rows), CACHE_CONFLICT_COLUMNS)
+            ok = _response_ok(response)
+            self._record(begin, ok, len(rows), retries)
+            if ok:
+                for row in rows:
+                    self.report(row, True)
+                return
+            batch_error = f"{response.status_code} - {response.text}"
+        except Exception as e:
+            self._record(begin, False, len(rows), retries)
+            batch_error = str(e)
+
+        if len(rows) > 1:
+            print(f"   ⚠️ Batch upsert {len(rows)} rows lỗi ({batch_error}), ghi lại từng row...")
+        for row in rows:
+            begin = time.monotonic()
+            try:
+                response = await self.client.upsert(self.table, self._prepare([row]), CACHE_CONFLICT_COLUMNS)
+                self._record(begin, _response_ok(response), 1)
+                if _response_ok(response):
+                    self.report(row, True)
+                else:
+                    self.report(row, False, f"{response.status_code} - {response.text}")
+            except Exception as e:
+                self._record(begin, False, 1)
+                self.report(row, False, str(e))
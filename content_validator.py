@@ -0,0 +1,204 @@
+"""
+Content Validator
+-----------------
+Kiểm tra markdown do LLM tạo theo các section ## mà prompt yêu cầu và chỉ tạo lại
+những section bị lỗi thay vì cả bài (--force):
+
+- Sửa tại chỗ, không tốn token:
+    lời chào / giới thiệu trước heading đầu tiên  -> bỏ đi
+    "**Term:**" / "**Term**:" (bộ đề cấm dấu hai chấm sau từ in đậm) -> "**Term**"
+    section không có trong prompt (VD "## Kết luận"), section lặp lại -> bỏ đi
+- Tạo lại bằng prompt nhắm vào đúng section lỗi, rồi ghép lại theo thứ tự của prompt:
+    section bị thiếu, section rỗng / quá ngắn, section có ký tự CJK
+
+Heading được so khớp theo prefix sau khi bỏ '#', số thứ tự ("1. ") và không phân biệt
+hoa thường, nên "## Giải thích đáp án đúng (C)" khớp với "Giải thích đáp án đúng".
+"""
+
+import re
+from typing import Awaitable, Callable, Optional
+
+from stream_guard import CJK_PATTERN, GREETING_PATTERN
+
+MIN_SECTION_CHARS = 20
+DEFAULT_REPAIR_ROUNDS = 1
+
+SECTION_PATTERN = re.compile(r'^##(?!#)[ \t]*(.+?)[ \t#]*$', re.MULTILINE)
+NUMBERING_PATTERN = re.compile(r'^(\d+|[ivx]+)[.)]\s*', re.IGNORECASE)
+BOLD_INNER_COLON_PATTERN = re.compile(r'\*\*([^*\n]+?)[ \t]*:[ \t]*\*\*')
+BOLD_TRAILING_COLON_PATTERN = re.compile(r'(\*\*[^*\n]+?\*\*)[ \t]*:[ \t]*(\n|$)?')
+
+
+def normalize_heading(text: str) -> str:
+    text = text.strip().strip('*').strip()
+    return NUMBERING_PATTERN.sub('', text).casefold()
+
+
+class ValidationReport:
+    """Kết quả parse + kiểm tra một bài: các section theo thứ tự prompt và lỗi của từng section"""
+
+    def __init__(self, expected: list):
+        self.expected = expected
+        self.preamble = ''
+        self.sections = {}  # heading mong đợi -> (dòng heading thực tế, nội dung)
+        self.problems = {}  # heading mong đợi -> lý do cần tạo lại
+        self.fixes = []  # Các lỗi đã sửa tại chỗ
+
+    @property
+    def valid(self) -> bool:
+        return not self.problems
+
+    def render(self) -> str:
+        """Ghép lại bài theo thứ tự prompt (section còn lỗi nhưng có nội dung vẫn được giữ)"""
+        parts = [self.preamble] if self.preamble else []
+        for heading in self.expected:
+            if heading in self.sections:
+                line, body = self.sections[heading]
+                parts.append(f"{line}\n\n{body}" if body else line)
+        return '\n\n'.join(parts).strip() + '\n'
+
+    def describe(self) -> str:
+        return '; '.join(f"{heading}: {reason}" for heading, reason in self.problems.items())
+
+
+def match_heading(text: str, expected: list) -> Optional[str]:
+    normalized = normalize_heading(text)
+    for heading in expected:
+        if normalized.startswith(normalize_heading(heading)):
+            return heading
+    return None
+
+
+def fix_bold_colons(text: str) -> str:
+    text = BOLD_INNER_COLON_PATTERN.sub(r'**\1**', text)
+    # "**Term**: mô tả" -> "**Term** mô tả", giữ xuống dòng nếu dấu hai chấm ở cuối dòng
+    return BOLD_TRAILING_COLON_PATTERN.sub(lambda m: m.group(1) + (m.group(2) if m.group(2) is not None else ' '),
+                                           text)
+
+
+def validate_markdown(content: str, expected: list, allow_bold_colon: bool = False) -> ValidationReport:
+    """Parse content thành các section ## và kiểm tra theo danh sách heading mong đợi"""
+    report = ValidationReport(expected)
+    content = (content or '').replace('\r\n', '\n')
+    matches = list(SECTION_PATTERN.finditer(content))
+
+    preamble = content[:matches[0].start()].strip() if matches else content.strip()
+    if not matches:
+        report.fixes.append('không có heading ##')
+    elif preamble and GREETING_PATTERN.match(preamble):
+        report.fixes.append('bỏ lời chào / giới thiệu')
+    else:
+        report.preamble = preamble
+
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(content)
+        body = content[match.end():end].strip()
+        heading = match_heading(match.group(1), expected)
+        if heading is None:
+            report.fixes.append(f"bỏ section ngoài prompt: {match.group(1).strip()}")
+            continue
+        if heading in report.sections:
+            report.fixes.append(f"bỏ section lặp: {heading}")
+            continue
+        if not allow_bold_colon:
+            fixed = fix_bold_colons(body)
+            if fixed != body:
+                report.fixes.append(f"bỏ dấu hai chấm sau từ in đậm: {heading}")
+                body = fixed
+        report.sections[heading] = (f"## {match.group(1).strip()}", body)
+
+    for heading in expected:
+        if heading not in report.sections:
+            report.problems[heading] = 'thiếu section'
+            continue
+        body = report.sections[heading][1]
+        if len(body) < MIN_SECTION_CHARS:
+            report.problems[heading] = 'section rỗng / quá ngắn'
+        elif CJK_PATTERN.search(body):
+            report.problems[heading] = f"có ký tự CJK: {CJK_PATTERN.search(body).group()!r}"
+    return report
+
+
+def section_repair_prompt(prompt: str, report: ValidationReport, attempt: int = 1,
+                          rejected: Optional[str] = None) -> str:
+    """Prompt gốc + yêu cầu chỉ viết lại các section lỗi. Từ lần thứ 2 kèm số lần thử và bản viết lại
+    bị loại ở lần trước, để prompt mỗi lần mỗi khác (không trúng lại LLM cache) và model biết bản nào đã sai"""
+    problems = '\n'.join(f"- ## {heading} ({reason})" for heading, reason in report.problems.items())
+    retry = ''
+    if attempt > 1 and rejected:
+        retry = f"""
+
+This is repair attempt {attempt}. The previous rewrite below still had the problems listed above, do not repeat it:
+<<<
+{rejected.strip()}
+>>>"""
+    return f"""{prompt}
+
+---
+A previous answer to the prompt above had problems in these sections only:
+{problems}{retry}
+
+Rewrite ONLY these sections, in this order, each starting with its exact "## " heading line from the format above.
+Do NOT repeat the other sections. Do NOT include any greetings, introductions or conclusions."""
+
+
+class ContentValidator:
+    """Validate output sau khi generate, tạo lại section lỗi qua callback regenerate(prompt) -> content"""
+
+    def __init__(self, repair_rounds: int = DEFAULT_REPAIR_ROUNDS):
+        self.repair_rounds = repair_rounds
+        self.checked = 0
+        self.valid = 0
+        self.fixed = 0  # Chỉ cần sửa tại chỗ
+        self.repaired = 0  # Đã tạo lại section lỗi và hợp lệ
+        self.invalid = 0  # Vẫn lỗi sau repair_rounds lần (vẫn được lưu)
+        self.repair_calls = 0
+        self.sections_regenerated = 0
+
+    async def ensure_valid(self, content: str, prompt: str, expected: list, allow_bold_colon: bool,
+                           regenerate: Optional[Callable[[str], Awaitable[Optional[str]]]], label: str = '') -> str:
+        """Trả về content đã sửa (hoặc content gốc nếu không có gì cần sửa). regenerate=None: chỉ sửa tại chỗ"""
+        self.checked += 1
+        if not expected:
+            self.valid += 1
+            return content
+        report = validate_markdown(content, expected, allow_bold_colon)
+        if report.valid and not report.fixes:
+            self.valid += 1
+            return content
+        if report.fixes:
+            print(f"   🩹 [{label}] sửa tại chỗ: {', '.join(report.fixes)}")
+
+        rounds = 0
+        rejected = None
+        while not report.valid and regenerate is not None and rounds < self.repair_rounds:
+            rounds += 1
+            failing = list(report.problems)
+            print(f"   🔧 [{label}] tạo lại {len(failing)}/{len(expected)} sections: {report.describe()}")
+            self.repair_calls += 1
+            self.sections_regenerated += len(failing)
+            patch = await regenerate(section_repair_prompt(prompt, report, rounds, rejected))
+            if not patch:
+                break
+            rejected = patch
+            patched = validate_markdown(patch, failing, allow_bold_colon)
+            for heading in failing:
+                if heading in patched.sections and heading not in patched.problems:
+                    report.sections[heading] = patched.sections[heading]
+                    del report.problems[heading]
+
+        if not report.valid:
+            self.invalid += 1
+            print(f"   ⚠️ [{label}] vẫn lỗi sau {rounds} lần tạo lại, vẫn lưu: {report.describe()}")
+            if not report.sections:
+                return content  # Không ghép được section nào, giữ nguyên output gốc
+        elif rounds:
+            self.repaired += 1
+        else:
+            self.fixed += 1
+        return report.render()
+
+    def summary(self) -> str:
+        return (f"Validate: {self.checked} bài, {self.valid} hợp lệ, {self.fixed} sửa tại chỗ, "
+                f"{self.repaired} tạo lại {self.sections_regenerated} sections ({self.repair_calls} LLM calls), "
+                f"{self.invalid} vẫn lỗi")
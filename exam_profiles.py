@@ -0,0 +1,287 @@
+"""
+Exam Profiles
+-------------
+Cấu hình cho từng bộ đề mà cache builder hỗ trợ: bảng câu hỏi / bảng cache,
+prompt theory + explanation, system prompt và cách format options.
+
+    saa  -> questions / ai_cache          (AWS SAA-C03)
+    pmp  -> pmp_questions / pmp_ai_cache  (PMP, PMBOK 7 & Agile Practice Guide)
+"""
+
+import json
+from typing import Callable, Optional
+
+
+class ExamProfile:
+    """Bộ đề: nơi đọc câu hỏi, nơi ghi cache và cách dựng prompt"""
+
+    def __init__(self, key: str, title: str, questions_table: str, cache_table: str,
+                 theory_prompt: Callable, explanation_prompt: Callable, format_options: Callable,
+                 system_prompt: Optional[str] = None, popularity_view: Optional[str] = None,
+                 section_headings: Optional[Callable] = None, allow_bold_colon: bool = False):
+        self.key = key
+        self.title = title
+        self.questions_table = questions_table
+        self.cache_table = cache_table
+        self.theory_prompt = theory_prompt
+        self.explanation_prompt = explanation_prompt
+        self.format_options = format_options
+        self.system_prompt = system_prompt
+        self.popularity_view = popularity_view  # Số lượt làm / làm sai theo câu (add_question_popularity.sql)
+        self.section_headings = section_headings  # Các heading ## mà prompt yêu cầu (content_validator.py)
+        self.allow_bold_colon = allow_bold_colon  # Prompt cho phép "**Term**: ..." (PMP) hay cấm dấu hai chấm (SAA)
+
+    def build_prompt(self, question: dict, language: str, content_type: str) -> str:
+        options_str = self.format_options(question.get('options'))
+        if content_type == 'theory':
+            return self.theory_prompt(question['question'], options_str, language)
+        return self.explanation_prompt(question['question'], options_str, question.get('correct_answer') or 'A', language)
+
+    def expected_sections(self, content_type: str, language: str) -> list:
+        return list(self.section_headings(content_type, language)) if self.section_headings else []
+
+
+# --- AWS SAA-C03 ---
+
+def format_saa_options(options: list) -> str:
+    """Format options thành chuỗi đánh số"""
+    return '\n'.join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options or [])])
+
+
+def saa_explanation_prompt(question: str, options: str, correct_answer: str, language: str) -> str:
+    """Tạo prompt cho Giải thích (Explanation)"""
+    language_instruction = 'Vui lòng trả lời bằng tiếng Việt.' if language == 'vi' else 'Please respond in English.'
+    
+    prompt_structure = f"""## Giải thích câu hỏi
+
+Phân tích yêu cầu chính của câu hỏi, xác định các điểm mấu chốt cần chú ý.
+
+## Giải thích đáp án đúng
+
+Tại sao đáp án {correct_answer} là đúng? Giải thích chi tiết.
+
+## Tại sao không chọn các đáp án khác
+
+Phân tích từng đáp án sai, giải thích lý do.
+
+## Các lỗi thường gặp
+
+Liệt kê các lỗi mà thí sinh hay mắc phải.
+
+## Mẹo để nhớ
+
+Cung cấp các mẹo, tricks để áp dụng cho các câu hỏi tương tự.
+
+QUAN TRỌNG: Khi đề cập đến các keywords hoặc concepts trong nội dung, viết chúng ở dạng **in đậm** KHÔNG CÓ dấu hai chấm (:) phía sau. Ví dụ: **Keyword** chứ không phải **Keyword:**""" if language == 'vi' else f"""## Question Analysis
+
+Analyze the main requirements of the question and identify the key points.
+
+## Correct Answer Explanation
+
+Why is answer {correct_answer} correct? Explain in detail.
+
+## Why Other Answers Are Wrong
+
+Analyze each incorrect answer and explain why.
+
+## Common Mistakes
+
+List the mistakes students often make.
+
+## Tips to Remember
+
+Provide tips and tricks to apply to similar questions.
+
+IMPORTANT: When mentioning keywords or concepts in content, write them in **bold** withOUT colons (:) after. Example: **Keyword** NOT **Keyword:**"""
+    
+    return f"""You are an AWS Solutions Architect expert. Analyze this SAA-C03 exam question.
+
+Question: {question}
+
+Options:
+{options}
+
+Correct Answer: {correct_answer}
+
+{language_instruction}
+
+IMPORTANT: Start directly with the analysis. Do NOT include any greetings, introductions, or conclusions. Go straight to the structured content.
+
+Do NOT use colons (:) after bold keywords. Write descriptions on the same line or new line without colons.
+
+Provide a comprehensive explanation:
+
+{prompt_structure}
+
+Keep the explanation structured and easy to understand (max 500 words)."""
+
+
+def saa_section_headings(content_type: str, language: str) -> list:
+    """Heading ## theo đúng thứ tự trong prompt (so khớp theo prefix)"""
+    if content_type == 'theory':
+        if language == 'vi':
+            return ['Cơ sở lý thuyết các thuật ngữ trong câu hỏi', 'Cơ sở lý thuyết các thuật ngữ trong đáp án']
+        return ['Theoretical Foundation of Question Terms', 'Theoretical Foundation of Answer Terms']
+    if language == 'vi':
+        return ['Giải thích câu hỏi', 'Giải thích đáp án đúng', 'Tại sao không chọn các đáp án khác',
+                'Các lỗi thường gặp', 'Mẹo để nhớ']
+    return ['Question Analysis', 'Correct Answer Explanation', 'Why Other Answers Are Wrong',
+            'Common Mistakes', 'Tips to Remember']
+
+
+def saa_theory_prompt(question: str, options: str, language: str) -> str:
+    """Tạo prompt cho Lý Thuyết (Theory)"""
+    language_instruction = 'Vui lòng trả lời bằng tiếng Việt.' if language == 'vi' else 'Please respond in English.'
+    
+    prompt_structure = """## Cơ sở lý thuyết các thuật ngữ trong câu hỏi
+
+Liệt kê và giải thích TẤT CẢ các AWS services, concepts, và thuật ngữ kỹ thuật được đề cập trong câu hỏi.
+
+Định dạng cho mỗi thuật ngữ:
+- **Tên thuật ngữ** (in đậm, không có dấu hai chấm)
+- Giải thích ngắn gọn và đầy đủ về thuật ngữ đó (trên dòng mới)
+
+## Cơ sở lý thuyết các thuật ngữ trong đáp án
+
+Liệt kê và giải thích TẤT CẢ các AWS services, concepts, và thuật ngữ kỹ thuật xuất hiện trong các đáp án (A, B, C, D).
+
+Định dạng cho mỗi thuật ngữ:
+- **Tên thuật ngữ** (in đậm, không có dấu hai chấm)
+- Giải thích ngắn gọn và đầy đủ về thuật ngữ đó (trên dòng mới)
+
+QUAN TRỌNG: KHÔNG dùng dấu hai chấm (:) sau tên thuật ngữ.""" if language == 'vi' else """## Theoretical Foundation of Question Terms
+
+List and explain ALL AWS services, concepts, and technical terms mentioned in the question.
+
+Format for each term:
+- **Term name** (bold, NO colon)
+- Concise but thorough explanation (on new line)
+
+## Theoretical Foundation of Answer Terms
+
+List and explain ALL AWS services, concepts, and technical terms appearing in the answers (A, B, C, D).
+
+Format for each term:
+- **Term name** (bold, NO colon)
+- Concise but thorough explanation (on new line)
+
+IMPORTANT: Do NOT use colons (:) after term names."""
+    
+    return f"""You are an AWS Solutions Architect expert. Provide theoretical foundation for this question.
+
+Question: {question}
+
+Options:
+{options}
+
+{language_instruction}
+
+IMPORTANT: Start directly with the theoretical content. Do NOT include any greetings, introductions (like "Chào bạn, là một chuyên gia..." or "Hello, as an expert..."), or conclusions. Go straight to the structured content below.
+
+Provide a comprehensive theoretical breakdown:
+
+{prompt_structure}
+
+Keep the theory organized and easy to reference (max 500 words)."""
+
+
+# --- PMP ---
+
+PMP_SYSTEM_PROMPT = "You are a professional PMP tutor. You keep technical terms in English but explain in the requested language. You never use Chinese/Japanese characters."
+
+
+def format_pmp_options(raw_options) -> str:
+    """Database lưu options dạng '["A...","B..."]' (string JSON); bỏ prefix 'A. ' nếu có để format lại đồng nhất"""
+    try:
+        options_list = json.loads(raw_options) if isinstance(raw_options, str) else (raw_options or [])
+    except Exception:
+        options_list = []
+
+    clean_options = []
+    for i, opt in enumerate(options_list):
+        prefix = f"{chr(65+i)}. "
+        content = opt.replace(prefix, "") if opt.startswith(prefix) else opt
+        clean_options.append(f"{chr(65+i)}. {content}")
+    return '\n'.join(clean_options)
+
+
+def pmp_theory_prompt(question: str, options: str, language: str) -> str:
+    target_lang = "Tiếng Việt" if language == 'vi' else "English"
+    
+    return f"""You are a world-class PMP Instructor. 
+STRICT RULES:
+1. **KEEP ALL PMP TECHNICAL TERMS IN ENGLISH**. Do NOT translate terms like 'Product Backlog', 'Sprint Review', 'Stakeholder Register', 'Critical Path', 'Servant Leadership', 'Retrospective', 'Team Charter', 'Iteration', 'Daily Standup', etc.
+   - RIGHT: **Sprint Review**: Buổi họp cuối sprint để demo sản phẩm...
+   - WRONG: **Đánh giá nước rút**: Buổi họp...
+2. Provide detailed explanations in {target_lang}.
+3. DO NOT repeat explanations if a term appears in both the question and options.
+4. Focus on the 'Why' and 'How' it's used in project management.
+5. If you must explain a concept, start the bullet point with the **English Term**.
+6. **DO NOT REVEAL THE CORRECT ANSWER**. This is a theory section only.
+7. **DO NOT INCLUDE A CONCLUSION** or "The correct answer is..." statement at the end.
+
+Question: {question}
+Options:
+{options}
+
+Format the response as follows:
+## Cơ sở lý thuyết các khái niệm
+- **[English Term]**: [Detailed explanation in {target_lang}]
+- **[English Term]**: [Detailed explanation...]
+
+## Các công cụ và kỹ thuật (Tools & Techniques)
+- **[English Term]**: [Specific purpose and application in this context]
+"""
+
+def pmp_explanation_prompt(question: str, options: str, correct_letter: str, language: str) -> str:
+    target_lang = "Tiếng Việt" if language == 'vi' else "English"
+    
+    # Trích xuất nội dung text của đáp án đúng để ép AI
+    correct_text = "N/A"
+    for line in options.split('\n'):
+        if line.startswith(f"{correct_letter}."):
+            correct_text = line.replace(f"{correct_letter}. ", "")
+            break
+
+    return f"""You are a PMP Mentor. 
+STRICT RULES:
+1. The correct answer is {correct_letter}: "{correct_text}". You MUST justify this answer.
+2. **KEEP TECHNICAL TERMS IN ENGLISH**. Do not translate standard PMP terms (e.g., use "Project Charter", not "Hiến chương dự án"; use "Stakeholder Engagement", not "Sự tham gia của các bên liên quan").
+3. Provide a deep analysis of the situation (Lifecycle: Agile/Predictive/Hybrid).
+4. Use {target_lang} for the narrative explanation.
+
+Question: {question}
+Options:
+{options}
+
+Format the response as follows:
+## Phân tích tình huống
+[Phân tích ngữ cảnh dự án, xác định vấn đề cốt lõi và giai đoạn của dự án.]
+
+## Giải thích đáp án đúng ({correct_letter})
+[Giải thích tại sao "{correct_text}" là lựa chọn tốt nhất dựa trên PM Mindset và tiêu chuẩn PMI.]
+
+## Tại sao các đáp án khác không phù hợp
+[Phân tích chi tiết từng phương án còn lại và lý do loại trừ chúng.]
+
+## PMP Mindset
+[Một quy tắc vàng hoặc mẹo rút ra từ câu hỏi này.]
+"""
+
+
+def pmp_section_headings(content_type: str, language: str) -> list:
+    """Prompt PMP dùng heading tiếng Việt cho cả hai ngôn ngữ; "Giải thích đáp án đúng (X)" khớp theo prefix"""
+    if content_type == 'theory':
+        return ['Cơ sở lý thuyết các khái niệm', 'Các công cụ và kỹ thuật']
+    return ['Phân tích tình huống', 'Giải thích đáp án đúng', 'Tại sao các đáp án khác không phù hợp', 'PMP Mindset']
+
+
+EXAM_PROFILES = {
+    'saa': ExamProfile('saa', 'AWS SAA-C03', 'questions', 'ai_cache',
+                       saa_theory_prompt, saa_explanation_prompt, format_saa_options,
+                       popularity_view='question_popularity', section_headings=saa_section_headings),
+    'pmp': ExamProfile('pmp', 'PMP', 'pmp_questions', 'pmp_ai_cache',
+                       pmp_theory_prompt, pmp_explanation_prompt, format_pmp_options,
+                       system_prompt=PMP_SYSTEM_PROMPT, popularity_view='pmp_question_popularity',
+                       section_headings=pmp_section_headings, allow_bold_colon=True),
+}
@@ -0,0 +1,116 @@
+"""
+Hedged LLM Requests
+-------------------
+Cắt tail latency: nếu request chưa trả về sau một ngưỡng (mặc định p90 latency
+quan sát được của provider), gửi thêm một bản sao sang provider khác (hoặc key
+khác của cùng provider), lấy kết quả về trước và hủy request còn lại.
+Backup cùng provider không dùng lại key của primary (tập key dùng chung qua generate(keys=...)).
+
+- Ngưỡng tính từ latency các lần gọi API thành công gần nhất (không tính cache hit),
+  đếm từ lúc request được gửi đi. Khi chưa đủ mẫu, dùng fixed_delay (None = chưa hedge).
+- max_ratio giới hạn số hedge / tổng số request để không đốt quota.
+- Request chạy trong thread (SDK sync) không dừng được ngay khi bị hủy, chỉ bị bỏ kết quả.
+"""
+
+import asyncio
+from collections import deque
+from typing import Optional
+
+DEFAULT_HEDGE_PERCENTILE = 0.9
+DEFAULT_HEDGE_MAX_RATIO = 0.1
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+
+
+class LatencyTracker:
+    """Giữ latency của N request gần nhất để tính percentile"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class HedgePolicy:
+    """Quyết định khi nào gửi request dự phòng và chọn kết quả về trước"""
+
+    def __init__(self, percentile: float = DEFAULT_HEDGE_PERCENTILE, max_ratio: float = DEFAULT_HEDGE_MAX_RATIO,
+                 fixed_delay: Optional[float] = None, min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES,
+                 min_delay: float = DEFAULT_HEDGE_MIN_DELAY):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.fixed_delay = fixed_delay
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self.backup_wins = 0
+
+    def delay_for(self, provider) -> Optional[float]:
+        """Số giây chờ primary trước khi hedge (None = không hedge)"""
+        if len(provider.latency.samples) >= self.min_samples:
+            return max(self.min_delay, provider.latency.percentile(self.percentile))
+        return self.fixed_delay
+
+    def _within_budget(self) -> bool:
+        return self.hedges + 1 <= self.max_ratio * self.requests
+
+    @staticmethod
+    def _pick_backup(primary, candidates: list):
+        """Provider khác còn quota; nếu không có thì chính primary khi nó có nhiều key"""
+        for provider in candidates:
+            if provider is not primary and not provider.exhausted:
+                return provider
+        if len(getattr(primary, 'keys', ())) > 1 and not primary.exhausted:
+            return primary
+        return None
+
+    async def run(self, primary, candidates: list, prompt: str, system_prompt: Optional[str] = None) -> tuple:
+        """Gọi primary, hedge sang backup khi quá ngưỡng. Trả về (provider, content)"""
+        self.requests += 1
+        started = asyncio.Event()
+        keys = set()  # Key primary / backup đã dùng: backup cùng provider phải gọi bằng key khác
+        primary_task = asyncio.ensure_future(primary.generate(prompt, system_prompt, started, keys))
+        delay = self.delay_for(primary)
+        backup = self._pick_backup(primary, candidates)
+        if delay is None or backup is None:
+            return primary, await primary_task
+
+        # Ngưỡng tính từ lúc request thật sự được gửi, không tính thời gian chờ slot concurrency
+        started_task = asyncio.ensure_future(started.wait())
+        await asyncio.wait({primary_task, started_task}, return_when=asyncio.FIRST_COMPLETED)
+        started_task.cancel()
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done or not self._within_budget():
+            return primary, await primary_task
+
+        self.hedges += 1
+        print(f"   ⏱️ {primary.name} chưa trả lời sau {delay:.1f}s, gửi hedge sang {backup.name}")
+        backup_task = asyncio.ensure_future(backup.generate(prompt, system_prompt, keys=keys))
+        owners = {primary_task: primary, backup_task: backup}
+        pending = set(owners)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result():
+                        if task is backup_task:
+                            self.backup_wins += 1
+                        return owners[task], task.result()
+            return primary, None
+        finally:
+            # Hủy request còn lại (kết quả của nó không được dùng)
+            for task in owners:
+                if not task.done():
+                    task.cancel()
+
+    def summary(self) -> str:
+        rate = (self.hedges / self.requests * 100) if self.requests else 0.0
+        return f"Hedge: {self.hedges}/{self.requests} requests ({rate:.1f}%), backup về trước {self.backup_wins} lần"
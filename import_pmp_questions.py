@@ -4,11 +4,14 @@ PMP Questions Importer
 Parses PMP_Full_1400.md and imports questions to Supabase
 """
 
-import re
+import argparse
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from question_diff import CONTENT_HASH_COLUMN, QuestionDiff, changed_ids_path, content_hash, write_ids
+from question_parser import PMP_FORMAT, iter_unique, parse_file, parse_files_parallel, pmp_question
+
 # Load environment variables
 load_dotenv('.env.local')
 
@@ -22,94 +25,42 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 # Initialize Supabase client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def parse_pmp_questions(file_path: str):
+def parse_pmp_questions(file_path: str, workers: int = 1):
     """
     Parse PMP questions from markdown file
     
+    Args:
+        file_path: Markdown file
+        workers: Number of parser processes (1 = sequential, 0 = CPU count)
+    
     Returns:
         list: List of question dictionaries
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Split by question separator
-    question_blocks = content.split('## Exam PMP topic')
-    
-    questions = []
-    
-    for block in question_blocks[1:]:  # Skip first empty split
-        try:
-            # Extract question number
-            question_num_match = re.search(r'question (\d+)', block, re.IGNORECASE)
-            if not question_num_match:
-                continue
-            
-            question_id = question_num_match.group(1)
-            
-            # Extract question text (everything between [All PMP Questions] and first option)
-            question_text_match = re.search(
-                r'\[All PMP Questions\]\s*\n\n(.*?)\n\s*Suggested Answer:',
-                block,
-                re.DOTALL
-            )
-            
-            if not question_text_match:
-                print(f"⚠️  Skipping question {question_id}: Could not extract question text")
-                continue
-            
-            question_text = question_text_match.group(1).strip()
-            
-            # Extract options (A, B, C, D)
-            options = []
-            option_pattern = r'^([A-D])\.\s+(.+?)(?=\n[A-D]\.|$|\*\*Answer:)'
-            
-            # Find all options in the block
-            for match in re.finditer(option_pattern, block, re.MULTILINE | re.DOTALL):
-                letter = match.group(1)
-                text = match.group(2).strip()
-                # Clean up extra whitespace
-                text = re.sub(r'\s+', ' ', text)
-                options.append(f"{letter}. {text}")
-            
-            if len(options) < 2:
-                print(f"⚠️  Skipping question {question_id}: Found only {len(options)} options")
-                continue
-            
-            # Extract correct answer
-            answer_match = re.search(r'\*\*Answer:\s*([A-D]+)\*\*', block)
-            if not answer_match:
-                print(f"⚠️  Skipping question {question_id}: Could not find answer")
-                continue
-            
-            correct_answer = answer_match.group(1)
-            
-            # Determine if multiselect (answer has multiple letters)
-            is_multiselect = len(correct_answer) > 1
-            
-            # Extract ExamTopics discussion link
-            discussion_link = None
-            link_match = re.search(r'\[View on ExamTopics\]\((https://www\.examtopics\.com/[^\)]+)\)', block)
-            if link_match:
-                discussion_link = link_match.group(1)
-            
-            # Create question object
-            question = {
-                'id': question_id,
-                'question': question_text,
-                'options': options,
-                'correct_answer': correct_answer,
-                'is_multiselect': is_multiselect,
-                'discussion_link': discussion_link
-            }
-            
-            questions.append(question)
-            print(f"✅ Parsed question {question_id}: {len(options)} options, answer: {correct_answer}")
-            
-        except Exception as e:
-            print(f"❌ Error parsing question block: {str(e)}")
+    questions = {}
+    
+    # Parser một lượt dùng chung (question_parser.py); workers != 1: parse song song theo byte range
+    if workers != 1:
+        records = parse_files_parallel([file_path], PMP_FORMAT, workers or None)
+    else:
+        records = parse_file(file_path, PMP_FORMAT)
+    for raw in iter_unique(records):
+        question, problem = pmp_question(raw)
+        if problem:
+            print(f"⚠️  Skipping question {raw['id']}: {problem}")
             continue
-    
-    return questions
+        
+        question[CONTENT_HASH_COLUMN] = content_hash(question['question'], question['options'],
+                                                    question['correct_answer'], question['discussion_link'],
+                                                    question['is_multiselect'])
+        # Duplicate id: the last occurrence wins, at the position of the first one
+        questions[question['id']] = question
+        print(f"✅ Parsed question {question['id']}: {len(question['options'])} options, answer: {question['correct_answer']}")
+    
+    return list(questions.values())
+
+def _missing_column(error: Exception) -> bool:
+    """PostgREST PGRST204: a column in the payload does not exist in the table"""
+    return 'PGRST204' in str(error)
 
 def import_to_supabase(questions: list, batch_size: int = 50):
     """
@@ -121,6 +72,22 @@ def import_to_supabase(questions: list, batch_size: int = 50):
     """
     total = len(questions)
     print(f"\n📊 Total questions to import: {total}")
+    strip_hash = False
+    
+    def upsert(rows):
+        # Database without add_question_content_hash.sql: PGRST204 -> import without content_hash from then on
+        nonlocal strip_hash
+        if strip_hash:
+            rows = [{k: v for k, v in row.items() if k != CONTENT_HASH_COLUMN} for row in rows]
+        try:
+            return supabase.table('pmp_questions').upsert(rows, on_conflict='id').execute()
+        except Exception as e:
+            if strip_hash or not _missing_column(e):
+                raise
+            print(f"⚠️  pmp_questions has no {CONTENT_HASH_COLUMN} column (run add_question_content_hash.sql), "
+                  f"importing without it")
+            strip_hash = True
+            return upsert(rows)
     
     # Import in batches
     for i in range(0, total, batch_size):
@@ -129,10 +96,7 @@ def import_to_supabase(questions: list, batch_size: int = 50):
         total_batches = (total + batch_size - 1) // batch_size
         
         try:
-            response = supabase.table('pmp_questions').upsert(
-                batch,
-                on_conflict='id'
-            ).execute()
+            response = upsert(batch)
             
             print(f"✅ Batch {batch_num}/{total_batches}: Imported {len(batch)} questions (IDs: {batch[0]['id']}-{batch[-1]['id']})")
             
@@ -141,14 +105,52 @@ def import_to_supabase(questions: list, batch_size: int = 50):
             # Try individual inserts for this batch
             for question in batch:
                 try:
-                    supabase.table('pmp_questions').upsert(
-                        question,
-                        on_conflict='id'
-                    ).execute()
+                    upsert([question])
                     print(f"  ✅ Imported question {question['id']} individually")
                 except Exception as e2:
                     print(f"  ❌ Failed to import question {question['id']}: {str(e2)}")
 
+def fetch_content_hashes(page_size: int = 1000):
+    """
+    Fetch {id: content_hash} of the questions already in pmp_questions
+    
+    Returns:
+        dict, or None if content_hash cannot be read (add_question_content_hash.sql not run yet)
+    """
+    existing = {}
+    start = 0
+    try:
+        while True:
+            response = supabase.table('pmp_questions').select(f'id, {CONTENT_HASH_COLUMN}') \
+                .order('id').range(start, start + page_size - 1).execute()
+            for row in response.data:
+                existing[row['id']] = row[CONTENT_HASH_COLUMN]
+            if len(response.data) < page_size:
+                return existing
+            start += page_size
+    except Exception as e:
+        print(f"❌ Could not read content hashes: {str(e)}")
+        print("   Run add_question_content_hash.sql in Supabase first")
+        return None
+
+def invalidate_ai_cache(question_ids: list, chunk_size: int = 100):
+    """
+    Clear prompt_hash of the pmp_ai_cache rows of edited questions, so that
+    `cache_ai.py --ids FILE --exam pmp --stale-only` regenerates exactly those rows
+    (--ids is needed: rows cached before fingerprints existed also have no prompt_hash).
+    The old content keeps being served until then.
+    """
+    invalidated = 0
+    for i in range(0, len(question_ids), chunk_size):
+        chunk = question_ids[i:i + chunk_size]
+        try:
+            response = supabase.table('pmp_ai_cache').update({'prompt_hash': None}) \
+                .in_('question_id', chunk).execute()
+            invalidated += len(response.data)
+        except Exception as e:
+            print(f"❌ Error invalidating cache for questions {chunk[0]}-{chunk[-1]}: {str(e)}")
+    return invalidated
+
 def verify_import():
     """Verify the import by counting records"""
     try:
@@ -168,11 +170,27 @@ def verify_import():
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Parse PMP markdown and import into pmp_questions')
+    parser.add_argument('file', nargs='?', default='PMP_Full_1400.md', help='Markdown file (default: PMP_Full_1400.md)')
+    parser.add_argument('--workers', type=int, default=1, help='Parser processes (default: 1 = sequential, 0 = CPU count)')
+    parser.add_argument('--diff', action='store_true',
+                        help='Compare content hashes with the database and only import new or edited questions')
+    parser.add_argument('--changed-ids', metavar='FILE', default=changed_ids_path('pmp_questions'),
+                        help='With --diff: file for the ids of edited questions, read by cache_ai.py --ids '
+                             f"(default: {changed_ids_path('pmp_questions')})")
+    parser.add_argument('--keep-cache', action='store_true',
+                        help='With --diff: do not mark pmp_ai_cache rows of edited questions stale')
+    args = parser.parse_args()
+    
+    if args.keep_cache and not args.diff:
+        print("❌ --keep-cache requires --diff")
+        return
+    
     print("🚀 PMP Questions Importer")
     print("=" * 50)
     
     # Check if file exists
-    file_path = 'PMP_Full_1400.md'
+    file_path = args.file
     if not os.path.exists(file_path):
         print(f"❌ File not found: {file_path}")
         return
@@ -180,7 +198,7 @@ def main():
     print(f"📖 Reading file: {file_path}")
     
     # Parse questions
-    questions = parse_pmp_questions(file_path)
+    questions = parse_pmp_questions(file_path, args.workers)
     
     if not questions:
         print("❌ No questions parsed. Please check the file format.")
@@ -188,6 +206,21 @@ def main():
     
     print(f"\n✅ Successfully parsed {len(questions)} questions")
     
+    diff = None
+    if args.diff:
+        existing = fetch_content_hashes()
+        if existing is None:
+            return
+        print(f"\n🔎 {len(existing)} questions in database")
+        diff = QuestionDiff(existing)
+        questions = list(diff.filter(questions, lambda q: q['id'], lambda q: q[CONTENT_HASH_COLUMN]))
+        diff.report()
+        write_ids(args.changed_ids, diff.regenerate_ids)
+        print(f"📝 {len(diff.regenerate_ids)} ids with pmp_ai_cache to regenerate -> {args.changed_ids}")
+        if not questions:
+            print("\n✅ Database is up to date, nothing to import")
+            return
+    
     # Confirm before importing
     print("\n⚠️  Ready to import to Supabase database")
     response = input("Continue? (yes/no): ").strip().lower()
@@ -200,6 +233,16 @@ def main():
     print("\n📤 Importing to Supabase...")
     import_to_supabase(questions)
     
+    if diff and diff.regenerate_ids:
+        regenerate = diff.regenerate_ids
+        if args.keep_cache:
+            print(f"\n⚠️  pmp_ai_cache of {len(regenerate)} edited questions was kept (--keep-cache), "
+                  f"regenerate with: python cache_ai.py --ids {args.changed_ids} --exam pmp --force")
+        else:
+            invalidated = invalidate_ai_cache(regenerate)
+            print(f"\n🧹 Marked {invalidated} pmp_ai_cache rows stale for {len(regenerate)} edited questions")
+            print(f"👉 Regenerate: python cache_ai.py --ids {args.changed_ids} --exam pmp --stale-only")
+    
     # Verify
     verify_import()
     
@@ -0,0 +1,142 @@
+"""
+Local LLM Response Cache
+------------------------
+Cache kết quả LLM trên disk (SQLite), đặt trước call_gemini / call_openai /
+call_huggingface. Khi script chết sau lúc gọi API nhưng trước khi lưu vào
+Supabase, hoặc khi chạy lại với --force, kết quả đã trả tiền không bị gọi lại.
+
+- Key = sha256(provider, model, prompt, params) -> content-addressed, prompt
+  hoặc tham số đổi thì key đổi.
+- Eviction theo tuổi (max_age_days) và theo dung lượng (max_mb, xóa entry ít
+  dùng gần đây nhất trước).
+- Đếm hit/miss cho mỗi lần chạy.
+
+Cấu hình qua environment:
+    LLM_CACHE=0                       # Tắt cache
+    LLM_CACHE_PATH=.llm_cache.sqlite3
+    LLM_CACHE_MAX_MB=200
+    LLM_CACHE_MAX_AGE_DAYS=30
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.getenv('LLM_CACHE_PATH') or '.llm_cache.sqlite3'
+DEFAULT_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB') or 200)
+DEFAULT_MAX_AGE_DAYS = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS') or 30)
+EVICT_EVERY = 100  # Chạy eviction sau mỗi N lần put
+
+
+def cache_enabled() -> bool:
+    return (os.getenv('LLM_CACHE') or '1').lower() not in ('0', 'false', 'no')
+
+
+def cache_key(provider: str, model: str, prompt: str, params: Optional[dict] = None) -> str:
+    payload = json.dumps(
+        {'provider': provider, 'model': model, 'prompt': prompt, 'params': params or {}},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite cache cho LLM responses với eviction theo tuổi và dung lượng"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_mb: float = DEFAULT_MAX_MB,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS, enabled: Optional[bool] = None):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 86400
+        self.enabled = cache_enabled() if enabled is None else enabled
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at)")
+            self._conn.commit()
+            self.evict()
+
+    def get(self, provider: str, model: str, prompt: str, params: Optional[dict] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = cache_key(provider, model, prompt, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.max_age_seconds:
+                self._conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, provider: str, model: str, prompt: str, content: str, params: Optional[dict] = None):
+        if not self.enabled or not content:
+            return
+        key = cache_key(provider, model, prompt, params)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, content, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, content, len(content.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Xóa entries quá hạn, sau đó xóa entries ít dùng nhất cho tới khi dưới max_bytes"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                to_free = total - self.max_bytes
+                freed = 0
+                keys = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used_at ASC"):
+                    keys.append((key,))
+                    freed += size
+                    if freed >= to_free:
+                        break
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+            self._conn.commit()
+
+    def summary(self) -> str:
+        if not self.enabled:
+            return "LLM cache: tắt"
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"LLM cache: {self.hits} hits / {self.misses} misses ({rate:.0f}% hit rate)"
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self.enabled = False
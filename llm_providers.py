@@ -0,0 +1,555 @@
+"""
+LLM Providers
+-------------
+Interface chung cho các LLM backend (Gemini, OpenAI, Hugging Face) để cache_ai.py
+chia tasks cho nhiều provider trong cùng một lần chạy. Mỗi provider tự giữ giới
+hạn concurrency / rate limit của mình, nên throughput tổng là tổng của các provider
+thay vì bị chặn ở limit của một vendor.
+
+Thêm provider mới:
+    @register_provider
+    class MyProvider(LLMProvider):
+        name = 'my'
+
+        @classmethod
+        def from_env(cls, cache=None): ...      # None nếu chưa cấu hình
+
+        async def _complete(self, prompt, system_prompt): ...
+
+Chế độ stream (--stream): provider đọc response theo chunk, dừng sớm khi output sai
+format (xem stream_guard.py) và ghi TTFT / tokens/giây.
+
+Metrics (--metrics): mỗi lần generate() ghi một record phase 'llm' (xem run_metrics.py);
+_complete() báo key / retries / tokens của lần gọi bằng note_call().
+
+Cấu hình qua environment:
+    GEMINI_API_KEYS=k1,k2  GEMINI_MODEL  GEMINI_RPM  GEMINI_RPD  GEMINI_QUOTA_LEDGER
+    OPENAI_API_KEY         OPENAI_MODEL  OPENAI_CONCURRENCY=4
+    HUGGINGFACE_API_KEY    HF_MODEL      HF_CONCURRENCY=1
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from hedging import LatencyTracker
+from llm_cache import LLMResponseCache
+from stream_guard import MalformedOutput, StreamCollector, StreamStats, estimate_tokens
+from rate_limiter import KeyRateLimiter, QuotaLedger, DEFAULT_RPM, DEFAULT_RPD, DEFAULT_LEDGER_PATH
+from sharding import shard_slice
+
+try:
+    from google import genai
+except ImportError:
+    genai = None
+
+try:
+    from openai import OpenAI
+except ImportError:
+    OpenAI = None
+
+try:
+    from huggingface_hub import InferenceClient
+except ImportError:
+    InferenceClient = None
+
+# System prompt mặc định cho API dạng chat khi bộ đề không có system prompt riêng
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+PROVIDERS = {}
+
+# Thông tin của lần gọi hiện tại (key, retries, tokens), _complete() cập nhật qua note_call().
+# asyncio.to_thread copy context nên thread của SDK sync cũng cập nhật được cùng dict
+_call_info = contextvars.ContextVar('llm_call_info', default=None)
+
+# Tập key dùng chung giữa primary và backup của một hedge (HedgePolicy.run truyền qua generate(keys=...)):
+# provider nhiều key bỏ qua các key đã có trong tập và thêm key mình dùng, để backup không gọi trùng key của primary
+_shared_keys = contextvars.ContextVar('llm_shared_keys', default=None)
+
+
+def note_call(**fields):
+    """Ghi key / retries / tokens của lần gọi đang chạy (bỏ qua giá trị None)"""
+    info = _call_info.get()
+    if info is not None:
+        info.update({k: v for k, v in fields.items() if v is not None})
+
+
+def gemini_usage(response) -> dict:
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return {}
+    return {'prompt_tokens': usage.prompt_token_count, 'completion_tokens': usage.candidates_token_count}
+
+
+def chat_usage(response) -> dict:
+    """Usage của chat completion (OpenAI / HF cùng format)"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    return {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens}
+
+
+class ClientPool:
+    """Một SDK client cho mỗi API key: tạo lần đầu dùng, dùng lại cho mọi request / retry
+    (giữ connection pool + auth setup), an toàn khi gọi từ nhiều worker / thread"""
+
+    def __init__(self, factory: Callable):
+        self.factory = factory
+        self.clients = {}
+        self.created = 0
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str):
+        client = self.clients.get(api_key)
+        if client is None:
+            with self._lock:
+                client = self.clients.get(api_key)
+                if client is None:
+                    client = self.factory(api_key)
+                    self.clients[api_key] = client
+                    self.created += 1
+        return client
+
+    async def aclose(self):
+        """Đóng mọi client (cả phần async của genai.Client)"""
+        with self._lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
+            try:
+                aio = getattr(client, 'aio', None)
+                if aio is not None and hasattr(aio, 'aclose'):
+                    await aio.aclose()
+                if hasattr(client, 'close'):
+                    client.close()
+            except Exception as e:
+                print(f"   ⚠️ Đóng client lỗi: {e}")
+
+
+def register_provider(cls):
+    """Decorator đăng ký provider theo cls.name"""
+    PROVIDERS[cls.name] = cls
+    return cls
+
+
+def load_providers(names: list, cache: Optional[LLMResponseCache] = None) -> list:
+    """Khởi tạo các provider theo tên (bỏ qua provider chưa cấu hình / thiếu SDK)"""
+    providers = []
+    for name in names:
+        cls = PROVIDERS.get(name)
+        if cls is None:
+            print(f"⚠️ Provider không hỗ trợ: {name} (có: {', '.join(PROVIDERS)})")
+            continue
+        provider = cls.from_env(cache)
+        if provider is not None:
+            providers.append(provider)
+    return providers
+
+
+class LLMProvider:
+    """Base class: cache local + semaphore concurrency, subclass chỉ cần _complete()"""
+
+    name = ''
+
+    def __init__(self, model: str, concurrency: int, cache: Optional[LLMResponseCache] = None):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self.exhausted = False  # True khi provider không thể nhận thêm request (VD: hết quota ngày)
+        self.calls = 0
+        self.latency = LatencyTracker()  # Latency các lần gọi API thành công (dùng cho hedging)
+        self.clients = None  # ClientPool của provider (nếu có)
+        self.streaming = False
+        self.stream_stats = StreamStats()
+        self.metrics = None  # MetricsRecorder (run_metrics.py), gán bởi cache_ai.py
+        self._semaphore = None
+
+    @classmethod
+    def from_env(cls, cache: Optional[LLMResponseCache] = None) -> Optional['LLMProvider']:
+        raise NotImplementedError
+
+    def request_params(self, system_prompt: Optional[str] = None) -> dict:
+        """Các tham số ảnh hưởng tới output (dùng cho key LLM cache và prompt fingerprint)"""
+        return {}
+
+    def cached(self, prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+        """Kết quả đã có trong LLM cache local (không gọi API)"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.name, self.model, prompt, self.request_params(system_prompt))
+
+    def remember(self, prompt: str, system_prompt: Optional[str], content: str):
+        if self.cache is not None:
+            self.cache.put(self.name, self.model, prompt, content, self.request_params(system_prompt))
+
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                       started: Optional[asyncio.Event] = None, keys: Optional[set] = None) -> Optional[str]:
+        """started (optional) được set khi request thật sự bắt đầu gọi API (sau khi có slot concurrency).
+        keys (optional): tập key dùng chung với request song song (hedge), không dùng lại key đã có trong tập"""
+        cached = self.cached(prompt, system_prompt)
+        if cached:
+            self._record('local_cache', 0.0, {})
+            return cached
+        if self.exhausted:
+            return None
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            if started is not None:
+                started.set()
+            self.calls += 1
+            info = {}
+            token = _call_info.set(info)
+            keys_token = _shared_keys.set(keys)
+            status, content = 'failed', None
+            begin = time.monotonic()
+            try:
+                content = await self._complete(prompt, system_prompt)
+            except MalformedOutput as e:
+                # Không lưu output sai format; task sẽ được thử với provider khác / lần chạy sau
+                self.stream_stats.aborted += 1
+                print(f"   ✂️ {self.name}: dừng stream sớm, {e}")
+                content = None
+                status = 'aborted'
+            except asyncio.CancelledError:
+                status = 'cancelled'  # Bị hủy bởi hedge
+                raise
+            finally:
+                _call_info.reset(token)
+                _shared_keys.reset(keys_token)
+                elapsed = time.monotonic() - begin
+                if info.get('tokens_estimated') and 'prompt_tokens' not in info:
+                    info['prompt_tokens'] = estimate_tokens(prompt + (system_prompt or ''))
+                self._record('ok' if content else status, elapsed, info)
+            if content:
+                self.latency.record(elapsed)
+
+        if content:
+            self.remember(prompt, system_prompt, content)
+        return content
+
+    def _record(self, status: str, seconds: float, info: dict):
+        if self.metrics is not None:
+            self.metrics.record('llm', status, seconds, provider=self.name, model=self.model, **info)
+
+    async def _complete(self, prompt: str, system_prompt: Optional[str]) -> Optional[str]:
+        raise NotImplementedError
+
+    async def _collect_stream(self, stream, extract: Callable, started_at: float) -> str:
+        """Đọc async stream qua StreamCollector (raise MalformedOutput, luôn đóng stream).
+        started_at: time.monotonic() ngay trước khi gửi request, TTFT tính từ đó"""
+        collector = StreamCollector(started_at)
+        try:
+            async for chunk in stream:
+                collector.feed(extract(chunk))
+            collector.finish()
+        finally:
+            if hasattr(stream, 'aclose'):
+                await stream.aclose()
+        self.stream_stats.record(collector)
+        note_call(completion_tokens=estimate_tokens(collector.text()), tokens_estimated=True)
+        return collector.text()
+
+    def _collect_stream_sync(self, stream, extract: Callable, started_at: float) -> str:
+        """Như _collect_stream cho SDK sync (chạy trong thread)"""
+        collector = StreamCollector(started_at)
+        try:
+            for chunk in stream:
+                collector.feed(extract(chunk))
+            collector.finish()
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        self.stream_stats.record(collector)
+        note_call(completion_tokens=estimate_tokens(collector.text()), tokens_estimated=True)
+        return collector.text()
+
+    def apply_shard(self, shard: tuple):
+        """--shard i/n: chỉ dùng phần tài nguyên (API keys) của shard này.
+        Mặc định provider một key dùng chung cho mọi shard"""
+
+    async def aclose(self):
+        if self.clients is not None:
+            await self.clients.aclose()
+
+    def describe(self) -> str:
+        return f"{self.name} ({self.model}, concurrency {self.concurrency})"
+
+    def status(self) -> str:
+        """Một dòng trạng thái in cuối lần chạy (quota còn lại, stream metrics, ...)"""
+        line = f"{self.name}: {self.calls} API calls"
+        if self.streaming:
+            line += f", {self.stream_stats.summary()}"
+        return line
+
+
+def chat_delta(chunk) -> Optional[str]:
+    """Text của một chunk chat completion (OpenAI / HF cùng format)"""
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+
+def get_gemini_keys() -> list:
+    """Lấy danh sách Gemini API keys từ environment"""
+    keys_string = os.getenv('GEMINI_API_KEYS') or os.getenv('VITE_GOOGLE_API_KEYS') or ''
+    keys = [k.strip() for k in keys_string.split(',') if k.strip()]
+
+    # Fallback to single key
+    if not keys:
+        single_key = os.getenv('GEMINI_API_KEY') or os.getenv('VITE_GEMINI_API_KEY')
+        if single_key:
+            keys = [single_key]
+
+    return keys
+
+
+@register_provider
+class GeminiProvider(LLMProvider):
+    """Gemini (async), chọn key theo rate limiter RPM/RPD"""
+
+    name = 'gemini'
+
+    def __init__(self, keys: list, model: str, rate_limiter: KeyRateLimiter, concurrency: Optional[int] = None,
+                 cache: Optional[LLMResponseCache] = None, max_retries: int = 3):
+        super().__init__(model, concurrency or len(keys), cache)
+        self.keys = keys
+        self.auto_concurrency = concurrency is None  # Concurrency = số keys (chưa cấu hình GEMINI_CONCURRENCY)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.clients = ClientPool(lambda api_key: genai.Client(api_key=api_key))
+
+    @classmethod
+    def from_env(cls, cache: Optional[LLMResponseCache] = None) -> Optional['GeminiProvider']:
+        keys = get_gemini_keys()
+        if not keys:
+            print("⚠️ gemini: GEMINI_API_KEYS chưa được cấu hình, bỏ qua")
+            return None
+        if genai is None:
+            print("⚠️ gemini: chưa cài google-genai (pip install google-genai), bỏ qua")
+            return None
+
+        rate_limiter = KeyRateLimiter(
+            keys,
+            int(os.getenv('GEMINI_RPM') or DEFAULT_RPM),
+            int(os.getenv('GEMINI_RPD') or DEFAULT_RPD),
+            QuotaLedger(os.getenv('GEMINI_QUOTA_LEDGER') or DEFAULT_LEDGER_PATH)
+        )
+        provider = cls(keys, os.getenv('GEMINI_MODEL') or 'gemini-2.0-flash-exp', rate_limiter,
+                       int(os.getenv('GEMINI_CONCURRENCY') or 0) or None, cache)
+        provider.exhausted = not rate_limiter.available_keys()
+        return provider
+
+    def request_params(self, system_prompt: Optional[str] = None) -> dict:
+        return {'system': system_prompt} if system_prompt else {}
+
+    def apply_shard(self, shard: tuple):
+        """Shard i/n dùng keys[i-1::n], các shard không tranh quota của cùng một key"""
+        keys = shard_slice(self.keys, shard)
+        if not keys:
+            print(f"⚠️ gemini: shard {shard[0]}/{shard[1]} không có key nào ({len(self.keys)} keys < {shard[1]} shards)")
+        self.keys = keys
+        self.rate_limiter = KeyRateLimiter(keys, self.rate_limiter.rpm, self.rate_limiter.rpd, self.rate_limiter.ledger)
+        if self.auto_concurrency:
+            self.concurrency = max(1, len(keys))
+        self.exhausted = not self.rate_limiter.available_keys()
+
+    async def _complete(self, prompt: str, system_prompt: Optional[str]) -> Optional[str]:
+        config = {'system_instruction': system_prompt} if system_prompt else None
+        tried_keys = set()
+        attempts = 0
+        shared_keys = _shared_keys.get()
+
+        while True:
+            # Chờ key còn token thay vì round-robin rồi mới phát hiện 429; bỏ qua key request song song đang dùng
+            api_key = await self.rate_limiter.acquire(exclude=tried_keys | (shared_keys or set()))
+            if api_key is None:
+                break
+            if shared_keys is not None:
+                shared_keys.add(api_key)
+
+            key_suffix = api_key[-6:]  # Last 6 chars for logging
+            tried_keys.add(api_key)
+
+            for attempt in range(self.max_retries):
+                if attempt > 0 and not await self.rate_limiter.acquire_key(api_key):
+                    break  # Key hết quota ngày
+
+                attempts += 1
+                note_call(key=key_suffix, retries=attempts - 1)
+                try:
+                    client = self.clients.get(api_key)
+                    if self.streaming:
+                        started_at = time.monotonic()
+                        stream = await client.aio.models.generate_content_stream(
+                            model=self.model,
+                            contents=prompt,
+                            config=config
+                        )
+                        return await self._collect_stream(stream, lambda chunk: chunk.text, started_at)
+                    response = await client.aio.models.generate_content(
+                        model=self.model,
+                        contents=prompt,
+                        config=config
+                    )
+                    note_call(**gemini_usage(response))
+                    return response.text
+                except MalformedOutput:
+                    raise
+                except Exception as e:
+                    error_str = str(e).lower()
+
+                    # If quota exceeded or rate limited, try next key
+                    if 'quota' in error_str or 'rate' in error_str or '429' in error_str:
+                        print(f"   ⚠️ Key ...{key_suffix} rate limited, switching to next key...")
+                        self.rate_limiter.report_rate_limited(api_key, error_str)
+                        break  # Break inner loop, try next key
+
+                    print(f"   ⚠️ Attempt {attempt + 1} with key ...{key_suffix} failed: {e}")
+
+                    if attempt < self.max_retries - 1:
+                        wait_time = (attempt + 1) * 2
+                        print(f"   ⏳ Waiting {wait_time}s before retry...")
+                        await asyncio.sleep(wait_time)
+
+        if not tried_keys and shared_keys:
+            return None  # Các key còn quota đều đang được request song song của hedge dùng
+        if not self.rate_limiter.available_keys():
+            self.exhausted = True
+            print(f"   ❌ gemini: tất cả {len(self.keys)} keys đã hết quota hôm nay")
+        else:
+            print(f"   ❌ gemini: tất cả {len(self.keys)} keys đều lỗi")
+        return None
+
+    def describe(self) -> str:
+        return (f"gemini ({self.model}, {len(self.keys)} keys, {len(self.rate_limiter.available_keys())} còn quota, "
+                f"{self.rate_limiter.rpm} RPM / {self.rate_limiter.rpd} RPD mỗi key)")
+
+    def status(self) -> str:
+        return f"{super().status()}, quota còn lại hôm nay: {self.rate_limiter.summary()}"
+
+
+@register_provider
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions (SDK sync, chạy trong thread)"""
+
+    name = 'openai'
+
+    def __init__(self, api_key: str, model: str, concurrency: int, cache: Optional[LLMResponseCache] = None,
+                 params: Optional[dict] = None, max_retries: int = 3):
+        super().__init__(model, concurrency, cache)
+        self.api_key = api_key
+        self.params = params or {'temperature': 0.7, 'max_tokens': 1500}
+        self.max_retries = max_retries
+        self.clients = ClientPool(lambda key: OpenAI(api_key=key))
+
+    @classmethod
+    def from_env(cls, cache: Optional[LLMResponseCache] = None) -> Optional['OpenAIProvider']:
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            print("⚠️ openai: OPENAI_API_KEY chưa được cấu hình, bỏ qua")
+            return None
+        if OpenAI is None:
+            print("⚠️ openai: chưa cài openai (pip install openai), bỏ qua")
+            return None
+        return cls(api_key, os.getenv('OPENAI_MODEL') or 'gpt-4o-mini',
+                   int(os.getenv('OPENAI_CONCURRENCY') or 4), cache)
+
+    def request_params(self, system_prompt: Optional[str] = None) -> dict:
+        return {**self.params, 'system': system_prompt or DEFAULT_SYSTEM_PROMPT}
+
+    async def _complete(self, prompt: str, system_prompt: Optional[str]) -> Optional[str]:
+        return await asyncio.to_thread(self._complete_sync, prompt, system_prompt or DEFAULT_SYSTEM_PROMPT)
+
+    def _complete_sync(self, prompt: str, system_prompt: str) -> Optional[str]:
+        client = self.clients.get(self.api_key)
+
+        for attempt in range(self.max_retries):
+            note_call(key=self.api_key[-6:], retries=attempt)
+            try:
+                started_at = time.monotonic()
+                response = client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ],
+                    stream=self.streaming,
+                    **self.params
+                )
+                if self.streaming:
+                    return self._collect_stream_sync(response, chat_delta, started_at)
+                note_call(**chat_usage(response))
+                return response.choices[0].message.content
+            except MalformedOutput:
+                raise
+            except Exception as e:
+                print(f"   ⚠️ openai attempt {attempt + 1} failed: {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep((attempt + 1) * 2)
+
+        print("   ❌ OpenAI API call failed after retries")
+        return None
+
+
+@register_provider
+class HuggingFaceProvider(LLMProvider):
+    """Hugging Face Inference (chat_completion, SDK sync chạy trong thread)"""
+
+    name = 'huggingface'
+
+    def __init__(self, api_key: str, model: str, concurrency: int, cache: Optional[LLMResponseCache] = None,
+                 params: Optional[dict] = None, min_interval: float = 1.0):
+        super().__init__(model, concurrency, cache)
+        self.api_key = api_key
+        # Temperature thấp để đảm bảo tính logic và bám sát prompt
+        self.params = params or {'max_tokens': 2000, 'temperature': 0.1}
+        self.min_interval = min_interval  # Nghỉ giữa các request để tránh rate limit API
+        self.clients = ClientPool(lambda key: InferenceClient(api_key=key))
+
+    @classmethod
+    def from_env(cls, cache: Optional[LLMResponseCache] = None) -> Optional['HuggingFaceProvider']:
+        api_key = os.getenv('HUGGINGFACE_API_KEY')
+        if not api_key:
+            print("⚠️ huggingface: HUGGINGFACE_API_KEY chưa được cấu hình, bỏ qua")
+            return None
+        if InferenceClient is None:
+            print("⚠️ huggingface: chưa cài huggingface_hub (pip install huggingface_hub), bỏ qua")
+            return None
+        # Khuyến nghị Qwen2.5-72B để tuân thủ định dạng tốt nhất
+        return cls(api_key, os.getenv('HF_MODEL') or 'meta-llama/Llama-3.1-70B-Instruct',
+                   int(os.getenv('HF_CONCURRENCY') or 1), cache)
+
+    def request_params(self, system_prompt: Optional[str] = None) -> dict:
+        return {**self.params, 'system': system_prompt or DEFAULT_SYSTEM_PROMPT}
+
+    async def _complete(self, prompt: str, system_prompt: Optional[str]) -> Optional[str]:
+        content = await asyncio.to_thread(self._complete_sync, prompt, system_prompt or DEFAULT_SYSTEM_PROMPT)
+        await asyncio.sleep(self.min_interval)
+        return content
+
+    def _complete_sync(self, prompt: str, system_prompt: str) -> Optional[str]:
+        client = self.clients.get(self.api_key)
+        note_call(key=self.api_key[-6:])
+        try:
+            started_at = time.monotonic()
+            response = client.chat_completion(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                stream=self.streaming,
+                **self.params
+            )
+            if self.streaming:
+                return self._collect_stream_sync(response, chat_delta, started_at)
+            note_call(**chat_usage(response))
+            return response.choices[0].message.content
+        except MalformedOutput:
+            raise
+        except Exception as e:
+            print(f"   ⚠️ huggingface API Error: {str(e)[:100]}...")
+            return None
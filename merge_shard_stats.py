@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Gộp stats của các shard (cache_ai.py --shard i/n)
+------------------------------------------------
+Mỗi shard ghi stats vào <CACHE_AI_JOURNAL_DIR>/<exam>_<range>_<lang>_<type>_shard-i-of-n.stats.json.
+Copy các file này từ các máy về một thư mục rồi chạy:
+
+    python merge_shard_stats.py                     # Đọc .cache_ai_runs/*.stats.json
+    python merge_shard_stats.py stats/              # Đọc thư mục khác
+    python merge_shard_stats.py a.stats.json b.stats.json
+    python merge_shard_stats.py --json              # In kết quả dạng JSON
+
+Các file được nhóm theo run (exam / range / ngôn ngữ / loại), mỗi run in một bảng kết quả
+và cảnh báo nếu còn shard chưa có stats.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+from run_journal import DEFAULT_JOURNAL_DIR
+from sharding import merge_shard_stats
+
+
+def collect_files(paths: list) -> list:
+    files = []
+    for path in paths or [DEFAULT_JOURNAL_DIR]:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.stats.json'))))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gộp stats của các shard cache_ai.py')
+    parser.add_argument('paths', nargs='*', help=f'File .stats.json hoặc thư mục (default: {DEFAULT_JOURNAL_DIR})')
+    parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+    args = parser.parse_args()
+
+    runs = {}
+    for path in collect_files(args.paths):
+        with open(path, 'r', encoding='utf-8') as f:
+            item = json.load(f)
+        run = item['run']
+        key = (run['exam'], run['start'], run['end'], tuple(run['languages']), tuple(run['content_types']),
+               item['shard'][1])
+        runs.setdefault(key, []).append(item)
+
+    if not runs:
+        print("❌ Không tìm thấy file stats nào")
+        sys.exit(1)
+
+    results = []
+    for (exam, start, end, languages, content_types, count), items in sorted(runs.items()):
+        try:
+            merged = merge_shard_stats(items)
+        except ValueError as e:
+            print(f"❌ {exam} {start}-{end}: {e}")
+            sys.exit(1)
+        merged['run'] = {'exam': exam, 'start': start, 'end': end, 'languages': list(languages),
+                         'content_types': list(content_types), 'shards': count}
+        results.append(merged)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    for merged in results:
+        run, stats = merged['run'], merged['stats']
+        by_provider = ', '.join(f"{name}: {count}" for name, count in stats['by_provider'].items())
+        print(f"""
+╔══════════════════════════════════════════════════════════════╗
+║  {run['exam'].upper()} {run['start']}-{run['end']} ({'+'.join(run['languages'])}, {'+'.join(run['content_types'])})
+║  Shards: {len(merged['shards'])}/{run['shards']} trên {len(merged['hosts'])} máy ({', '.join(merged['hosts'])})
+╠══════════════════════════════════════════════════════════════╣
+║  ✅ Thành công: {stats['success']:>5}
+║  📦 Đã có cache: {stats['cached']:>5}
+║  ♻️ Dùng lại (câu trùng): {stats['deduped']:>5}
+║  ❌ Thất bại: {stats['failed']:>5}
+║  📊 Tổng tasks: {stats['success'] + stats['cached'] + stats['failed']:>5}
+║  🤖 Theo provider: {by_provider}
+║  ⏱️ Shard chậm nhất: {merged['elapsed']:.0f}s
+╚══════════════════════════════════════════════════════════════╝""")
+        if merged['missing']:
+            missing = ', '.join(f"{index}/{run['shards']}" for index in merged['missing'])
+            print(f"⚠️ Chưa có stats của shard: {missing}")
+
+
+if __name__ == '__main__':
+    main()
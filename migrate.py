@@ -1,8 +1,12 @@
+import argparse
 import os
-import re
+import time
 import psycopg2
 from psycopg2.extras import execute_values
 
+from question_diff import QuestionDiff, changed_ids_path, content_hash, write_ids
+from question_parser import SAA_FORMAT, iter_unique, parse_file, parse_files_parallel
+
 # Database connection configuration
 DB_CONFIG = {
     'dbname': 'postgres',
@@ -12,26 +16,30 @@ DB_CONFIG = {
     'port': 6543
 }
 
-def get_db_connection():
+def get_db_connection(dsn=None):
+    # dsn: connection string khác DB_CONFIG (VD database local để benchmark)
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = psycopg2.connect(dsn) if dsn else psycopg2.connect(**DB_CONFIG)
         return conn
     except Exception as e:
         print(f"❌ Connection error: {e}")
         return None
 
-def create_table_if_not_exists(conn):
-    schema_questions = """
-    CREATE TABLE IF NOT EXISTS questions (
+def create_table_if_not_exists(conn, table='questions'):
+    schema_questions = f"""
+    CREATE TABLE IF NOT EXISTS {table} (
         id text PRIMARY KEY,
+        id_num integer GENERATED ALWAYS AS (NULLIF(regexp_replace(id, '\\D', '', 'g'), '')::integer) STORED,
         topic text,
         question text,
         options text[],
         correct_answer text,
         discussion_link text,
         is_multiselect boolean DEFAULT false,
+        content_hash text,
         created_at timestamp with time zone DEFAULT now()
     );
+    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_hash text;
     """
     
     schema_ai_cache = """
@@ -41,7 +49,10 @@ def create_table_if_not_exists(conn):
         language text NOT NULL, 
         type text NOT NULL CHECK (type IN ('explanation', 'theory')),
         content text NOT NULL,
-        created_at timestamp with time zone DEFAULT now()
+        prompt_hash text,
+        model text,
+        created_at timestamp with time zone DEFAULT now(),
+        CONSTRAINT ai_cache_unique_question_lang_type UNIQUE (question_id, language, type)
     );
     
     -- Create index for faster lookups
@@ -49,144 +60,349 @@ def create_table_if_not_exists(conn):
     ON ai_cache(question_id, language, type);
     """
 
+    # Bảng ai_cache tạo bởi bản cũ của script chưa có UNIQUE: upsert on_conflict của cache_writer cần constraint này
+    ai_cache_unique = """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint WHERE conrelid = 'ai_cache'::regclass AND contype = 'u'
+        ) THEN
+            ALTER TABLE ai_cache
+            ADD CONSTRAINT ai_cache_unique_question_lang_type UNIQUE (question_id, language, type);
+        END IF;
+    END $$;
+    """
+
     try:
         with conn.cursor() as cur:
             cur.execute(schema_questions)
             cur.execute(schema_ai_cache)
         conn.commit()
-        print("✅ Tables 'questions' and 'ai_cache' match schema.")
+        print(f"✅ Tables '{table}' and 'ai_cache' match schema.")
     except Exception as e:
         conn.rollback()
         print(f"❌ Error creating tables: {e}")
+        return
 
-def parse_markdown_file(file_path):
-    print(f"📖 Reading file: {file_path}")
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ai_cache_unique)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Không thêm được UNIQUE (question_id, language, type) cho ai_cache "
+              f"(chạy fix_duplicate_cache.sql để xoá cache trùng): {str(e).strip().splitlines()[0]}")
 
-    questions = []
-    # Split by separator line
-    blocks = content.split('----------------------------------------')
-    
-    print(f"🔍 Found {len(blocks)} blocks. Parsing...")
-    
-    for block in blocks:
-        block = block.strip()
-        if not block: continue
-            
-        id_match = re.search(r'## Exam .* question (\d+) discussion', block)
-        if not id_match: continue
-        
-        suggested_match = re.search(r'Suggested Answer:\s+([A-Z]+)', block)
-        official_match = re.search(r'\*\*Answer:\s+([A-Z]+)\*\*', block)
-        topic_match = re.search(r'Topic #:\s+(\d+)', block)
-        link_match = re.search(r'\[View on ExamTopics\]\((.*?)\)', block)
-        
-        lines = block.split('\n')
-        
-        # Options extraction
-        opt_start = len(lines)
-        for i, line in enumerate(lines):
-            if re.match(r'^[A-F]\.\s+', line):
-                opt_start = i
-                break
-                
-        options = []
-        for line in lines[opt_start:]:
-            if re.match(r'^[A-F]\.\s+', line):
-                options.append(line.strip())
-        
-        # Meta end for Body extraction
-        meta_end = 0
-        for i, line in enumerate(lines):
-            if "[All AWS Certified Solutions Architect" in line:
-                meta_end = i + 1
-                break
-                
-        # Body extraction
-        clean_body = []
-        for line in lines[meta_end:opt_start]:
-            s = line.strip()
-            if not s or s.startswith(("Question #", "Topic #", "Exam question from", "Amazon's", "AWS Certified")):
-                continue
-            if s.startswith("Suggested Answer:"):
-                continue
-            clean_body.append(s)
-            
-        q_text = "\n".join(clean_body)
-        is_multi = "(Choose two" in q_text or "(Choose three" in q_text
-        
-        correct_answ = None
-        if suggested_match:
-            correct_answ = suggested_match.group(1)
-        elif official_match:
-            correct_answ = official_match.group(1)
-            
-        if not correct_answ:
+BATCH_SIZE = 100
+
+def to_question_row(raw):
+    # Dict thô của question_parser -> tuple (id, topic, question, options, correct_answer, discussion_link, is_multiselect) hoặc None
+    q_text = raw['question']
+    is_multi = "(Choose two" in q_text or "(Choose three" in q_text
+    correct_answ = raw['suggested_answer'] or raw['answer']
+    if not correct_answ:
+        return None
+
+    return (
+        raw['id'],
+        raw['topic'] or "Unknown",
+        q_text,
+        raw['options'],
+        correct_answ,
+        raw['discussion_link'],
+        is_multi
+    )
+
+def validate_question(question):
+    # Lý do câu hỏi không hợp lệ (None nếu hợp lệ)
+    q_id, _, q_text, options, correct_answ, _, _ = question
+    if not q_text:
+        return "thiếu nội dung câu hỏi"
+    if len(options) < 2:
+        return f"chỉ có {len(options)} đáp án"
+    letters = {opt[0] for opt in options}
+    if not set(correct_answ) <= letters:
+        return f"đáp án {correct_answ} không có trong options ({''.join(sorted(letters))})"
+    return None
+
+def iter_raw_questions(file_paths, workers=1):
+    # workers > 1: parse song song theo byte range (question_parser.parse_files_parallel), vẫn đúng thứ tự
+    if workers != 1:
+        return parse_files_parallel(file_paths, SAA_FORMAT, workers or None)
+    return (raw for file_path in file_paths for raw in parse_file(file_path, SAA_FORMAT))
+
+def iter_questions(file_path, stats=None, workers=1):
+    # Pipeline parse -> validate: yield từng câu hợp lệ ngay khi đọc xong block của nó.
+    # Câu trùng id chỉ được báo (iter_unique), loader giữ bản sau cùng
+    # file_path: một file hoặc list nhiều file (cùng format SAA, cùng bảng questions)
+    file_paths = [file_path] if isinstance(file_path, str) else list(file_path)
+    stats = stats if stats is not None else {}
+    stats.update(blocks=0, parsed=0, invalid=0, duplicates=0)
+    print(f"📖 Reading file: {', '.join(file_paths)}" + (f" ({workers or os.cpu_count()} workers)" if workers != 1 else ""))
+    for raw in iter_unique(iter_raw_questions(file_paths, workers), stats):
+        stats['blocks'] += 1
+        question = to_question_row(raw)
+        if question is None:
             continue
+        stats['parsed'] += 1
+        problem = validate_question(question)
+        if problem:
+            stats['invalid'] += 1
+            print(f"⚠️ Skipping question {question[0]}: {problem}")
+            continue
+        yield question
 
-        questions.append((
-            id_match.group(1),
-            topic_match.group(1) if topic_match else "Unknown",
-            q_text,
-            options,
-            correct_answ,
-            link_match.group(1) if link_match else None,
-            is_multi
-        ))
-        
-    return questions
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def migrate_to_supabase(questions):
-    conn = get_db_connection()
-    if not conn:
-        return
+def parse_markdown_file(file_path):
+    stats = {}
+    questions = list(iter_questions(file_path, stats))
+    print(f"🔍 Parsed {stats['parsed']} of {stats['blocks']} blocks ({stats['invalid']} invalid)")
+    return questions
 
-    create_table_if_not_exists(conn)
-    
-    query = """
-    INSERT INTO questions (id, topic, question, options, correct_answer, discussion_link, is_multiselect)
-    VALUES %s
+QUESTION_COLUMNS = ('id', 'topic', 'question', 'options', 'correct_answer', 'discussion_link', 'is_multiselect',
+                    'content_hash')
+UPSERT_SET = """
     ON CONFLICT (id) DO UPDATE SET
         question = EXCLUDED.question,
         options = EXCLUDED.options,
         correct_answer = EXCLUDED.correct_answer,
         discussion_link = EXCLUDED.discussion_link,
-        is_multiselect = EXCLUDED.is_multiselect;
-    """
-    
-    BATCH_SIZE = 100
-    total = len(questions)
-    print(f"📦 Uploading {total} questions in batches of {BATCH_SIZE}...")
-    
+        is_multiselect = EXCLUDED.is_multiselect,
+        content_hash = EXCLUDED.content_hash;
+"""
+LOADERS = ('copy', 'batch')
+
+def question_content_hash(question):
+    # Hash các cột được upsert (question_diff.content_hash), topic không được update nên không tính
+    _, _, q_text, options, correct_answ, link, is_multi = question[:7]
+    return content_hash(q_text, options, correct_answ, link, is_multi)
+
+def with_content_hash(questions):
+    # Tuple 7 cột của to_question_row -> thêm content_hash (cột cuối của QUESTION_COLUMNS)
+    for question in questions:
+        yield tuple(question) + (question_content_hash(question),)
+
+def fetch_content_hashes(dsn=None, table='questions'):
+    # {id: content_hash} đang có trong bảng (None nếu row chưa có hash); None nếu không kết nối được
+    conn = get_db_connection(dsn)
+    if not conn:
+        return None
     try:
         with conn.cursor() as cur:
-            for i in range(0, total, BATCH_SIZE):
-                batch = questions[i:i + BATCH_SIZE]
-                execute_values(cur, query, batch)
-                conn.commit()
-                print(f"✅ Uploaded batch {i//BATCH_SIZE + 1} ({len(batch)} items)")
+            try:
+                cur.execute(f"SELECT id, content_hash FROM {table}")
+            except psycopg2.errors.UndefinedTable:
+                conn.rollback()
+                return {}
+            except psycopg2.errors.UndefinedColumn:
+                # Bảng tạo trước khi có content_hash: mọi row coi là chưa có hash
+                conn.rollback()
+                cur.execute(f"SELECT id, NULL FROM {table}")
+            return dict(cur.fetchall())
+    finally:
+        conn.close()
+
+def invalidate_ai_cache(question_ids, dsn=None, cache_table='ai_cache'):
+    # Xoá fingerprint (prompt_hash) của cache các câu đã sửa: cache_ai.py --ids FILE --stale-only tạo lại đúng các row này
+    # (--ids giới hạn theo id, vì row cache tạo trước khi có fingerprint cũng có prompt_hash NULL),
+    # nội dung cũ vẫn được dùng tới khi có bản mới
+    conn = get_db_connection(dsn)
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE {cache_table} SET prompt_hash = NULL WHERE question_id = ANY(%s)", (list(question_ids),))
+            invalidated = cur.rowcount
+        conn.commit()
+        return invalidated
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"❌ Error invalidating {cache_table}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def upsert_batches(conn, questions, batch_size=BATCH_SIZE, table='questions'):
+    # execute_values theo batch, commit sau mỗi batch (cách cũ, dùng khi không COPY được)
+    query = f"INSERT INTO {table} ({', '.join(QUESTION_COLUMNS)}) VALUES %s" + UPSERT_SET
+    print(f"📦 Uploading questions in batches of {batch_size}...")
+    total = 0
+    with conn.cursor() as cur:
+        for batch_num, batch in enumerate(iter_batches(questions, batch_size), 1):
+            # Id trùng: bản sau cùng thắng. Trong cùng một batch phải gộp trước (ON CONFLICT DO UPDATE lỗi),
+            # giữa các batch thì batch sau ghi đè batch trước
+            batch = list({q[0]: q for q in batch}.values())
+            execute_values(cur, query, batch)
+            conn.commit()
+            total += len(batch)
+            print(f"✅ Uploaded batch {batch_num} ({len(batch)} items, {total} total)")
+    return total
+
+def copy_text(value):
+    # Giá trị -> field của COPY ... FROM STDIN (format text)
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        value = '{' + ','.join('"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for v in value) + '}'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+class CopyStream:
+    # File-like cho cursor.copy_expert: sinh dữ liệu COPY từ iterator theo từng đoạn, không dựng cả file trong bộ nhớ
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+
+    def read(self, size=8192):
+        lines = []
+        length = 0
+        for row in self.rows:
+            line = '\t'.join(copy_text(value) for value in row) + '\n'
+            lines.append(line)
+            length += len(line)
+            self.count += 1
+            if length >= size:
+                break
+        return ''.join(lines)
+
+def copy_questions(conn, questions, table='questions'):
+    # COPY toàn bộ rows vào temp staging table rồi merge bằng một INSERT ... ON CONFLICT, trong một transaction.
+    # Trả về None (đã rollback, chưa đọc row nào) nếu server / pooler không cho tạo temp table hoặc COPY
+    columns = ', '.join(QUESTION_COLUMNS)
+    with conn.cursor() as cur:
+        try:
+            cur.execute(f"""
+            CREATE TEMP TABLE {table}_staging (
+                seq bigserial,
+                id text, topic text, question text, options text[],
+                correct_answer text, discussion_link text, is_multiselect boolean, content_hash text
+            ) ON COMMIT DROP;
+            """)
+            cur.copy_expert(f"COPY {table}_staging ({columns}) FROM STDIN", CopyStream([]))
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"⚠️ COPY không khả dụng ({e.pgcode or type(e).__name__}: {str(e).strip().splitlines()[0]}), chuyển sang upsert theo batch")
+            return None
+
+        print(f"📦 Streaming questions via COPY into {table}_staging...")
+        stream = CopyStream(questions)
+        cur.copy_expert(f"COPY {table}_staging ({columns}) FROM STDIN", stream)
+        # Id trùng trong file: giữ bản sau cùng giống upsert theo batch
+        cur.execute(f"""
+        INSERT INTO {table} ({columns})
+        SELECT DISTINCT ON (id) {columns} FROM {table}_staging ORDER BY id, seq DESC
+        """ + UPSERT_SET)
+        merged = cur.rowcount
+        conn.commit()
+    print(f"✅ Copied {stream.count} rows, merged {merged} into {table}")
+    return merged
+
+def migrate_to_supabase(questions, batch_size=BATCH_SIZE, loader='copy', dsn=None, table='questions'):
+    # questions là iterable bất kỳ (list hoặc generator của iter_questions), được stream thẳng vào database
+    # kèm content_hash của từng câu:
+    #   copy:  COPY vào temp staging table + một lần merge (fallback sang batch nếu không COPY được)
+    #   batch: execute_values mỗi batch_size câu, commit sau mỗi batch
+    conn = get_db_connection(dsn)
+    if not conn:
+        return 0
+
+    create_table_if_not_exists(conn, table)
+
+    total = 0
+    started = time.perf_counter()
+    questions = with_content_hash(questions)
+    try:
+        if loader == 'copy':
+            total = copy_questions(conn, questions, table)
+            if total is None:
+                loader = 'batch'
+        if loader == 'batch':
+            total = upsert_batches(conn, questions, batch_size, table)
+        elapsed = time.perf_counter() - started
+        print(f"⏱️ {loader}: {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
         print("🎉 Migration completed successfully!")
     except Exception as e:
         conn.rollback()
         print(f"❌ Error uploading data: {e}")
     finally:
         conn.close()
+    return total or 0
 
 if __name__ == "__main__":
-    file_path = "public/SAA_C03.md"
-    if not os.path.exists(file_path):
-        print(f"❌ File not found: {file_path}")
+    parser = argparse.ArgumentParser(description='Parse SAA_C03.md và upsert vào bảng questions')
+    parser.add_argument('files', nargs='*', default=["public/SAA_C03.md"], help='Các file markdown (default: public/SAA_C03.md)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'Số câu mỗi lần upsert (default: {BATCH_SIZE})')
+    parser.add_argument('--dry-run', action='store_true', help='Chỉ parse + validate, không ghi database')
+    parser.add_argument('--loader', choices=LOADERS, default='copy',
+                        help='copy: COPY vào staging table + một lần merge, tự fallback sang batch (default); batch: execute_values')
+    parser.add_argument('--dsn', help='Connection string thay cho DB_CONFIG (VD database local)')
+    parser.add_argument('--workers', type=int, default=1, help='Số process parse song song (default: 1 = tuần tự, 0 = số CPU)')
+    parser.add_argument('--diff', action='store_true',
+                        help='So content_hash với database, chỉ upsert câu mới / đã sửa và báo cáo thay đổi')
+    parser.add_argument('--changed-ids', metavar='FILE', default=changed_ids_path('questions'),
+                        help=f"Với --diff: file ghi id các câu đã sửa, đọc bằng cache_ai.py --ids (default: {changed_ids_path('questions')})")
+    parser.add_argument('--keep-cache', action='store_true',
+                        help='Với --diff: không đánh dấu ai_cache của các câu đã sửa là stale (mặc định: đánh dấu để cache_ai.py --ids FILE --stale-only tạo lại)')
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        if not os.path.exists(file_path):
+            print(f"❌ File not found: {file_path}")
+            exit(1)
+    if args.workers < 0:
+        print("❌ --workers phải >= 0")
+        exit(1)
+    if args.keep_cache and not args.diff:
+        print("❌ --keep-cache cần --diff")
         exit(1)
         
     try:
-        parsed_questions = parse_markdown_file(file_path)
-        print(f"✅ Successfully parsed {len(parsed_questions)} questions.")
-        
-        if len(parsed_questions) > 0:
-            migrate_to_supabase(parsed_questions)
+        stats = {}
+        questions = iter_questions(args.files, stats, args.workers)
+        diff = None
+        if args.diff:
+            existing = fetch_content_hashes(args.dsn)
+            if existing is None:
+                exit(1)
+            print(f"🔎 {len(existing)} questions in database")
+            diff = QuestionDiff(existing)
+            questions = diff.filter(questions, lambda q: q[0], question_content_hash)
+        if args.dry_run:
+            uploaded = sum(1 for _ in questions)
         else:
+            uploaded = migrate_to_supabase(questions, args.batch_size, args.loader, args.dsn)
+        print(f"✅ Parsed {stats['parsed']} of {stats['blocks']} blocks, {stats['invalid']} invalid, "
+              f"{stats['duplicates']} duplicate ids, "
+              f"{uploaded} {'valid' if args.dry_run else 'uploaded'}.")
+        
+        if stats['parsed'] == 0:
             print("⚠️ No questions found to migrate.")
+
+        if diff:
+            diff.report()
+            regenerate = diff.regenerate_ids
+            write_ids(args.changed_ids, regenerate)
+            print(f"📝 {len(regenerate)} ids cần tạo lại ai_cache -> {args.changed_ids}")
+            if regenerate and uploaded and not args.dry_run:
+                if args.keep_cache:
+                    print(f"⚠️ Giữ nguyên ai_cache của {len(regenerate)} câu đã sửa (--keep-cache), "
+                          f"tạo lại bằng: python cache_ai.py --ids {args.changed_ids} --force")
+                else:
+                    invalidated = invalidate_ai_cache(regenerate, args.dsn)
+                    if invalidated is not None:
+                        print(f"🧹 Marked {invalidated} ai_cache rows stale for {len(regenerate)} changed questions")
+                        print(f"👉 Tạo lại cache: python cache_ai.py --ids {args.changed_ids} --stale-only")
             
     except Exception as e:
         print(f"❌ Critical Error: {e}")
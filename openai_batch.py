@@ -0,0 +1,187 @@
+"""
+OpenAI Batch API
+----------------
+Chế độ --batch cho provider openai: thay vì gọi chat completion từng request,
+ghi toàn bộ prompt cần tạo vào file JSONL, submit lên Batch API, poll tới khi
+xong rồi trả kết quả về để ghi hàng loạt vào ai_cache. Giá rẻ hơn (~50%) và
+không bị giới hạn RPM, đổi lại kết quả có trong vòng 24h.
+
+- Mỗi file tối đa OPENAI_BATCH_MAX_REQUESTS requests (giới hạn của API là 50.000),
+  range lớn hơn được chia thành nhiều batch.
+- custom_id = question_id|language|type|prompt_hash, nên có thể ingest lại một batch
+  đã submit bằng --batch-id mà không cần file gốc.
+- Câu trùng nội dung chỉ gửi một request; map custom_id gốc -> custom_id các bản trùng được
+  ghi cạnh file JSONL (<file>.duplicates.json), --batch-id đọc lại qua metadata 'file' của batch
+  để ghi cả các bản trùng.
+- File JSONL được giữ lại trong OPENAI_BATCH_DIR để debug / submit lại.
+- Endpoint lấy theo OPENAI_BASE_URL (SDK tự đọc), trỏ về server local để thử.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+BATCH_COMPLETION_WINDOW = '24h'
+BATCH_TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+DEFAULT_BATCH_DIR = os.getenv('OPENAI_BATCH_DIR') or '.openai_batches'
+DEFAULT_BATCH_MAX_REQUESTS = int(os.getenv('OPENAI_BATCH_MAX_REQUESTS') or 50000)
+DEFAULT_POLL_INTERVAL = 60
+
+
+def batch_custom_id(question_id: str, language: str, content_type: str, prompt_hash: str) -> str:
+    return f"{question_id}|{language}|{content_type}|{prompt_hash}"
+
+
+def parse_custom_id(custom_id: str) -> tuple:
+    """(question_id, language, type, prompt_hash)"""
+    question_id, language, content_type, prompt_hash = custom_id.rsplit('|', 3)
+    return question_id, language, content_type, prompt_hash
+
+
+def batch_request_line(custom_id: str, prompt: str, model: str, system_prompt: str, params: dict) -> str:
+    body = {
+        'model': model,
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ],
+        **params
+    }
+    return json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': body},
+                      ensure_ascii=False)
+
+
+def parse_batch_output(text: str) -> dict:
+    """{custom_id: (content, error)} từ output / error file của batch"""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get('response') or {}
+        body = response.get('body') or {}
+        content = None
+        error = item.get('error')
+        if response.get('status_code') == 200:
+            try:
+                content = body['choices'][0]['message']['content']
+            except (KeyError, IndexError, TypeError):
+                error = 'response không có content'
+        elif error is None:
+            error = body.get('error') or f"status {response.get('status_code')}"
+        if isinstance(error, dict):
+            error = error.get('message') or error
+        results[item['custom_id']] = (content, None if content else str(error))
+    return results
+
+
+def duplicates_path(path: str) -> str:
+    """File map câu trùng nằm cạnh file JSONL của batch"""
+    return os.path.splitext(path)[0] + '.duplicates.json'
+
+
+class OpenAIBatchRunner:
+    """Submit / poll / tải kết quả batch (SDK sync chạy trong thread)"""
+
+    def __init__(self, client, batch_dir: str = DEFAULT_BATCH_DIR,
+                 max_requests: int = DEFAULT_BATCH_MAX_REQUESTS):
+        """client: openai.OpenAI (dùng chung client của provider)"""
+        self.client = client
+        self.batch_dir = batch_dir
+        self.max_requests = max_requests
+
+    def write_files(self, requests: list, model: str, system_prompt: str, params: dict,
+                    duplicates: Optional[dict] = None) -> list:
+        """requests = [(custom_id, prompt)] -> danh sách file JSONL (mỗi file <= max_requests dòng).
+        duplicates = {custom_id gốc: [custom_id bản trùng]}, phần của từng file ghi vào duplicates_path(file)"""
+        os.makedirs(self.batch_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        paths = []
+        for part, begin in enumerate(range(0, len(requests), self.max_requests), 1):
+            path = os.path.join(self.batch_dir, f"batch-{stamp}-{part}.jsonl")
+            part_duplicates = {}
+            with open(path, 'w', encoding='utf-8') as f:
+                for custom_id, prompt in requests[begin:begin + self.max_requests]:
+                    f.write(batch_request_line(custom_id, prompt, model, system_prompt, params) + '\n')
+                    if duplicates and custom_id in duplicates:
+                        part_duplicates[custom_id] = duplicates[custom_id]
+            if part_duplicates:
+                with open(duplicates_path(path), 'w', encoding='utf-8') as f:
+                    json.dump(part_duplicates, f, ensure_ascii=False)
+            paths.append(path)
+        return paths
+
+    def load_duplicates(self, batch) -> dict:
+        """Map câu trùng của batch (qua metadata 'file'), {} nếu batch không có câu trùng"""
+        name = (batch.metadata or {}).get('file')
+        if not name:
+            return {}
+        path = duplicates_path(os.path.join(self.batch_dir, name))
+        if not os.path.exists(path):
+            # File JSONL còn mà không có map = batch không có câu trùng; mất cả thư mục batch thì cảnh báo
+            if not os.path.exists(os.path.join(self.batch_dir, name)):
+                print(f"   ⚠️ Không tìm thấy {name} trong {self.batch_dir}, các câu trùng nội dung của batch "
+                      f"{batch.id} sẽ không được ghi")
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _submit_file(self, path: str) -> str:
+        with open(path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata={'source': 'cache_ai', 'file': os.path.basename(path)}
+        )
+        return batch.id
+
+    async def submit(self, paths: list) -> list:
+        batch_ids = []
+        for path in paths:
+            batch_id = await asyncio.to_thread(self._submit_file, path)
+            print(f"📤 Đã submit {path} -> batch {batch_id}")
+            batch_ids.append(batch_id)
+        return batch_ids
+
+    async def wait(self, batch_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """Poll tới khi batch kết thúc (completed / failed / expired / cancelled).
+        Chỉ in khi trạng thái hoặc tiến độ thay đổi, không in mỗi lần poll"""
+        last_line = None
+        while True:
+            batch = await asyncio.to_thread(self.client.batches.retrieve, batch_id)
+            counts = batch.request_counts
+            progress = f" ({counts.completed + counts.failed}/{counts.total})" if counts and counts.total else ''
+            line = f"{batch.status}{progress}"
+            if line != last_line:
+                print(f"   ⏳ Batch {batch_id}: {line}")
+                last_line = line
+            if batch.status in BATCH_TERMINAL_STATUSES:
+                return batch
+            await asyncio.sleep(poll_interval)
+
+    def _download(self, file_id: Optional[str]) -> dict:
+        if not file_id:
+            return {}
+        return parse_batch_output(self.client.files.content(file_id).text)
+
+    async def results(self, batch) -> dict:
+        """{custom_id: (content, error)} gồm cả output file và error file"""
+        results = await asyncio.to_thread(self._download, batch.output_file_id)
+        results.update(await asyncio.to_thread(self._download, batch.error_file_id))
+        return results
+
+    async def collect(self, batch_ids: list, poll_interval: float = DEFAULT_POLL_INTERVAL) -> tuple:
+        """({custom_id: (content, error)}, {custom_id gốc: [custom_id bản trùng]}) của các batch"""
+        merged, duplicates = {}, {}
+        for batch_id in batch_ids:
+            batch = await self.wait(batch_id, poll_interval)
+            if batch.status != 'completed':
+                print(f"   ⚠️ Batch {batch_id} kết thúc với trạng thái {batch.status}, chỉ lấy các kết quả đã có")
+            merged.update(await self.results(batch))
+            duplicates.update(self.load_duplicates(batch))
+        return merged, duplicates
@@ -11,17 +11,20 @@
 -- Stores all PMP exam questions (separate from AWS questions)
 CREATE TABLE IF NOT EXISTS pmp_questions (
     id TEXT PRIMARY KEY,
+    id_num INTEGER GENERATED ALWAYS AS (NULLIF(regexp_replace(id, '\D', '', 'g'), '')::INTEGER) STORED,
     question TEXT NOT NULL,
     options TEXT[] NOT NULL,
     correct_answer TEXT NOT NULL,
     is_multiselect BOOLEAN DEFAULT FALSE,
     discussion_link TEXT,
+    content_hash TEXT,  -- Hash of question content, used by --diff imports
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
 -- Add indexes for performance
 CREATE INDEX IF NOT EXISTS idx_pmp_questions_id ON pmp_questions(id);
+CREATE INDEX IF NOT EXISTS idx_pmp_questions_id_num ON pmp_questions(id_num, id);
 CREATE INDEX IF NOT EXISTS idx_pmp_questions_created_at ON pmp_questions(created_at);
 
 -- =====================================================
@@ -34,6 +37,8 @@ CREATE TABLE IF NOT EXISTS pmp_ai_cache (
     language TEXT NOT NULL CHECK (language IN ('vi', 'en')),
     type TEXT NOT NULL CHECK (type IN ('explanation', 'theory')),
     content TEXT NOT NULL,
+    prompt_hash TEXT,  -- Hash of the prompt template that produced content
+    model TEXT,        -- LLM model id that produced content
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     
@@ -0,0 +1,55 @@
+"""
+Prompt Fingerprint
+------------------
+Hash của prompt template để biết row nào trong ai_cache / pmp_ai_cache được tạo
+bởi template (và model) cũ.
+
+Template được render với placeholder cố định thay cho nội dung câu hỏi, nên hash
+chỉ đổi khi chính template đổi (xem PROMPT_UPDATE_SUMMARY.md), không phụ thuộc
+vào từng câu hỏi. Mỗi row cache lưu `prompt_hash` + `model`; chế độ --stale-only
+chỉ tạo lại các row có fingerprint khác hiện tại.
+"""
+
+import hashlib
+import json
+from typing import Callable, Optional
+
+FINGERPRINT_COLUMNS = ('prompt_hash', 'model')
+
+PLACEHOLDER_QUESTION = '{question}'
+PLACEHOLDER_OPTIONS = '{options}'
+PLACEHOLDER_CORRECT_ANSWER = '{correct_answer}'
+
+
+def template_hash(rendered_template: str, extra: Optional[dict] = None) -> str:
+    """Hash ngắn của template đã render (kèm system prompt / params nếu có)"""
+    payload = rendered_template + json.dumps(extra or {}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def build_prompt_hashes(theory_prompt: Callable, explanation_prompt: Callable, languages: list,
+                        extra: Optional[dict] = None) -> dict:
+    """{(language, type): prompt_hash} cho các hàm get_theory_prompt / get_explanation_prompt"""
+    hashes = {}
+    for language in languages:
+        hashes[(language, 'theory')] = template_hash(
+            theory_prompt(PLACEHOLDER_QUESTION, PLACEHOLDER_OPTIONS, language), extra
+        )
+        hashes[(language, 'explanation')] = template_hash(
+            explanation_prompt(PLACEHOLDER_QUESTION, PLACEHOLDER_OPTIONS, PLACEHOLDER_CORRECT_ANSWER, language), extra
+        )
+    return hashes
+
+
+def is_stale(fingerprint: tuple, current: set) -> bool:
+    """fingerprint = (prompt_hash, model) của row trong cache, current = các (prompt_hash, model) hiện tại
+    (mỗi provider đang dùng một fingerprint). Row cũ chưa có fingerprint coi là stale"""
+    return tuple(fingerprint) not in current
+
+
+def needs_generation(row: Optional[dict], current: set, stale_only: bool = False) -> bool:
+    """Quyết định có tạo content không dựa trên row cache đã prefetch (None = chưa có cache).
+    Mặc định: chỉ tạo khi chưa có. stale_only: chỉ tạo lại row đã có nhưng fingerprint khác."""
+    if stale_only:
+        return row is not None and is_stale((row.get('prompt_hash'), row.get('model')), current)
+    return row is None
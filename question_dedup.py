@@ -0,0 +1,64 @@
+"""
+Question Dedup
+--------------
+Dump ExamTopics (VD public/SAA_C03.md) có nhiều câu trùng nhau với id khác nhau.
+Thay vì gọi LLM cho từng bản sao, builder chuẩn hóa + hash nội dung câu hỏi
+(câu hỏi, các đáp án, đáp án đúng) và chỉ generate một lần cho mỗi
+(hash, language, type), kết quả được ghi cho mọi id có cùng hash.
+
+Chuẩn hóa: Unicode NFKC, không phân biệt hoa thường, gộp khoảng trắng.
+Chỉ gộp câu trùng hoàn toàn sau chuẩn hóa (khác một chữ là hai câu khác nhau).
+"""
+
+import asyncio
+import hashlib
+import re
+import unicodedata
+from typing import Callable
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text) -> str:
+    text = unicodedata.normalize('NFKC', str(text or ''))
+    return WHITESPACE_PATTERN.sub(' ', text).strip().casefold()
+
+
+def question_signature(question: dict, format_options: Callable) -> str:
+    """Hash nội dung câu hỏi; options được format theo bộ đề trước khi chuẩn hóa (SAA list / PMP JSON)"""
+    parts = (
+        normalize_text(question.get('question')),
+        normalize_text(format_options(question.get('options'))),
+        normalize_text(question.get('correct_answer'))
+    )
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:24]
+
+
+class DedupIndex:
+    """Task đầu tiên của mỗi (hash, language, type) gọi LLM, các task trùng chờ và dùng lại kết quả"""
+
+    def __init__(self, format_options: Callable):
+        self.format_options = format_options
+        self.results = {}  # (hash, language, type) -> Future[(provider, content)]
+        self.saved = 0
+        self.duplicate_ids = set()
+
+    def key(self, question: dict, language: str, content_type: str) -> tuple:
+        return question_signature(question, self.format_options), language, content_type
+
+    def claim(self, key: tuple) -> tuple:
+        """(future, owner): owner=True nếu task này phải tự generate và set_result cho future"""
+        future = self.results.get(key)
+        if future is not None:
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self.results[key] = future
+        return future, True
+
+    def record_reuse(self, question_id):
+        self.saved += 1
+        self.duplicate_ids.add(str(question_id))
+
+    def summary(self) -> str:
+        return (f"Dedup: {self.saved} tasks dùng lại kết quả của câu trùng "
+                f"({len(self.duplicate_ids)} câu hỏi), tiết kiệm {self.saved} LLM calls")
@@ -0,0 +1,118 @@
+"""
+Question Diff
+-------------
+Hash nội dung từng câu hỏi (cột content_hash của questions / pmp_questions) để importer
+chỉ upsert câu mới hoặc đã sửa thay vì ghi lại toàn bộ file mỗi lần chạy.
+
+Hash tính trên đúng các cột mà upsert ghi (question, options, correct_answer,
+discussion_link, is_multiselect), giữ nguyên văn: khác một chữ hoa / khoảng trắng
+là câu đã sửa (khác question_dedup.py, vốn chuẩn hóa để gộp câu trùng).
+
+So với hash đang lưu trong database, mỗi câu thuộc một nhóm:
+    new        chưa có id trong bảng            -> upsert
+    changed    hash khác                        -> upsert + tạo lại cache AI
+    unhashed   row cũ chưa có content_hash      -> upsert để ghi hash, không biết đã sửa chưa
+    unchanged  hash giống                       -> bỏ qua
+Id của nhóm changed là các câu có ai_cache / pmp_ai_cache cần tạo lại: importer ghi chúng
+vào changed_ids_<bảng>.txt, đọc lại bằng `cache_ai.py --ids FILE`.
+"""
+
+import hashlib
+import json
+from typing import Callable, Iterable, Iterator, Optional
+
+CONTENT_HASH_COLUMN = 'content_hash'
+DIFF_GROUPS = ('new', 'changed', 'unhashed', 'unchanged')
+
+
+def content_hash(question: str, options: list, correct_answer: str, discussion_link: Optional[str],
+                 is_multiselect: bool) -> str:
+    """Hash ngắn của nội dung một câu hỏi"""
+    payload = json.dumps([question, list(options or []), correct_answer, discussion_link, bool(is_multiselect)],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def id_number(question_id) -> int:
+    """Phần số của id (giống cột id_num), -1 nếu id không có chữ số"""
+    digits = ''.join(ch for ch in str(question_id) if ch.isdigit())
+    return int(digits) if digits else -1
+
+
+def sort_ids(ids: Iterable) -> list:
+    """Sắp xếp id dạng text theo số ("2" trước "10")"""
+    return sorted(ids, key=lambda question_id: (id_number(question_id), str(question_id)))
+
+
+def changed_ids_path(table: str) -> str:
+    """File id cần tạo lại cache mặc định của một bảng câu hỏi"""
+    return f"changed_ids_{table}.txt"
+
+
+def write_ids(path: str, ids: Iterable):
+    """Ghi mỗi id một dòng"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for question_id in ids:
+            f.write(f"{question_id}\n")
+
+
+def read_ids(path: str) -> list:
+    """Đọc file của write_ids (bỏ dòng trống), giữ thứ tự"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+class QuestionDiff:
+    """So sánh các câu parse được với {id: content_hash} đang có trong database"""
+
+    def __init__(self, existing: dict):
+        self.existing = existing
+        self.ids = {group: [] for group in DIFF_GROUPS}
+        self.seen = set()
+
+    def classify(self, question_id: str, new_hash: str) -> str:
+        self.seen.add(question_id)
+        if question_id not in self.existing:
+            return 'new'
+        old_hash = self.existing[question_id]
+        if old_hash is None:
+            return 'unhashed'
+        return 'unchanged' if old_hash == new_hash else 'changed'
+
+    def filter(self, rows: Iterable, id_of: Callable, hash_of: Callable) -> Iterator:
+        """Chỉ yield các row cần upsert (new / changed / unhashed), giữ nguyên thứ tự.
+        Id trùng đã yield một bản thì các bản sau luôn được yield để bản sau cùng thắng khi upsert"""
+        upserted = set()
+        for row in rows:
+            question_id = id_of(row)
+            group = self.classify(question_id, hash_of(row))
+            self.ids[group].append(question_id)
+            if group != 'unchanged' or question_id in upserted:
+                upserted.add(question_id)
+                yield row
+
+    @property
+    def regenerate_ids(self) -> list:
+        """Id có cache AI cần tạo lại (nội dung đã sửa)"""
+        return sort_ids(self.ids['changed'])
+
+    @property
+    def missing_ids(self) -> list:
+        """Id có trong database nhưng không còn trong file (không bị xoá)"""
+        return sort_ids(set(self.existing) - self.seen)
+
+    def summary(self) -> str:
+        counts = {group: len(ids) for group, ids in self.ids.items()}
+        return (f"Diff: {counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged, "
+                f"{counts['unhashed']} chưa có content_hash, {len(self.missing_ids)} chỉ có trong database")
+
+    def report(self, preview: int = 20):
+        print(f"🔎 {self.summary()}")
+        for group, icon in (('new', '🆕'), ('changed', '✏️')):
+            ids = sort_ids(self.ids[group])
+            if ids:
+                more = f" ... (+{len(ids) - preview})" if len(ids) > preview else ''
+                print(f"   {icon} {group}: {', '.join(ids[:preview])}{more}")
+        if self.ids['unhashed']:
+            print(f"   ⚠️ {len(self.ids['unhashed'])} câu chưa có content_hash: ghi hash lần này, "
+                  f"không xác định được cache AI có cũ hay không")
@@ -0,0 +1,308 @@
+"""
+Question Parser
+---------------
+Parser một lượt dùng chung cho các dump câu hỏi ExamTopics:
+
+    SAA_FORMAT  public/SAA_C03.md   (migrate.py)
+    PMP_FORMAT  PMP_Full_1400.md    (import_pmp_questions.py)
+
+Thay vì split block rồi chạy nhiều re.search / re.match trên từng block, mỗi format có một
+regex tokenizer compile sẵn chỉ khớp các dòng có ý nghĩa (header, marker, Suggested Answer,
+options, **Answer**, Topic, link, separator). Một lần finditer trên text (chạy trong C) cho ra
+chuỗi token, state machine đi qua token theo thứ tự; nội dung câu hỏi được cắt thẳng từ text
+theo vị trí token nên các dòng nội dung / dòng trống không phải đi qua vòng lặp Python.
+
+Parse song song (parse_files_parallel): file được chia thành các byte range cắt tại đầu dòng
+header (ngay sau separator), mỗi range parse trong một process của ProcessPoolExecutor rồi ghép
+lại đúng thứ tự; iter_unique báo các câu trùng id, loader giữ bản xuất hiện sau cùng (như upsert theo thứ tự file).
+
+Kết quả là dict thô cho từng câu:
+    id, topic, question, options, suggested_answer, answer, discussion_link
+mỗi importer tự chuyển sang row của bảng mình (migrate.to_question_row / pmp_question).
+File được đọc theo chunk (READ_CHUNK_CHARS) cắt ngay trước một dòng header, nên bộ nhớ không
+phụ thuộc kích thước file và parse_text dùng được cho bất kỳ đoạn nào bắt đầu tại header.
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+BLOCK_SEPARATOR = '----------------------------------------'
+READ_CHUNK_CHARS = 1 << 16  # ~64K ký tự: nhanh bằng chunk 1M, peak ~1.5 MB thay vì ~22 MB
+PARALLEL_MIN_CHUNK_BYTES = 256 * 1024
+PARALLEL_CHUNKS_PER_WORKER = 4
+
+
+class ExamFormat:
+    """Khác biệt giữa các dump: header, marker bắt đầu câu hỏi, options, cách lấy nội dung câu hỏi"""
+
+    def __init__(self, name: str, header_prefix: str, header: str, body_marker: str, option_letters: str,
+                 option: str, answer: str, link: str, raw_body: bool, skip_prefixes: tuple = ()):
+        self.name = name
+        self.header_prefix = header_prefix
+        self.header_pattern = re.compile(re.escape(header_prefix) + header)
+        self.body_marker = body_marker
+        # Một lần findall trên cả token options thay cho match từng dòng (option dùng [^\S\n]+ thay \s+
+        # để một match không nối sang dòng sau)
+        self.option_pattern = re.compile('^' + option, re.MULTILINE)
+        # raw_body: nội dung = nguyên văn đoạn từ marker tới "Suggested Answer:" (PMP);
+        # ngược lại: các dòng khác rỗng từ marker tới option đầu tiên, bỏ dòng metadata (SAA)
+        self.raw_body = raw_body
+        self.skip_prefixes = skip_prefixes
+
+        # Tokenizer: mỗi nhánh = '\n' + literal đầu dòng + named group (lastgroup = loại token),
+        # giá trị nằm trong group con. Text được thêm '\n' ở đầu; regex engine nhảy thẳng giữa các
+        # dòng và loại nhánh bằng literal trước khi vào group. Các dòng option liền nhau (xen dòng
+        # trống) gộp thành một token.
+        option_line = rf'[{option_letters}]\.[^\S\n]+[^\n]*'
+        self.token_pattern = re.compile('\\n(?:' + '|'.join((
+            re.escape(header_prefix) + rf'(?P<header>{header})',
+            rf'-(?P<separator>{re.escape(BLOCK_SEPARATOR[1:])})',
+            re.escape(body_marker) + r'(?P<marker>[^\n]*)',
+            r'Suggested Answer:(?P<suggested>(?:[ \t]+(?P<suggested_value>[A-Z]+))?)',
+            rf'(?=[{option_letters}]\.)(?P<options>{option_line}(?:(?:\n[ \t]*)*\n{option_line})*)',
+            rf'\*\*Answer:(?P<answer>{answer})',
+            r'Topic #:(?P<topic>[ \t]+(?P<topic_value>\d+))',
+            rf'\[View on ExamTopics\]\((?P<link>(?P<link_value>{link})\))'
+        )) + ')')
+
+
+SAA_FORMAT = ExamFormat(
+    'saa',
+    header_prefix='## Exam',
+    header=r' [^\n]* question (?P<header_id>\d+) discussion',
+    body_marker='[All AWS Certified Solutions Architect',
+    option_letters='A-F',
+    option=r'[A-F]\.[^\S\n]+',
+    answer=r'[ \t]+(?P<answer_value>[A-Z]+)\*\*',
+    link=r'[^\n]*?',
+    raw_body=False,
+    skip_prefixes=("Question #", "Topic #", "Exam question from", "Amazon's", "AWS Certified", "Suggested Answer:")
+)
+
+PMP_FORMAT = ExamFormat(
+    'pmp',
+    header_prefix='## Exam PMP topic',
+    header=r'[^\n]*?question (?P<header_id>\d+)',
+    body_marker='[All PMP Questions]',
+    option_letters='A-D',
+    # Nội dung option dừng trước "**Answer:" nếu đáp án nằm cùng dòng (unrolled loop thay cho
+    # lazy .+? + lookahead để không phải thử lookahead tại từng ký tự)
+    option=(r'(?P<option_letter>[A-D])\.[^\S\n]+(?P<option_text>[^\n*]*(?:\*(?!\*Answer:)[^\n*]*)*)'
+            r'(?:\*\*Answer:[ \t]*(?P<option_answer>[A-D]+)\*\*)?'),
+    answer=r'[ \t]*(?P<answer_value>[A-D]+)\*\*',
+    link=r'https://www\.examtopics\.com/[^\)\n]+',
+    raw_body=True
+)
+
+EXAM_FORMATS = {fmt.name: fmt for fmt in (SAA_FORMAT, PMP_FORMAT)}
+
+
+def _result(text: str, fmt: ExamFormat, question_id: str, topic: Optional[str], body_start: int,
+            body_end: Optional[int], block_end: int, options: list, suggested: Optional[str],
+            answer: Optional[str], link: Optional[str]) -> dict:
+    if fmt.raw_body:
+        # PMP: không có "Suggested Answer:" sau marker -> không lấy được nội dung
+        question = text[body_start:body_end].strip() if body_end is not None else None
+    else:
+        # SAA: không có option -> nội dung kéo dài tới hết block
+        clean_body = []
+        for line in text[body_start:block_end if body_end is None else body_end].split('\n'):
+            s = line.strip()
+            if s and not s.startswith(fmt.skip_prefixes):
+                clean_body.append(s)
+        question = '\n'.join(clean_body)
+    return {
+        'id': question_id,
+        'topic': topic,
+        'question': question,
+        'options': options,
+        'suggested_answer': suggested,
+        'answer': answer,
+        'discussion_link': link
+    }
+
+
+def parse_text(text: str, fmt: ExamFormat) -> Iterator[dict]:
+    """Yield dict thô cho từng câu hỏi trong text (cả file hoặc một đoạn bắt đầu tại header)"""
+    text = '\n' + text
+    raw_body = fmt.raw_body
+    option_pattern = fmt.option_pattern
+    question_id = None
+    for match in fmt.token_pattern.finditer(text):
+        kind = match.lastgroup
+
+        if kind == 'header':
+            if question_id is not None:
+                yield _result(text, fmt, question_id, topic, body_start, body_end, match.start(),
+                              options, suggested, answer, link)
+            question_id = match.group('header_id')
+            topic = suggested = answer = link = body_end = None
+            options = []
+            body_start = match.end()
+            marker_seen = False
+            continue
+        if question_id is None:
+            continue
+
+        if kind == 'options':
+            if raw_body:
+                for letter, option_text, option_answer in option_pattern.findall(match.group('options')):
+                    options.append(f"{letter}. {' '.join(option_text.split())}")  # = re.sub(r'\s+', ' ')
+                    if answer is None and option_answer:
+                        answer = option_answer  # "D. ... **Answer: B**" cùng một dòng
+            else:
+                if not options and body_end is None:
+                    body_end = match.start()  # SAA: nội dung kết thúc ở option đầu tiên
+                for line in match.group('options').split('\n'):
+                    line = line.strip()
+                    if line:
+                        options.append(line)
+        elif kind == 'suggested':
+            if suggested is None:
+                suggested = match.group('suggested_value')
+            if raw_body and marker_seen and body_end is None:
+                body_end = match.start()  # PMP: nội dung kết thúc ở "Suggested Answer:"
+        elif kind == 'answer':
+            if answer is None:
+                answer = match.group('answer_value')
+        elif kind == 'topic':
+            if topic is None:
+                topic = match.group('topic_value')
+        elif kind == 'link':
+            if link is None:
+                link = match.group('link_value')
+        elif kind == 'marker':
+            if not marker_seen:
+                marker_seen = True
+                body_start = match.end()
+                if not raw_body and options:
+                    body_end = body_start  # Marker nằm sau options: nội dung rỗng
+        elif kind == 'separator':
+            yield _result(text, fmt, question_id, topic, body_start, body_end, match.start(),
+                          options, suggested, answer, link)
+            question_id = None
+
+    if question_id is not None:
+        yield _result(text, fmt, question_id, topic, body_start, body_end, len(text),
+                      options, suggested, answer, link)
+
+
+def iter_text_chunks(f, fmt: ExamFormat, chunk_chars: int = READ_CHUNK_CHARS) -> Iterator[str]:
+    """Đọc file theo chunk ~chunk_chars ký tự, mỗi chunk (trừ chunk đầu) bắt đầu tại một dòng header"""
+    boundary = '\n' + fmt.header_prefix
+    buffer = ''
+    while True:
+        data = f.read(chunk_chars)
+        if not data:
+            break
+        buffer += data
+        cut = buffer.rfind(boundary)
+        while cut > 0 and not fmt.header_pattern.match(buffer, cut + 1):
+            cut = buffer.rfind(boundary, 0, cut)
+        if cut > 0:
+            yield buffer[:cut + 1]
+            buffer = buffer[cut + 1:]
+    if buffer:
+        yield buffer
+
+
+def parse_file(file_path: str, fmt: ExamFormat) -> Iterator[dict]:
+    """Đọc file theo chunk và parse (bộ nhớ không phụ thuộc kích thước file)"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for chunk in iter_text_chunks(f, fmt):
+            yield from parse_text(chunk, fmt)
+
+
+def find_boundary(f, offset: int, fmt: ExamFormat) -> int:
+    """Vị trí byte của dòng header đầu tiên bắt đầu từ offset trở đi (cuối file nếu không còn)"""
+    prefix = fmt.header_prefix.encode('utf-8')
+    f.seek(offset - 1)
+    f.readline()  # Tới đầu dòng kế tiếp (giữ nguyên offset nếu offset đã là đầu dòng)
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line:
+            return position
+        if line.startswith(prefix) and fmt.header_pattern.match(line.decode('utf-8', 'replace')):
+            return position
+
+
+def chunk_ranges(file_path: str, fmt: ExamFormat, chunk_bytes: int) -> list:
+    """Chia file thành các byte range [start, end) liên tiếp, mỗi range (trừ range đầu) bắt đầu tại header"""
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as f:
+        start = 0
+        while start < size:
+            end = find_boundary(f, start + chunk_bytes, fmt) if start + chunk_bytes < size else size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_range(task: tuple) -> list:
+    """Chạy trong process con: parse một byte range (ranh giới luôn ở đầu dòng nên decode an toàn)"""
+    file_path, format_name, start, end = task
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    return list(parse_text(text, EXAM_FORMATS[format_name]))
+
+
+def parse_files_parallel(file_paths: Iterable[str], fmt: ExamFormat, workers: Optional[int] = None,
+                         chunk_bytes: Optional[int] = None) -> Iterator[dict]:
+    """Parse nhiều file cùng format trên ProcessPoolExecutor, yield dict thô theo thứ tự file / vị trí trong file
+
+    workers=None: số CPU. chunk_bytes=None: chia mỗi file thành ~PARALLEL_CHUNKS_PER_WORKER range
+    cho mỗi worker (tối thiểu PARALLEL_MIN_CHUNK_BYTES).
+    """
+    file_paths = list(file_paths)
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for file_path in file_paths:
+        size = chunk_bytes or max(PARALLEL_MIN_CHUNK_BYTES,
+                                  os.path.getsize(file_path) // (workers * PARALLEL_CHUNKS_PER_WORKER) + 1)
+        tasks += [(file_path, fmt.name, start, end) for start, end in chunk_ranges(file_path, fmt, size)]
+    if workers <= 1 or len(tasks) <= 1:
+        for file_path in file_paths:
+            yield from parse_file(file_path, fmt)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        # map trả kết quả đúng thứ tự task, range xong sớm được giữ lại chờ các range trước
+        for records in executor.map(_parse_range, tasks):
+            yield from records
+
+
+def iter_unique(records: Iterable[dict], stats: Optional[dict] = None) -> Iterator[dict]:
+    """Báo các câu trùng id, đếm vào stats['duplicates']. Vẫn yield từng câu ngay khi parse xong (chỉ giữ tập id
+    đã gặp, không giữ record); bản trùng cũng được yield để loader áp dụng bản xuất hiện sau cùng thắng"""
+    seen = set()
+    if stats is not None:
+        stats.setdefault('duplicates', 0)
+    for record in records:
+        if record['id'] in seen:
+            print(f"⚠️ Duplicate question id {record['id']}: bản sau ghi đè bản trước")
+            if stats is not None:
+                stats['duplicates'] += 1
+        else:
+            seen.add(record['id'])
+        yield record
+
+def pmp_question(raw: dict) -> tuple:
+    """Dict thô -> (row cho bảng pmp_questions, None) hoặc (None, lý do bỏ qua)"""
+    if raw['question'] is None:
+        return None, "Could not extract question text"
+    if len(raw['options']) < 2:
+        return None, f"Found only {len(raw['options'])} options"
+    if not raw['answer']:
+        return None, "Could not find answer"
+    return {
+        'id': raw['id'],
+        'question': raw['question'],
+        'options': raw['options'],
+        'correct_answer': raw['answer'],
+        'is_multiselect': len(raw['answer']) > 1,
+        'discussion_link': raw['discussion_link']
+    }, None
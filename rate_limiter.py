@@ -0,0 +1,198 @@
+"""
+Gemini Key Rate Limiter
+-----------------------
+Token bucket theo từng API key (requests/phút) + quota theo ngày (requests/ngày).
+
+- Mỗi key có một bucket RPM, refill liên tục (rpm / 60 token mỗi giây).
+- Số request trong ngày của từng key được lưu vào ledger file (JSON) để các lần
+  chạy liên tiếp biết key nào đã hết quota và bỏ qua ngay từ đầu.
+- Ngày quota tính theo giờ Pacific (Gemini reset quota lúc 0h PT).
+
+Ledger chỉ lưu hash của key, không lưu key gốc.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:
+    QUOTA_TIMEZONE = timezone.utc
+
+DEFAULT_RPM = 10
+DEFAULT_RPD = 1500
+DEFAULT_LEDGER_PATH = '.gemini_quota.json'
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Hash ngắn của API key để lưu vào ledger"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def quota_day() -> str:
+    """Ngày quota hiện tại (YYYY-MM-DD theo giờ Pacific)"""
+    return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+
+class TokenBucket:
+    """Token bucket đơn giản: capacity token, refill rate token/giây"""
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Số giây cần chờ để có 1 token (0 nếu có sẵn)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_rate
+
+    def consume(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def drain(self):
+        """Xóa hết token (dùng khi server trả về 429 cho limit theo phút)"""
+        self._refill()
+        self.tokens = 0
+
+
+class QuotaLedger:
+    """Lưu số request đã dùng trong ngày của từng key vào file JSON"""
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = path
+        self.day = quota_day()
+        self.usage = self._load()
+        self.touched = set()  # Key do process này cập nhật (các key khác giữ nguyên giá trị trên file)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('day') == self.day:
+                return {k: int(v) for k, v in data.get('usage', {}).items()}
+        except Exception as e:
+            print(f"   ⚠️ Không đọc được quota ledger {self.path}: {e}")
+        return {}
+
+    def _roll_day(self):
+        today = quota_day()
+        if today != self.day:
+            self.day = today
+            self.usage = {}
+            self.touched = set()
+
+    def used(self, api_key: str) -> int:
+        self._roll_day()
+        return self.usage.get(key_fingerprint(api_key), 0)
+
+    def set_used(self, api_key: str, count: int):
+        self._roll_day()
+        fingerprint = key_fingerprint(api_key)
+        self.usage[fingerprint] = count
+        self.touched.add(fingerprint)
+        self.save()
+
+    def increment(self, api_key: str):
+        self.set_used(api_key, self.used(api_key) + 1)
+
+    def save(self):
+        """Ghi ledger (atomic replace để không hỏng file khi bị kill giữa chừng).
+        Gộp với file hiện tại để các process dùng chung ledger (VD --shard) không ghi đè key của nhau"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            merged = self._load()
+            merged.update({k: v for k, v in self.usage.items() if k in self.touched})
+            self.usage = merged
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'day': self.day, 'usage': merged}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"   ⚠️ Không ghi được quota ledger {self.path}: {e}")
+
+
+class KeyRateLimiter:
+    """Chọn API key còn quota và chờ trước khi vượt limit RPM/RPD (thay cho round-robin mù)"""
+
+    def __init__(self, keys: list, rpm: int = DEFAULT_RPM, rpd: int = DEFAULT_RPD,
+                 ledger: Optional[QuotaLedger] = None):
+        self.keys = list(keys)
+        self.rpm = rpm
+        self.rpd = rpd
+        self.ledger = ledger or QuotaLedger()
+        self.buckets = {key: TokenBucket(rpm, rpm / 60.0) for key in self.keys}
+        self._next_index = 0
+
+    def remaining_today(self, api_key: str) -> int:
+        return max(0, self.rpd - self.ledger.used(api_key))
+
+    def available_keys(self) -> list:
+        """Các key chưa hết quota ngày"""
+        return [k for k in self.keys if self.remaining_today(k) > 0]
+
+    def _consume(self, api_key: str) -> bool:
+        if self.remaining_today(api_key) <= 0 or not self.buckets[api_key].consume():
+            return False
+        self.ledger.increment(api_key)
+        return True
+
+    async def acquire(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Chờ tới khi có key còn token, trả về key đó (None nếu mọi key đều hết quota ngày)"""
+        excluded = set(exclude)
+        while True:
+            candidates = [k for k in self.available_keys() if k not in excluded]
+            if not candidates:
+                return None
+
+            # Round-robin điểm bắt đầu để trải đều tải giữa các key
+            start = self._next_index % len(self.keys)
+            ordered = self.keys[start:] + self.keys[:start]
+            for api_key in ordered:
+                if api_key in candidates and self._consume(api_key):
+                    self._next_index = self.keys.index(api_key) + 1
+                    return api_key
+
+            await asyncio.sleep(min(self.buckets[k].wait_time() for k in candidates))
+
+    async def acquire_key(self, api_key: str) -> bool:
+        """Chờ token cho một key cụ thể (dùng khi retry cùng key). False nếu key hết quota ngày"""
+        while True:
+            if self.remaining_today(api_key) <= 0:
+                return False
+            if self._consume(api_key):
+                return True
+            await asyncio.sleep(self.buckets[api_key].wait_time())
+
+    def report_rate_limited(self, api_key: str, error_message: str):
+        """Cập nhật trạng thái key khi server vẫn trả về 429/quota error"""
+        message = error_message.lower()
+        if 'per day' in message or 'perday' in message or 'daily' in message:
+            # Hết quota ngày: đánh dấu exhausted trong ledger để lần chạy sau bỏ qua
+            self.ledger.set_used(api_key, self.rpd)
+        else:
+            self.buckets[api_key].drain()
+
+    def summary(self) -> str:
+        """Một dòng tóm tắt quota còn lại trong ngày"""
+        parts = [f"...{k[-6:]}: {self.remaining_today(k)}/{self.rpd}" for k in self.keys]
+        return ', '.join(parts)
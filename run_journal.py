@@ -0,0 +1,112 @@
+"""
+Run Journal
+-----------
+Journal append-only (JSONL) trạng thái từng task (question_id, language, type)
+của một lần chạy cache_ai.py, để chạy lại bằng --resume khi script chết giữa chừng:
+
+- inflight: task bắt đầu gọi LLM
+- done:     đã lưu vào cache (hoặc đã có sẵn trong cache)
+- failed:   lỗi API / lỗi ghi cache, kèm lý do
+
+Khi --resume, journal được replay (trạng thái cuối cùng của mỗi task thắng):
+task done được bỏ qua mà không query Supabase, task failed / inflight được chạy lại.
+Mỗi dòng được flush ngay khi ghi; dòng cuối bị cắt dở do crash sẽ được bỏ qua.
+
+Mỗi bộ tham số (exam, range, ngôn ngữ, loại, shard) có một file riêng trong
+CACHE_AI_JOURNAL_DIR (mặc định .cache_ai_runs/).
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+DEFAULT_JOURNAL_DIR = os.getenv('CACHE_AI_JOURNAL_DIR') or '.cache_ai_runs'
+
+
+def journal_path(exam: str, start: int, end: int, languages: list, content_types: list,
+                 suffix: str = '', journal_dir: str = DEFAULT_JOURNAL_DIR) -> str:
+    """suffix: phân biệt journal của các shard (VD 'shard-1-of-4')"""
+    name = f"{exam}_{start}-{end}_{'+'.join(languages)}_{'+'.join(content_types)}"
+    return os.path.join(journal_dir, f"{name}_{suffix}.jsonl" if suffix else f"{name}.jsonl")
+
+
+def task_key(question_id, language: str, content_type: str) -> str:
+    return f"{question_id}|{language}|{content_type}"
+
+
+class RunJournal:
+    """Ghi / replay trạng thái task của một lần chạy"""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done = set()
+        self.failed = {}  # key -> reason
+        self.inflight = set()
+        self.corrupt_lines = 0
+
+        if resume and os.path.exists(path):
+            self._replay()
+        elif os.path.exists(path):
+            # Lần chạy mới: giữ journal cũ làm bản lưu, không replay
+            os.replace(path, f"{path}.prev")
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key, state = entry['key'], entry['state']
+                except (ValueError, KeyError, TypeError):
+                    self.corrupt_lines += 1
+                    continue
+                self._apply(key, state, entry.get('reason'))
+
+    def _apply(self, key: str, state: str, reason: Optional[str] = None):
+        self.inflight.discard(key)
+        self.failed.pop(key, None)
+        self.done.discard(key)
+        if state == 'done':
+            self.done.add(key)
+        elif state == 'failed':
+            self.failed[key] = reason or 'unknown'
+        else:
+            self.inflight.add(key)
+
+    def _write(self, key: str, state: str, reason: Optional[str] = None):
+        self._apply(key, state, reason)
+        if self._file is None:
+            return
+        entry = {'t': round(time.time(), 3), 'key': key, 'state': state}
+        if reason:
+            entry['reason'] = reason
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def start(self, key: str):
+        self._write(key, 'inflight')
+
+    def mark_done(self, key: str, reason: Optional[str] = None):
+        self._write(key, 'done', reason)
+
+    def mark_failed(self, key: str, reason: str):
+        self._write(key, 'failed', reason)
+
+    def summary(self) -> str:
+        line = f"{len(self.done)} done, {len(self.failed)} failed, {len(self.inflight)} in-flight"
+        if self.corrupt_lines:
+            line += f" ({self.corrupt_lines} dòng hỏng bị bỏ qua)"
+        return line
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
@@ -0,0 +1,190 @@
+"""
+Run Metrics
+-----------
+Metrics theo từng lần gọi cho cache builder (--metrics), thay cho việc đọc log emoji:
+
+- JSONL: mỗi dòng là một lần gọi của một phase
+    fetch        lấy một trang câu hỏi
+    cache_check  prefetch cache của một trang / GET cache của một task
+    llm          một lần generate (provider, key, tokens, retries, cache hit local)
+    save         một lần upsert batch vào ai_cache / pmp_ai_cache
+  gồm latency_ms, status, provider, model, key (6 ký tự cuối), prompt/completion tokens,
+  retries, rows và task (question_id/language/type) nếu có.
+- Prometheus textfile (node_exporter textfile collector): histogram latency theo
+  phase / provider, counter số lần gọi theo phase / provider / key / status, tokens, rows.
+  File được ghi lại (atomic) mỗi PROM_WRITE_INTERVAL giây và khi kết thúc.
+
+Recorder luôn tồn tại nhưng không làm gì cho tới khi open(), nên provider / writer
+có thể gọi record() mà không cần kiểm tra --metrics.
+
+Cấu hình qua environment:
+    CACHE_AI_METRICS_DIR=.cache_ai_metrics   # Thư mục chứa file JSONL
+    CACHE_AI_PROM_FILE=<dir>/cache_ai.prom   # Đường dẫn Prometheus textfile
+"""
+
+import contextvars
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Optional
+
+DEFAULT_METRICS_DIR = os.getenv('CACHE_AI_METRICS_DIR') or '.cache_ai_metrics'
+DEFAULT_PROM_FILE = os.getenv('CACHE_AI_PROM_FILE') or os.path.join(DEFAULT_METRICS_DIR, 'cache_ai.prom')
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+PROM_WRITE_INTERVAL = 10.0
+
+# Task đang xử lý (question_id, language, type), gắn vào các record trong cùng asyncio task
+current_task = contextvars.ContextVar('cache_ai_task', default=None)
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRecorder:
+    """Ghi record JSONL + tổng hợp cho Prometheus textfile"""
+
+    def __init__(self):
+        self.enabled = False
+        self.jsonl_path = None
+        self.prom_path = None
+        self.started_at = time.time()
+        self._file = None
+        self._last_prom_write = 0.0
+        self.const_labels = {}  # Label gắn vào mọi series (VD exam, shard) để nhiều file .prom không trùng nhau
+        self.latency = defaultdict(Histogram)  # (phase, provider) -> Histogram
+        self.calls = defaultdict(int)  # (phase, provider, key, status) -> count
+        self.tokens = defaultdict(int)  # (provider, kind) -> count
+        self.rows = defaultdict(int)  # (phase, status) -> count
+        self.retries = defaultdict(int)  # (phase, provider) -> count
+
+    def open(self, jsonl_path: str, prom_path: str = DEFAULT_PROM_FILE, labels: Optional[dict] = None):
+        self.const_labels = dict(labels or {})
+        for path in (jsonl_path, prom_path):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.started_at = time.time()
+        self._file = open(jsonl_path, 'a', encoding='utf-8')
+        self.enabled = True
+
+    def record(self, phase: str, status: str, seconds: float, provider: str = '', key: str = '',
+               prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+               retries: int = 0, rows: Optional[int] = None, **extra):
+        if not self.enabled:
+            return
+        entry = {
+            'ts': round(time.time(), 3), 'phase': phase, 'status': status,
+            'latency_ms': round(seconds * 1000, 1), 'provider': provider or None, 'key': key or None,
+            'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'retries': retries, 'rows': rows
+        }
+        task = current_task.get()
+        if task is not None:
+            entry['question_id'], entry['language'], entry['type'] = task
+        entry.update(extra)
+        self._file.write(json.dumps({k: v for k, v in entry.items() if v is not None}, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+        self.latency[(phase, provider)].observe(seconds)
+        self.calls[(phase, provider, key, status)] += 1
+        self.retries[(phase, provider)] += retries
+        if prompt_tokens:
+            self.tokens[(provider, 'prompt')] += prompt_tokens
+        if completion_tokens:
+            self.tokens[(provider, 'completion')] += completion_tokens
+        if rows:
+            self.rows[(phase, status)] += rows
+
+        if time.monotonic() - self._last_prom_write >= PROM_WRITE_INTERVAL:
+            self.write_prometheus()
+
+    def _labels(self, **labels) -> str:
+        return _labels(**self.const_labels, **labels)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            '# HELP cache_ai_phase_duration_seconds Latency của từng lần gọi theo phase / provider',
+            '# TYPE cache_ai_phase_duration_seconds histogram'
+        ]
+        for (phase, provider), histogram in sorted(self.latency.items()):
+            labels = self._labels(phase=phase, provider=provider)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'cache_ai_phase_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'cache_ai_phase_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'cache_ai_phase_duration_seconds_sum{{{labels}}} {histogram.total:.6f}')
+            lines.append(f'cache_ai_phase_duration_seconds_count{{{labels}}} {histogram.count}')
+
+        lines += ['# HELP cache_ai_calls_total Số lần gọi theo phase / provider / key / status',
+                  '# TYPE cache_ai_calls_total counter']
+        for (phase, provider, key, status), count in sorted(self.calls.items()):
+            labels = self._labels(phase=phase, provider=provider, key=key, status=status)
+            lines.append(f'cache_ai_calls_total{{{labels}}} {count}')
+
+        lines += ['# HELP cache_ai_retries_total Số lần retry theo phase / provider',
+                  '# TYPE cache_ai_retries_total counter']
+        for (phase, provider), count in sorted(self.retries.items()):
+            lines.append(f'cache_ai_retries_total{{{self._labels(phase=phase, provider=provider)}}} {count}')
+
+        lines += ['# HELP cache_ai_tokens_total Tokens đã dùng theo provider (prompt / completion)',
+                  '# TYPE cache_ai_tokens_total counter']
+        for (provider, kind), count in sorted(self.tokens.items()):
+            lines.append(f'cache_ai_tokens_total{{{self._labels(provider=provider, kind=kind)}}} {count}')
+
+        lines += ['# HELP cache_ai_rows_total Số rows đã xử lý theo phase / status',
+                  '# TYPE cache_ai_rows_total counter']
+        for (phase, status), count in sorted(self.rows.items()):
+            lines.append(f'cache_ai_rows_total{{{self._labels(phase=phase, status=status)}}} {count}')
+
+        lines += ['# HELP cache_ai_run_start_timestamp_seconds Thời điểm bắt đầu lần chạy',
+                  '# TYPE cache_ai_run_start_timestamp_seconds gauge',
+                  f'cache_ai_run_start_timestamp_seconds{{{self._labels()}}} {self.started_at:.3f}',
+                  '# HELP cache_ai_last_update_timestamp_seconds Thời điểm ghi file này',
+                  '# TYPE cache_ai_last_update_timestamp_seconds gauge',
+                  f'cache_ai_last_update_timestamp_seconds{{{self._labels()}}} {time.time():.3f}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        if not self.enabled:
+            return
+        self._last_prom_write = time.monotonic()
+        tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.prom_path)
+        except OSError as e:
+            print(f"   ⚠️ Không ghi được Prometheus textfile {self.prom_path}: {e}")
+
+    def summary(self) -> str:
+        parts = []
+        for (phase, provider), histogram in sorted(self.latency.items()):
+            name = f"{phase}/{provider}" if provider else phase
+            parts.append(f"{name}: {histogram.count} lần, TB {histogram.total / histogram.count * 1000:.0f}ms")
+        return 'Metrics: ' + ('; '.join(parts) or 'chưa có dữ liệu')
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.write_prometheus()
+        self._file.close()
+        self._file = None
+        self.enabled = False
@@ -0,0 +1,94 @@
+"""
+Sharding
+--------
+Chia một lần build cache cho nhiều process / máy chạy song song không chồng lấn (--shard i/n):
+
+- Task (question_id, language, type) thuộc shard sha1(key) % n + 1, cố định giữa các máy
+  và các lần chạy (không dùng hash() của Python vì bị random theo process).
+- GEMINI_API_KEYS được chia round-robin: shard i dùng keys[i-1::n], nên các shard không
+  tranh quota của cùng một key. Provider một key (OpenAI, HF) dùng chung key cho mọi shard.
+- Mỗi shard ghi stats ra <journal>.stats.json, gộp lại bằng merge_shard_stats.py.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import time
+from typing import Optional
+
+
+def parse_shard(value: str) -> tuple:
+    """'2/4' -> (2, 4). Raise ValueError nếu sai format hoặc i không nằm trong 1..n"""
+    index, count = (int(part) for part in value.split('/'))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(value)
+    return index, count
+
+
+def shard_label(shard: tuple) -> str:
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+
+def shard_of(question_id, language: str, content_type: str, count: int) -> int:
+    """Shard (1..count) của một task"""
+    digest = hashlib.sha1(f"{question_id}|{language}|{content_type}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def in_shard(question_id, language: str, content_type: str, shard: Optional[tuple]) -> bool:
+    return shard is None or shard_of(question_id, language, content_type, shard[1]) == shard[0]
+
+
+def shard_slice(items: list, shard: Optional[tuple]) -> list:
+    """Phần của shard trong danh sách (round-robin, VD keys)"""
+    if shard is None:
+        return list(items)
+    return list(items)[shard[0] - 1::shard[1]]
+
+
+def shard_stats_path(journal_file: str) -> str:
+    return os.path.splitext(journal_file)[0] + '.stats.json'
+
+
+def write_shard_stats(path: str, run: dict, shard: Optional[tuple], stats: dict, elapsed: float,
+                      providers: list):
+    """Ghi stats của một shard (run = exam / range / languages / types) để merge sau"""
+    data = {
+        'run': run,
+        'shard': list(shard) if shard else [1, 1],
+        'host': socket.gethostname(),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'elapsed': round(elapsed, 1),
+        'stats': stats,
+        'providers': [p.status() for p in providers]
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def merge_shard_stats(items: list) -> dict:
+    """Gộp stats của các shard cùng một run: cộng success / cached / failed / by_provider,
+    elapsed = shard chậm nhất, missing = các shard chưa có stats"""
+    merged = {'success': 0, 'cached': 0, 'failed': 0, 'deduped': 0, 'by_provider': {}}
+    seen = set()
+    count = None
+    for item in items:
+        index, count = item['shard']
+        if index in seen:
+            raise ValueError(f"shard {index}/{count} bị trùng")
+        seen.add(index)
+        for field in ('success', 'cached', 'failed', 'deduped'):
+            merged[field] += item['stats'].get(field, 0)
+        for name, value in item['stats'].get('by_provider', {}).items():
+            merged['by_provider'][name] = merged['by_provider'].get(name, 0) + value
+    return {
+        'stats': merged,
+        'shards': sorted(seen),
+        'missing': sorted(set(range(1, (count or 0) + 1)) - seen),
+        'elapsed': max((item['elapsed'] for item in items), default=0),
+        'hosts': sorted({item['host'] for item in items})
+    }
@@ -0,0 +1,128 @@
+"""
+Streaming Output Guard
+----------------------
+Dùng cho chế độ --stream: kiểm tra output ngay khi từng chunk về và dừng sớm
+khi output rõ ràng sai format, thay vì chờ hết max_tokens rồi mới biết:
+
+- Mở đầu bằng lời chào / giới thiệu ("Chào bạn, là một chuyên gia...", "Sure! Here is...")
+  dù prompt đã yêu cầu vào thẳng nội dung.
+- Có ký tự Trung / Nhật / Hàn (CJK).
+- Sau HEADING_WINDOW ký tự đầu vẫn chưa có heading markdown (mọi prompt đều bắt đầu bằng ##).
+
+Lời chào chỉ được tính khi đã có ít nhất một ký tự sau nó (hoặc khi stream kết thúc, qua
+StreamCollector.finish): chunk có thể cắt giữa từ, "## Hi" + "ểu câu hỏi" không phải lời chào.
+
+Đồng thời đo time-to-first-token (TTFT) và tokens/giây cho từng provider.
+Số token là ước lượng (~4 ký tự / token) vì không phải provider nào cũng trả usage khi stream.
+"""
+
+import re
+import time
+from collections import deque
+from typing import Optional
+
+HEADING_WINDOW = 300
+CHARS_PER_TOKEN = 4
+
+GREETING_PATTERN = re.compile(
+    r"^\W*(xin chào|chào bạn|chào các bạn|chào|hello|hi\b|hey\b|sure\b|certainly|of course|absolutely|"
+    r"great question|là một chuyên gia|với vai trò|as an? (expert|aws|pmp)|dưới đây là|here is|here's)",
+    re.IGNORECASE
+)
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')
+
+
+class MalformedOutput(Exception):
+    """Output sai format, stream bị dừng sớm"""
+
+
+def check_prefix(prefix: str, final: bool = False) -> Optional[str]:
+    """Lý do output sai format dựa trên phần đầu (None nếu chưa thấy vấn đề).
+
+    final=False: lời chào khớp tới đúng cuối prefix chưa tính (\\b ở cuối chuỗi luôn khớp,
+    chunk sau có thể nối tiếp cùng một từ), chờ thêm ký tự.
+    """
+    stripped = prefix.lstrip()
+    greeting = GREETING_PATTERN.match(stripped)
+    if greeting and (final or greeting.end() < len(stripped)):
+        return f"mở đầu bằng lời chào: {stripped[:40]!r}"
+    if len(stripped) >= HEADING_WINDOW and not any(line.lstrip().startswith('#') for line in stripped.splitlines()):
+        return f"không có heading markdown trong {HEADING_WINDOW} ký tự đầu"
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class StreamCollector:
+    """Gom các chunk của một response, raise MalformedOutput ngay khi phát hiện sai format"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        """started_at: time.monotonic() lúc gửi request, để TTFT gồm cả thời gian request ở mọi provider
+        (SDK OpenAI / HF chỉ trả stream sau khi server đã nhận request, Gemini gửi request khi đọc chunk đầu)"""
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.first_token_at = None
+        self.parts = []
+        self.prefix = ''
+
+    def feed(self, piece: Optional[str]):
+        if not piece:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.parts.append(piece)
+
+        if CJK_PATTERN.search(piece):
+            raise MalformedOutput(f"có ký tự CJK: {CJK_PATTERN.search(piece).group()!r}")
+        if len(self.prefix) < HEADING_WINDOW:
+            self.prefix += piece
+            problem = check_prefix(self.prefix)
+            if problem:
+                raise MalformedOutput(problem)
+
+    def finish(self):
+        """Gọi khi stream kết thúc: kiểm tra lời chào còn chờ ký tự tiếp theo"""
+        problem = check_prefix(self.prefix, final=True)
+        if problem:
+            raise MalformedOutput(problem)
+
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        elapsed = time.monotonic() - self.first_token_at
+        return estimate_tokens(self.text()) / elapsed if elapsed > 0 else None
+
+
+class StreamStats:
+    """TTFT / tokens/giây / số lần dừng sớm của một provider"""
+
+    def __init__(self, window: int = 500):
+        self.ttft = deque(maxlen=window)
+        self.tokens_per_second = deque(maxlen=window)
+        self.completed = 0
+        self.aborted = 0
+
+    def record(self, collector: StreamCollector):
+        self.completed += 1
+        if collector.ttft() is not None:
+            self.ttft.append(collector.ttft())
+        if collector.tokens_per_second() is not None:
+            self.tokens_per_second.append(collector.tokens_per_second())
+
+    def summary(self) -> str:
+        if not self.completed and not self.aborted:
+            return 'stream: chưa có dữ liệu'
+        parts = [f"{self.completed} streams, {self.aborted} dừng sớm"]
+        if self.ttft:
+            ordered = sorted(self.ttft)
+            parts.append(f"TTFT p50 {ordered[len(ordered) // 2]:.2f}s / p90 {ordered[int(len(ordered) * 0.9)]:.2f}s")
+        if self.tokens_per_second:
+            parts.append(f"~{sum(self.tokens_per_second) / len(self.tokens_per_second):.0f} tokens/s")
+        return 'stream: ' + ', '.join(parts)
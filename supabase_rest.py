@@ -0,0 +1,227 @@
+"""
+Supabase REST Client
+--------------------
+Client PostgREST dùng chung cho các cache builder (cache_ai.py, cache_ai_openai.py,
+cache_ai_fast.py).
+
+- Một httpx client duy nhất cho cả lần chạy: keep-alive connection pool, không
+  phải TLS handshake lại cho mỗi lần check cache / save.
+- HTTP/2 multiplexing (tùy chọn): SUPABASE_HTTP2=1, cần `pip install httpx[http2]`.
+- Client async (AsyncSupabaseREST) dùng trong asyncio worker pool của cache_ai.py.
+
+Cấu hình qua environment:
+    SUPABASE_HTTP2=1              # Bật HTTP/2
+    SUPABASE_TIMEOUT=30           # Timeout (giây) cho read/write/pool
+    SUPABASE_MAX_CONNECTIONS=20   # Số connection tối đa trong pool
+"""
+
+import os
+from typing import Optional
+
+import httpx
+
+DEFAULT_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT') or 30)
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS') or 20)
+
+# Supabase giới hạn mặc định 1000 rows/request; chia danh sách id để URL không quá dài
+PAGE_SIZE = 1000
+IN_FILTER_CHUNK = 300
+CACHE_KEY_COLUMNS = 'question_id,language,type'
+UPSERT_HEADERS = {'Prefer': 'resolution=merge-duplicates,return=minimal'}
+
+# Fetch câu hỏi theo trang (keyset trên id_num, xem add_question_id_num.sql)
+QUESTION_PAGE_SIZE = 100
+QUESTION_COLUMNS = 'id,question,options,correct_answer'
+
+
+def http2_enabled() -> bool:
+    """SUPABASE_HTTP2=1 và package h2 đã được cài"""
+    if (os.getenv('SUPABASE_HTTP2') or '').lower() not in ('1', 'true', 'yes'):
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("⚠️ SUPABASE_HTTP2=1 nhưng chưa cài h2 (pip install httpx[http2]), dùng HTTP/1.1")
+        return False
+
+
+def build_headers(supabase_key: str) -> dict:
+    """Headers chuẩn cho Supabase REST API"""
+    return {
+        'apikey': supabase_key,
+        'Authorization': f'Bearer {supabase_key}',
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
+    }
+
+
+def in_filter(values) -> str:
+    """PostgREST filter `in.(...)`, quote từng giá trị"""
+    quoted = ','.join('"{}"'.format(str(v).replace('"', '\\"')) for v in values)
+    return f'in.({quoted})'
+
+
+def cache_key_queries(question_ids: list, languages: Optional[list] = None,
+                      content_types: Optional[list] = None, extra_columns: tuple = ()) -> list:
+    """Params cho các query lấy (question_id, language, type) của ai_cache theo từng nhóm id"""
+    select = ','.join((CACHE_KEY_COLUMNS,) + tuple(extra_columns))
+    base = {'select': select, 'order': CACHE_KEY_COLUMNS}
+    if languages:
+        base['language'] = in_filter(languages)
+    if content_types:
+        base['type'] = in_filter(content_types)
+
+    ids = list(dict.fromkeys(str(q) for q in question_ids))
+    return [
+        {**base, 'question_id': in_filter(ids[i:i + IN_FILTER_CHUNK])}
+        for i in range(0, len(ids), IN_FILTER_CHUNK)
+    ]
+
+
+def question_number(question_id) -> int:
+    """Phần số của id câu hỏi (VD: "q12" -> 12), giống cột id_num trên server"""
+    num_str = ''.join(filter(str.isdigit, str(question_id)))
+    return int(num_str) if num_str else 0
+
+
+def question_page_params(start: int, end: int, columns: str, page_size: int,
+                         after: Optional[tuple] = None) -> dict:
+    """Params PostgREST cho một trang câu hỏi trong range [start, end], sau key `after` (id_num, id)"""
+    conditions = [f'id_num.gte.{start}', f'id_num.lte.{end}']
+    if after:
+        last_num, last_id = after
+        quoted_id = '"{}"'.format(str(last_id).replace('"', '\\"'))
+        conditions.append(f'or(id_num.gt.{last_num},and(id_num.eq.{last_num},id.gt.{quoted_id}))')
+    return {
+        'select': f'{columns},id_num',
+        'and': f"({','.join(conditions)})",
+        'order': 'id_num.asc,id.asc',
+        'limit': page_size
+    }
+
+
+def _missing_id_num(response) -> bool:
+    """Server chưa có cột id_num (chưa chạy add_question_id_num.sql)"""
+    if response.status_code != 400:
+        return False
+    try:
+        return response.json().get('code') == '42703'
+    except Exception:
+        return False
+
+
+def _local_range_pages(rows: list, start: int, end: int, page_size: int) -> list:
+    """Fallback: lọc range và sort ở client như cách cũ, chia thành các trang"""
+    print("⚠️ Cột id_num chưa tồn tại (xem add_question_id_num.sql), lọc range ở client")
+    rows = sorted(rows, key=lambda q: question_number(q.get('id', '')))
+    rows = [q for q in rows if start <= question_number(q.get('id', '')) <= end]
+    return [rows[i:i + page_size] for i in range(0, len(rows), page_size)]
+
+
+def _client_options(supabase_url: str, supabase_key: str, http2: Optional[bool],
+                    timeout: float, max_connections: int) -> dict:
+    return {
+        'base_url': f"{supabase_url.rstrip('/')}/rest/v1",
+        'headers': build_headers(supabase_key),
+        'http2': http2_enabled() if http2 is None else http2,
+        'timeout': httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+        'limits': httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0
+        )
+    }
+
+
+class AsyncSupabaseREST:
+    """Async PostgREST client với connection pool dùng chung (dùng trong asyncio worker pool)"""
+
+    def __init__(self, supabase_url: str, supabase_key: str, http2: Optional[bool] = None,
+                 timeout: float = DEFAULT_TIMEOUT, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        self.client = httpx.AsyncClient(**_client_options(supabase_url, supabase_key, http2, timeout, max_connections))
+
+    async def get(self, table: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.client.get(f"/{table}", params=params, headers=headers)
+
+    async def post(self, table: str, json, params: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.client.post(f"/{table}", json=json, params=params, headers=headers)
+
+    async def delete(self, table: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.client.delete(f"/{table}", params=params, headers=headers)
+
+    async def iter_question_pages(self, table: str, start: int, end: int, columns: str = QUESTION_COLUMNS,
+                                  page_size: int = QUESTION_PAGE_SIZE):
+        """Async generator trả về từng trang câu hỏi trong range, lọc + keyset pagination trên server"""
+        after = None
+        while True:
+            response = await self.get(table, params=question_page_params(start, end, columns, page_size, after))
+            if after is None and _missing_id_num(response):
+                response = await self.get(table, params={'select': columns})
+                response.raise_for_status()
+                for page in _local_range_pages(response.json(), start, end, page_size):
+                    yield page
+                return
+            response.raise_for_status()
+
+            rows = response.json()
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            after = (rows[-1]['id_num'], rows[-1]['id'])
+
+    async def upsert(self, table: str, rows: list, on_conflict: str) -> httpx.Response:
+        """Bulk upsert (INSERT ... ON CONFLICT DO UPDATE) trong một request"""
+        return await self.post(table, json=rows, params={'on_conflict': on_conflict}, headers=UPSERT_HEADERS)
+
+    async def fetch_cache_index(self, table: str, question_ids: list, languages: Optional[list] = None,
+                                content_types: Optional[list] = None, extra_columns: tuple = ()) -> Optional[dict]:
+        """Lấy {(question_id, language, type): row} đã có trong cache (chỉ key + extra_columns, không tải content).
+        Trả về None nếu query lỗi để caller fallback về check từng item."""
+        index = {}
+        try:
+            for params in cache_key_queries(question_ids, languages, content_types, extra_columns):
+                offset = 0
+                while True:
+                    response = await self.get(table, params={**params, 'limit': PAGE_SIZE, 'offset': offset})
+                    response.raise_for_status()
+                    rows = response.json()
+                    index.update(((r['question_id'], r['language'], r['type']), r) for r in rows)
+                    if len(rows) < PAGE_SIZE:
+                        break
+                    offset += PAGE_SIZE
+        except Exception as e:
+            print(f"⚠️ Cache prefetch error ({table}): {e}")
+            return None
+        return index
+
+    async def fetch_question_popularity(self, view: str) -> Optional[dict]:
+        """{question_id: (attempts, incorrect_rate)} từ view popularity, None nếu query lỗi (VD chưa tạo view)"""
+        popularity = {}
+        offset = 0
+        try:
+            while True:
+                response = await self.get(view, params={
+                    'select': 'question_id,attempts,incorrect_rate', 'order': 'question_id',
+                    'limit': PAGE_SIZE, 'offset': offset
+                })
+                response.raise_for_status()
+                rows = response.json()
+                popularity.update((str(r['question_id']), (int(r['attempts']), float(r['incorrect_rate']))) for r in rows)
+                if len(rows) < PAGE_SIZE:
+                    return popularity
+                offset += PAGE_SIZE
+        except Exception as e:
+            print(f"⚠️ Popularity fetch error ({view}): {e}")
+            return None
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()